@@ -0,0 +1,137 @@
+import sys
+import json
+import time
+import argparse
+
+from src.codec import JsonCodec, OrjsonCodec, orjson
+
+
+def build_synthetic_post(index: int) -> dict:
+    return {
+        "backstagePostThreadRenderer": {
+            "post": {
+                "backstagePostRenderer": {
+                    "postId": f"Ugkx{index:020d}",
+                    "authorText": {"runs": [{"text": "Ünïcödé Äuthor ✨"}]},
+                    "contentText": {
+                        "runs": [
+                            {"text": "Some text with \"quotes\", \\ and emoji 🎉\n"},
+                            {
+                                "text": "a link",
+                                "navigationEndpoint": {
+                                    "commandMetadata": {
+                                        "webCommandMetadata": {"url": "/watch?v=abc"}
+                                    }
+                                },
+                            },
+                        ]
+                    },
+                    "voteCount": {"simpleText": "1.2K"},
+                    "backstageAttachment": {
+                        "postMultiImageRenderer": {
+                            "images": [
+                                {
+                                    "backstageImageRenderer": {
+                                        "image": {
+                                            "thumbnails": [
+                                                {"url": f"https://yt3.ggpht.com/{index}-{i}=s{size}", "width": size}
+                                                for size in [288, 400, 640, 1200]
+                                            ]
+                                        }
+                                    }
+                                }
+                                for i in range(4)
+                            ]
+                        }
+                    },
+                    "pollStats": {"total": 2**40, "ratio": 0.1 + 0.2, "open": True, "closed": None},
+                }
+            }
+        }
+    }
+
+
+def check_equivalence(codecs: list, documents: list[dict]) -> bool:
+    # every codec has to read what every other codec wrote, in both formats
+    equivalent = True
+
+    for document in documents:
+        for writer in codecs:
+            for pretty in [True, False]:
+                encoded = writer.dumps(document, pretty=pretty)
+
+                for reader in codecs:
+                    if reader.loads(encoded) != document:
+                        print(f"  mismatch: {writer.name} (pretty={pretty}) -> {reader.name}")
+                        equivalent = False
+
+    return equivalent
+
+
+def benchmark(codec, documents: list[dict], repeat: int):
+    encoded = [codec.dumps(document) for document in documents]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for document in documents:
+            codec.dumps(document)
+    pretty_time = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for document in documents:
+            codec.dumps(document, pretty=False)
+    compact_time = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in encoded:
+            codec.loads(data)
+    decode_time = (time.perf_counter() - start) / repeat
+
+    pretty_bytes = sum(len(data) for data in encoded)
+    compact_bytes = sum(len(codec.dumps(document, pretty=False)) for document in documents)
+
+    print(
+        f"  {codec.name:<7} encode {pretty_time * 1000:8.2f} ms - compact {compact_time * 1000:8.2f} ms - decode {decode_time * 1000:8.2f} ms"
+        f" - {pretty_bytes} bytes pretty / {compact_bytes} bytes compact"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Checks and compares the available JSON codecs"
+    )
+    parser.add_argument("files", nargs="*", help="saved post.json files")
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args()
+
+    documents: list[dict] = list()
+    for file in args.files:
+        with open(file, "rb") as f:
+            documents.append(json.loads(f.read()))
+
+    if not documents:
+        documents = [build_synthetic_post(index=index) for index in range(args.posts)]
+
+    codecs = [JsonCodec()]
+    if orjson:
+        codecs.append(OrjsonCodec())
+    else:
+        print("orjson is not installed, only the json codec is checked")
+
+    print(f"{len(documents)} documents")
+
+    equivalent = check_equivalence(codecs=codecs, documents=documents)
+    print(f"  equivalent output: {equivalent}")
+
+    for codec in codecs:
+        benchmark(codec=codec, documents=documents, repeat=args.repeat)
+
+    return 0 if equivalent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+import urllib.request
+import multiprocessing
+
+import main
+from src.transport import Transport
+from src.content_exporter import OUTPUT_FORMATS
+from src.ratelimit import RetryPolicy
+from src.metrics import Metrics
+from src.response_cache import ResponseCache
+from benchmarks.innertube_server import CHANNEL_PATH, get_post_id, run_server
+
+
+def get_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_server_stats(origin: str) -> dict:
+    with urllib.request.urlopen(f"{origin}/__stats") as response:
+        return json.loads(response.read())
+
+
+def get_peak_rss() -> int:
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def get_host_limits(transport: Transport) -> dict[str, float]:
+    # the adaptive per-host limits at the end of the run
+    with transport.sessions_lock:
+        return {
+            host: round(limiter.limit, 2)
+            for host, limiter in transport.host_limiters.items()
+        }
+
+
+def run_export(
+    origin: str, output_path: str, metrics: Metrics, args
+) -> tuple[int, dict[str, int], dict[str, float]]:
+    response_cache = None
+    if args.cache_dir:
+        response_cache = ResponseCache(
+            cache_dir=args.cache_dir, ttl=args.cache_ttl, replay=args.replay
+        )
+
+    transport = Transport(
+        pool_maxsize=args.pool_size,
+        retry_policy=RetryPolicy(max_retries=args.max_retries),
+        origin=origin,
+        response_cache=response_cache,
+        metrics=metrics,
+    )
+
+    post_ids = None
+    url = f"{origin}{CHANNEL_PATH}"
+
+    if args.mode == "ids":
+        post_ids = [get_post_id(number) for number in range(1, args.posts + 1)]
+        url = None
+
+    try:
+        exported_posts = main.export_posts(
+            url=url,
+            cookies=dict(),
+            output_path=output_path,
+            archive_file=os.path.join(output_path, "archive.json"),
+            post_ids=post_ids,
+            archive_journal=args.archive_journal,
+            stream=args.stream,
+            max_downloads=args.max_downloads,
+            max_host_downloads=args.max_host_downloads,
+            post_workers=args.post_workers,
+            parse_workers=args.parse_workers,
+            transport=transport,
+            compact_json=args.compact_json,
+            media_store=args.media_store,
+            output_format=args.output_format,
+        )
+
+        return exported_posts, transport.stats.as_dict(), get_host_limits(transport=transport)
+    finally:
+        transport.close()
+
+        if response_cache:
+            response_cache.close()
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(
+        description="Runs main.export_posts end to end against a local InnerTube stand-in"
+    )
+    parser.add_argument("--mode", choices=["channel", "ids"], default="channel")
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--images-per-post", type=int, default=2)
+    parser.add_argument("--image-size", type=int, default=64 * 1024)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per request")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--archive-journal", action="store_true")
+    parser.add_argument("--compact-json", action="store_true")
+    parser.add_argument("--media-store", action="store_true")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="directories")
+    parser.add_argument("--pool-size", type=int, default=16)
+    parser.add_argument("--max-downloads", type=int, default=8)
+    parser.add_argument("--max-host-downloads", type=int, default=4)
+    parser.add_argument("--post-workers", type=int, default=1)
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0, help="share of requests the server answers with 429"
+    )
+    parser.add_argument(
+        "--unavailable-rate", type=float, default=0, help="share of requests the server answers with 503"
+    )
+    parser.add_argument(
+        "--retry-after", type=float, default=1, help="Retry-After seconds of the injected errors"
+    )
+    parser.add_argument(
+        "--port", type=int, default=0, help="fixed server port, required to replay a recorded cache"
+    )
+    parser.add_argument("--cache-dir", help="record the crawl responses in this response cache")
+    parser.add_argument("--cache-ttl", type=float, default=0)
+    parser.add_argument("--replay", action="store_true", help="crawl purely from '--cache-dir'")
+    parser.add_argument("--output-dir", help="keep the exported posts in this directory")
+    parser.add_argument("--results", help="append the results as a JSON line to this file")
+    parser.add_argument("-v", "--verbose", action="store_true")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level="INFO" if args.verbose else "WARNING",
+        format="%(asctime)s %(levelname)s: %(message)s",
+    )
+
+    # the server runs in its own process so it neither competes for the GIL
+    # nor shows up in the peak RSS of the export
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+
+    server = context.Process(
+        target=run_server,
+        kwargs={
+            "ready": ready,
+            "latency": args.latency,
+            "port": args.port,
+            "throttle_rate": args.throttle_rate,
+            "unavailable_rate": args.unavailable_rate,
+            "retry_after": args.retry_after,
+            "posts": args.posts,
+            "page_size": args.page_size,
+            "images_per_post": args.images_per_post,
+            "image_size": args.image_size,
+        },
+        daemon=True,
+    )
+    server.start()
+
+    origin = ready.get(timeout=30)
+
+    metrics = Metrics()
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_path = args.output_dir if args.output_dir else temp_dir
+            os.makedirs(output_path, exist_ok=True)
+
+            start = time.perf_counter()
+            exported_posts, request_stats, host_limits = run_export(
+                origin=origin, output_path=output_path, metrics=metrics, args=args
+            )
+            duration = time.perf_counter() - start
+
+        server_stats = get_server_stats(origin=origin)
+    finally:
+        server.terminate()
+        server.join()
+
+    report = metrics.to_dict()
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": get_revision(),
+        "config": {
+            name: value
+            for name, value in vars(args).items()
+            if name not in ["output_dir", "results", "verbose", "cache_dir"]
+        },
+        "exported_posts": exported_posts,
+        "duration": round(duration, 4),
+        "posts_per_second": round(exported_posts / duration, 2) if duration else None,
+        "requests": server_stats["total_requests"],
+        "requests_by_kind": server_stats["requests"],
+        "requests_per_post": (
+            round(server_stats["total_requests"] / exported_posts, 3) if exported_posts else None
+        ),
+        "injected_errors": server_stats["injected_errors"],
+        "retries": request_stats["retries"],
+        "throttled": request_stats["throttled"],
+        "host_limits": host_limits,
+        "bytes_transferred": server_stats["bytes_sent"],
+        "peak_rss": get_peak_rss(),
+        "phases": report["phases"],
+        "counters": report["counters"],
+    }
+
+    print(json.dumps(results, indent=4))
+
+    if args.results:
+        with open(args.results, "a", encoding="utf-8") as f:
+            f.write(json.dumps(results) + "\n")
+
+    return 0 if exported_posts == args.posts else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main_benchmark())
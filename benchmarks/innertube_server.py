@@ -0,0 +1,423 @@
+import sys
+import json
+import time
+import random
+import argparse
+import urllib.parse
+from threading import Lock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# A local stand-in for the parts of YouTube the archiver talks to:
+#
+#   GET  /@bench/community          channel page with ytInitialData and ytcfg
+#   POST /youtubei/v1/browse        first page of posts / continuation pages
+#   GET  /post/<id>                 single post page
+#   GET  /<image>=s<size>           post images (served for any size)
+#   GET  /vi/<id>/hqdefault.jpg     video thumbnails
+#   GET  /__stats                   request and byte counters as JSON
+#
+# Posts are generated from their index, page 0 holds the newest posts like
+# the real community tab. A share of the requests can be answered with 429 or
+# 503 and a Retry-After header, to exercise the retries and adaptive limits.
+
+CHANNEL_PATH = "/@bench/community"
+API_KEY = "bench-api-key"
+BROWSE_ID = "UCbenchmark000000000000"
+BROWSE_PARAMS = "Egljb21tdW5pdHk%3D"
+
+
+def get_post_id(index: int) -> str:
+    return f"Ugkx{index:020d}"
+
+
+def get_post_index(post_id: str) -> int:
+    return int(post_id[4:])
+
+
+class SyntheticChannel:
+    def __init__(
+        self,
+        posts: int = 1000,
+        page_size: int = 10,
+        images_per_post: int = 2,
+        image_size: int = 64 * 1024,
+    ) -> None:
+        self.posts = posts
+        self.page_size = page_size
+        self.images_per_post = images_per_post
+        self.image_size = image_size
+
+        # every image has the same content, the size is what matters
+        self.image = (b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * (image_size // 256 + 1))[:image_size]
+
+    def build_post(self, index: int, image_origin: str) -> dict:
+        # newest post first: page 0 starts with the highest index
+        number = self.posts - index
+        post_id = get_post_id(number)
+        kind = number % 4
+
+        post = {
+            "postId": post_id,
+            "authorText": {"runs": [{"text": "Benchmark Channel"}]},
+            "publishedTimeText": {"runs": [{"text": f"{index + 1} days ago"}]},
+            "voteCount": {"simpleText": f"{number % 1000}"},
+            "contentText": {
+                "runs": [
+                    {"text": f"Synthetic post {number}\n"},
+                    {
+                        "text": "a link",
+                        "navigationEndpoint": {
+                            "commandMetadata": {"webCommandMetadata": {"url": "/watch?v=benchmark00"}}
+                        },
+                    },
+                ]
+            },
+        }
+
+        images = [
+            {
+                "backstageImageRenderer": {
+                    "image": {
+                        "thumbnails": [
+                            {"url": f"{image_origin}/{post_id}-{image}=s{size}", "width": size}
+                            for size in [288, 640, 1200]
+                        ]
+                    }
+                }
+            }
+            for image in range(self.images_per_post)
+        ]
+
+        if kind == 1 and images:
+            post["backstageAttachment"] = images[0]
+        elif kind == 2 and images:
+            post["backstageAttachment"] = {"postMultiImageRenderer": {"images": images}}
+        elif kind == 3:
+            post["backstageAttachment"] = {
+                "videoRenderer": {
+                    "title": {"runs": [{"text": f"Video {number}"}]},
+                    "thumbnail": {
+                        "thumbnails": [{"url": f"{image_origin}/vi/{post_id}/hqdefault.jpg?sqp=1"}]
+                    },
+                    "publishedTimeText": {"simpleText": "1 year ago"},
+                    "navigationEndpoint": {
+                        "commandMetadata": {"webCommandMetadata": {"url": f"/watch?v={number:011d}"}}
+                    },
+                }
+            }
+
+        return {"backstagePostThreadRenderer": {"post": {"backstagePostRenderer": post}}}
+
+    def build_page(self, page: int, image_origin: str) -> list[dict]:
+        start = page * self.page_size
+        end = min(start + self.page_size, self.posts)
+
+        items = [self.build_post(index=index, image_origin=image_origin) for index in range(start, end)]
+
+        if end < self.posts:
+            items.append(
+                {
+                    "continuationItemRenderer": {
+                        "continuationEndpoint": {
+                            "continuationCommand": {"token": f"page-{page + 1}"}
+                        }
+                    }
+                }
+            )
+
+        return items
+
+    def build_community_tab(self, content: dict | None) -> dict:
+        tab = {
+            "tabRenderer": {
+                "endpoint": {
+                    "commandMetadata": {"webCommandMetadata": {"url": CHANNEL_PATH}},
+                    "browseEndpoint": {"browseId": BROWSE_ID, "params": BROWSE_PARAMS},
+                }
+            }
+        }
+
+        if content is not None:
+            tab["tabRenderer"]["content"] = content
+
+        return {"contents": {"twoColumnBrowseResultsRenderer": {"tabs": [tab]}}}
+
+    def build_section(self, items: list[dict]) -> dict:
+        return {"sectionListRenderer": {"contents": [{"itemSectionRenderer": {"contents": items}}]}}
+
+    def build_html(self, initial_data: dict) -> str:
+        ytcfg = {
+            "INNERTUBE_API_KEY": API_KEY,
+            "INNERTUBE_CONTEXT": {"client": {"clientName": "WEB", "clientVersion": "2.0"}},
+        }
+
+        return (
+            "<html><head>"
+            f"<script>ytcfg.set({json.dumps(ytcfg)});</script>"
+            f"<script>var ytInitialData = {json.dumps(initial_data)};</script>"
+            "</head><body></body></html>"
+        )
+
+    def channel_page(self) -> str:
+        return self.build_html(initial_data=self.build_community_tab(content=None))
+
+    def post_page(self, post_id: str, image_origin: str) -> str | None:
+        try:
+            number = get_post_index(post_id)
+        except ValueError:
+            return None
+
+        if not 0 < number <= self.posts:
+            return None
+
+        post = self.build_post(index=self.posts - number, image_origin=image_origin)
+
+        return self.build_html(initial_data=self.build_community_tab(content=self.build_section(items=[post])))
+
+    def browse(self, body: dict, image_origin: str) -> dict:
+        token = body.get("continuation")
+
+        if not token:
+            items = self.build_page(page=0, image_origin=image_origin)
+
+            return self.build_community_tab(content=self.build_section(items=items))
+
+        page = int(token.split("-")[1])
+
+        return {
+            "onResponseReceivedEndpoints": [
+                {
+                    "appendContinuationItemsAction": {
+                        "continuationItems": self.build_page(page=page, image_origin=image_origin)
+                    }
+                }
+            ]
+        }
+
+
+class ServerStats:
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.requests: dict[str, int] = dict()
+        self.injected: dict[str, int] = dict()
+        self.bytes_sent = 0
+
+    def count(self, kind: str, size: int) -> None:
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.bytes_sent += size
+
+    def count_injected(self, status: int) -> None:
+        with self.lock:
+            self.injected[str(status)] = self.injected.get(str(status), 0) + 1
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "total_requests": sum(self.requests.values()),
+                "injected_errors": dict(self.injected),
+                "bytes_sent": self.bytes_sent,
+            }
+
+
+class InnerTubeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    server: "InnerTubeServer"
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def get_image_origin(self) -> str:
+        # images are served under a second host name, so they end up in their
+        # own connection pool and host limit like yt3.ggpht.com would
+        port = self.server.server_address[1]
+
+        return f"http://{self.server.image_host}:{port}"
+
+    def send(self, kind: str, status: int, body: bytes, content_type: str, headers: dict = None) -> None:
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        injected_status = self.server.get_injected_status() if kind != "stats" else None
+
+        if injected_status:
+            self.server.stats.count_injected(status=injected_status)
+
+            status, body, content_type = injected_status, b"", "text/plain"
+            headers = {"Retry-After": self.server.retry_after}
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+        if kind != "stats":
+            self.server.stats.count(kind=kind, size=len(body))
+
+    def do_GET(self) -> None:
+        channel = self.server.channel
+        path = urllib.parse.urlparse(self.path).path
+
+        if path == "/__stats":
+            self.send("stats", 200, json.dumps(self.server.stats.to_dict()).encode(), "application/json")
+        elif path == CHANNEL_PATH:
+            self.send("channel", 200, channel.channel_page().encode(), "text/html; charset=utf-8")
+        elif path.startswith("/post/"):
+            html = channel.post_page(post_id=path[len("/post/"):], image_origin=self.get_image_origin())
+
+            if html:
+                self.send("post", 200, html.encode(), "text/html; charset=utf-8")
+            else:
+                self.send("post", 404, b"", "text/html")
+        else:
+            self.send_image(path=path)
+
+    def send_image(self, path: str) -> None:
+        etag = f'"{len(self.server.channel.image)}"'
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send("image", 304, b"", "image/png", headers={"ETag": etag})
+        else:
+            self.send("image", 200, self.server.channel.image, "image/png", headers={"ETag": etag})
+
+    def do_POST(self) -> None:
+        path = urllib.parse.urlparse(self.path).path
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if path != "/youtubei/v1/browse":
+            self.send("browse", 404, b"", "application/json")
+            return
+
+        response = self.server.channel.browse(body=json.loads(body), image_origin=self.get_image_origin())
+
+        self.send("browse", 200, json.dumps(response).encode(), "application/json")
+
+
+class InnerTubeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        channel: SyntheticChannel,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0,
+        image_host: str = "localhost",
+        throttle_rate: float = 0,
+        unavailable_rate: float = 0,
+        retry_after: float = 1,
+        seed: int = 0,
+    ) -> None:
+        super().__init__((host, port), InnerTubeHandler)
+
+        self.channel = channel
+        self.latency = latency
+        self.image_host = image_host
+        self.stats = ServerStats()
+
+        # shares of the requests answered with 429 / 503, seeded so runs with
+        # the same settings see the same errors
+        self.throttle_rate = throttle_rate
+        self.unavailable_rate = unavailable_rate
+        self.retry_after = f"{retry_after:g}"
+        self.random = random.Random(seed)
+        self.random_lock = Lock()
+
+    def get_injected_status(self) -> int | None:
+        if not self.throttle_rate and not self.unavailable_rate:
+            return None
+
+        with self.random_lock:
+            value = self.random.random()
+
+        if value < self.throttle_rate:
+            return 429
+
+        if value < self.throttle_rate + self.unavailable_rate:
+            return 503
+
+        return None
+
+    @property
+    def origin(self) -> str:
+        host, port = self.server_address[:2]
+
+        return f"http://{host}:{port}"
+
+
+def run_server(
+    ready,
+    latency: float,
+    port: int = 0,
+    throttle_rate: float = 0,
+    unavailable_rate: float = 0,
+    retry_after: float = 1,
+    **channel_options,
+) -> None:
+    # entry point for running the server in a separate process, the origin is
+    # passed back through the ready queue
+    server = InnerTubeServer(
+        channel=SyntheticChannel(**channel_options),
+        port=port,
+        latency=latency,
+        throttle_rate=throttle_rate,
+        unavailable_rate=unavailable_rate,
+        retry_after=retry_after,
+    )
+
+    ready.put(server.origin)
+
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serves a synthetic channel for offline benchmarks"
+    )
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--images-per-post", type=int, default=2)
+    parser.add_argument("--image-size", type=int, default=64 * 1024)
+    parser.add_argument("--latency", type=float, default=0, help="seconds per request")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="share of requests answered with 429")
+    parser.add_argument("--unavailable-rate", type=float, default=0, help="share of requests answered with 503")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds of injected errors")
+
+    args = parser.parse_args()
+
+    channel = SyntheticChannel(
+        posts=args.posts,
+        page_size=args.page_size,
+        images_per_post=args.images_per_post,
+        image_size=args.image_size,
+    )
+
+    server = InnerTubeServer(
+        channel=channel,
+        port=args.port,
+        latency=args.latency,
+        throttle_rate=args.throttle_rate,
+        unavailable_rate=args.unavailable_rate,
+        retry_after=args.retry_after,
+    )
+
+    print(f"Serving {args.posts} posts on {server.origin}{CHANNEL_PATH}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import re
+import sys
+import json
+import time
+import argparse
+
+from src.page_data import extract_initial_data, extract_ytcfg
+
+# the patterns previously used by PostExtractor
+INITIAL_DATA_PATTERN = "(?<=var ytInitialData = ){.*?}(?=;<\\/script>)"
+YTCFG_PATTERN = "(?<=ytcfg\\.set\\()\\{.*?\\}(?=\\);)"
+
+
+def regex_extract(html: str) -> tuple[dict, dict]:
+    initial_data = json.loads(re.search(INITIAL_DATA_PATTERN, html).group())
+    ytcfg = json.loads(re.search(YTCFG_PATTERN, html).group())
+
+    return initial_data, ytcfg
+
+
+def decoder_extract(html: str) -> tuple[dict, dict]:
+    return extract_initial_data(html=html), extract_ytcfg(html=html)
+
+
+def build_synthetic_page(size: int) -> str:
+    # roughly mirrors a channel page: large inline scripts full of "}" before
+    # and inside ytInitialData, and several ytcfg.set() calls
+    filler_item = {
+        "richItemRenderer": {
+            "content": {"videoRenderer": {"videoId": "x" * 11, "title": {"runs": [{"text": "}" * 8}]}}},
+        }
+    }
+
+    items: list[dict] = list()
+    initial_data = {"contents": {"twoColumnBrowseResultsRenderer": {"tabs": [{"items": items}]}}}
+
+    while len(json.dumps(initial_data)) < size // 2:
+        items += [filler_item] * 100
+
+    script_filler = "function f(a){return {b:a}};" * (size // 2 // 30)
+
+    return (
+        "<html><head><script>"
+        'ytcfg.set({"EXPERIMENT_FLAGS": {"a": true}});'
+        'ytcfg.set("MSG_KEY", "value");'
+        f"{script_filler}</script>"
+        f"<script>var ytInitialData = {json.dumps(initial_data)};</script>"
+        '<script>ytcfg.set({"INNERTUBE_API_KEY": "key", "INNERTUBE_CONTEXT": {"client": {}}});</script>'
+        "</head></html>"
+    )
+
+
+def benchmark(name: str, func, html: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(html)
+
+    duration = (time.perf_counter() - start) / repeat
+
+    print(f"  {name:<8} {duration * 1000:8.2f} ms")
+
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares the ytInitialData / ytcfg extraction against the previous regexes"
+    )
+    parser.add_argument("pages", nargs="*", help="saved channel or post pages")
+    parser.add_argument("--size", type=int, default=1_500_000)
+    parser.add_argument("--repeat", type=int, default=10)
+
+    args = parser.parse_args()
+
+    pages: list[tuple[str, str]] = list()
+    for page in args.pages:
+        with open(page, encoding="utf-8") as f:
+            pages.append((page, f.read()))
+
+    if not pages:
+        pages.append((f"synthetic ({args.size} bytes)", build_synthetic_page(args.size)))
+
+    for name, html in pages:
+        print(f"{name}: {len(html)} characters")
+
+        regex_time = benchmark("regex", regex_extract, html, args.repeat)
+        decoder_time = benchmark("decoder", decoder_extract, html, args.repeat)
+
+        regex_ytcfg = regex_extract(html)[1]
+        decoder_ytcfg = decoder_extract(html)[1]
+
+        print(f"  speedup  {regex_time / decoder_time:8.1f}x")
+        print(
+            f"  api key  regex: {regex_ytcfg.get('INNERTUBE_API_KEY')!r} - decoder: {decoder_ytcfg.get('INNERTUBE_API_KEY')!r}"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+import sys
+import time
+import argparse
+import tracemalloc
+
+from pydantic import BaseModel
+
+from src.post_records import extract_post_record
+
+
+# the models and extraction previously used by ContentExporter
+class PollOption(BaseModel):
+    votes: str = "0"
+    percentage: str = "0%"
+
+
+class PostContent(BaseModel):
+    video_thumbnail_url: str = None
+    video_url: str = None
+    video_title: str = None
+    video_published_time: str = None
+    video_members_only: bool = False
+    members_only: bool = False
+    author: str = ""
+    post_text: str = ""
+    post_published_time: str = ""
+    post_id: str = ""
+    like_count: str = "0"
+    attached_images: list[str] = list()
+    poll: dict[str, PollOption] = dict()
+
+
+def legacy_get_image_urls(container: dict) -> list[str]:
+    return [
+        image.get("url", "")
+        for image in container.get("backstageImageRenderer", {})
+        .get("image", {})
+        .get("thumbnails", [dict()])
+    ]
+
+
+def legacy_get_post_text(text_runs: list[dict]) -> str:
+    post_text_parts: list[str] = list()
+
+    for text_run in text_runs:
+        text = text_run.get("text", "")
+        navigation_link = (
+            text_run.get("navigationEndpoint", {})
+            .get("commandMetadata", {})
+            .get("webCommandMetadata", {})
+            .get("url", "")
+        )
+
+        if navigation_link.startswith("/"):
+            navigation_link = f"https://youtube.com{navigation_link}"
+
+        if navigation_link and not text == navigation_link:
+            text = f"{text} ({navigation_link})"
+
+        post_text_parts.append(text)
+
+    return "".join(post_text_parts)
+
+
+def legacy_extract_post_details(post: dict) -> PostContent:
+    post_content = PostContent()
+
+    post_content.post_id = post.get("postId", "no_id_found")
+    post_content.author = post.get("authorText", {}).get("runs", [dict()])[0].get("text", "")
+    post_content.post_published_time = (
+        post.get("publishedTimeText", {}).get("runs", [dict()])[0].get("text", "")
+    )
+    post_content.members_only = "sponsorsOnlyBadge" in post.keys()
+    post_content.like_count = post.get("voteCount", {}).get("simpleText")
+
+    post_content.post_text = legacy_get_post_text(
+        text_runs=post.get("contentText", {}).get("runs", [])
+    )
+
+    image_urls = []
+    image_urls += legacy_get_image_urls(container=post.get("backstageAttachment", {}))
+
+    multi_images: list[dict] = (
+        post.get("backstageAttachment", {}).get("postMultiImageRenderer", {}).get("images", [])
+    )
+
+    for image in multi_images:
+        image_urls += legacy_get_image_urls(container=image)
+
+    post_content.attached_images = image_urls
+
+    poll_choices: list[dict] = (
+        post.get("backstageAttachment", {}).get("pollRenderer", {}).get("choices", [])
+    )
+
+    for choice in poll_choices:
+        choice_text = choice.get("text", {}).get("runs", [dict()])[0].get("text", "Null")
+
+        percentage_voted = choice.get("votePercentage", {}).get("simpleText")
+        percentage_not_voted = choice.get("votePercentageIfSelected", {}).get("simpleText")
+
+        percentage = percentage_voted if percentage_voted else percentage_not_voted
+
+        post_content.poll[choice_text] = PollOption(
+            votes=choice.get("numVotes", ""),
+            percentage=percentage if percentage else "",
+        )
+
+    video_dict = post.get("backstageAttachment", {}).get("videoRenderer", {})
+
+    post_content.video_title = video_dict.get("title", {}).get("runs", [dict()])[0].get("text", "")
+    post_content.video_thumbnail_url = (
+        video_dict.get("thumbnail", {}).get("thumbnails", [dict()])[-1].get("url", "").split("?")[0]
+    )
+    post_content.video_published_time = video_dict.get("publishedTimeText", {}).get("simpleText", "")
+
+    video_link = (
+        video_dict.get("navigationEndpoint", {})
+        .get("commandMetadata", {})
+        .get("webCommandMetadata", {})
+        .get("url", "")
+    )
+
+    if video_link.startswith("/"):
+        video_link = f"https://www.youtube.com{video_link}"
+
+    post_content.video_url = video_link
+
+    for badge in video_dict.get("badges", []):
+        if badge.get("metadataBadgeRenderer", {}).get("label", "") == "Members only":
+            post_content.video_members_only = True
+            break
+
+    return post_content
+
+
+def build_synthetic_post(index: int) -> dict:
+    # cycles through text-only, image, multi image, poll and video posts
+    kind = index % 5
+
+    post = {
+        "postId": f"Ugkx{index:020d}",
+        "authorText": {"runs": [{"text": "Channel Author"}]},
+        "publishedTimeText": {"runs": [{"text": f"{index % 30 + 1} days ago"}]},
+        "voteCount": {"simpleText": f"{index % 1000}"},
+        "contentText": {
+            "runs": [
+                {"text": f"Post number {index}\n"},
+                {
+                    "text": "a link",
+                    "navigationEndpoint": {
+                        "commandMetadata": {"webCommandMetadata": {"url": "/watch?v=abc"}}
+                    },
+                },
+                {"text": " and some more text"},
+            ]
+        },
+    }
+
+    if index % 7 == 0:
+        post["sponsorsOnlyBadge"] = {}
+
+    image = {
+        "backstageImageRenderer": {
+            "image": {
+                "thumbnails": [
+                    {"url": f"https://yt3.ggpht.com/{index}=s{size}", "width": size}
+                    for size in [288, 400, 640, 1200]
+                ]
+            }
+        }
+    }
+
+    if kind == 1:
+        post["backstageAttachment"] = image
+    elif kind == 2:
+        post["backstageAttachment"] = {"postMultiImageRenderer": {"images": [image] * 4}}
+    elif kind == 3:
+        post["backstageAttachment"] = {
+            "pollRenderer": {
+                "choices": [
+                    {
+                        "text": {"runs": [{"text": f"Option {choice}"}]},
+                        "numVotes": str(choice * 10),
+                        "votePercentageIfSelected": {"simpleText": f"{choice * 10}%"},
+                    }
+                    for choice in range(4)
+                ]
+            }
+        }
+    elif kind == 4:
+        post["backstageAttachment"] = {
+            "videoRenderer": {
+                "title": {"runs": [{"text": "A video"}]},
+                "thumbnail": {"thumbnails": [{"url": f"https://i.ytimg.com/vi/{index}/hq.jpg?sqp=1"}]},
+                "publishedTimeText": {"simpleText": "1 year ago"},
+                "navigationEndpoint": {
+                    "commandMetadata": {"webCommandMetadata": {"url": f"/watch?v={index}"}}
+                },
+                "badges": [{"metadataBadgeRenderer": {"label": "Members only"}}],
+            }
+        }
+
+    return post
+
+
+FIELDS = [
+    "video_thumbnail_url",
+    "video_url",
+    "video_title",
+    "video_published_time",
+    "video_members_only",
+    "members_only",
+    "author",
+    "post_text",
+    "post_published_time",
+    "post_id",
+    "like_count",
+]
+
+
+def check_equivalence(posts: list[dict]) -> bool:
+    for post in posts:
+        legacy = legacy_extract_post_details(post)
+        record = extract_post_record(post)
+
+        for field in FIELDS:
+            if getattr(legacy, field) != getattr(record, field):
+                print(f"  mismatch in {post['postId']}: {field}")
+                return False
+
+        # the previous lookups added an empty url for posts without an image,
+        # deduplicate_images drops it
+        if [url for url in legacy.attached_images if url] != record.attached_images:
+            print(f"  mismatch in {post['postId']}: attached_images")
+            return False
+
+        legacy_poll = {text: (option.votes, option.percentage) for text, option in legacy.poll.items()}
+        record_poll = {text: (option.votes, option.percentage) for text, option in record.poll.items()}
+
+        if legacy_poll != record_poll:
+            print(f"  mismatch in {post['postId']}: poll")
+            return False
+
+    return True
+
+
+def benchmark(name: str, func, posts: list[dict]) -> float:
+    start = time.perf_counter()
+    for post in posts:
+        func(post)
+    duration = time.perf_counter() - start
+
+    # allocations are measured in a separate pass, tracemalloc slows the run down
+    tracemalloc.start()
+    records = [func(post) for post in posts]
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del records
+
+    print(
+        f"  {name:<8} {duration * 1000:9.1f} ms - {len(posts) / duration:10.0f} posts/s"
+        f" - {retained / len(posts):7.0f} bytes/post retained - peak {peak / 1024 / 1024:7.1f} MB"
+    )
+
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares the compiled post extraction against the previous pydantic models"
+    )
+    parser.add_argument("--posts", type=int, default=100_000)
+
+    args = parser.parse_args()
+
+    posts = [build_synthetic_post(index=index) for index in range(args.posts)]
+
+    print(f"{len(posts)} synthetic backstagePostRenderer dicts")
+
+    equivalent = check_equivalence(posts=posts)
+    print(f"  equivalent output: {equivalent}")
+
+    legacy_time = benchmark("pydantic", legacy_extract_post_details, posts)
+    record_time = benchmark("records", extract_post_record, posts)
+
+    print(f"  speedup  {legacy_time / record_time:9.1f}x")
+
+    return 0 if equivalent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,167 @@
 import logging
 import os
+import io
+import time
+import pstats
+import cProfile
+import signal
+import asyncio
 import argparse
+import threading
 from pathlib import Path
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from src.extractor import PostExtractor
-from src.content_exporter import ContentExporter
+from src.content_exporter import ContentExporter, PreparedPost, OUTPUT_FORMATS
+from src.post_pack import PostPack, PACK_FILE
+from src.rerender import rerender_posts
+from src.pipeline import create_parse_pool, iter_prepared_posts
+from src.crawl_state import CrawlState
+from src.post_ids import PostIdReader, POST_IDS_CHECKPOINT_FILE, iter_post_ids
+from src.init_data_cache import InitDataCache, INIT_DATA_FILE, INIT_DATA_TTL
 from src.cookies import initialize_cookies
+from src.transport import Transport, YOUTUBE_ORIGIN
+from src.response_cache import ResponseCache
+from src.metrics import Metrics
+from src.archive import ArchiveError
+from src.ratelimit import RetryPolicy
+from src.batch import BatchChannel, ChannelResult, load_batch_file
+from src.watch import WatchDaemon, WATCH_INTERVAL, WATCH_JITTER, WATCH_PAGES
+from src.async_backend import (
+    AsyncTransport,
+    AsyncPostExtractor,
+    AsyncContentExporter,
+)
+
+logger = logging.getLogger(name=__name__)
+
+
+def get_post_url(post_id: str, origin: str = YOUTUBE_ORIGIN) -> str:
+    return (
+        f"{origin}/post/{post_id}"
+        if not post_id.startswith("https://")
+        else post_id
+    )
+
+
+def iter_individual_posts(
+    extractor: PostExtractor,
+    post_ids: list[str],
+    workers: int = 1,
+    archived_ids: dict[str, str] = None,
+) -> Iterator[dict]:
+    # archived_ids receives the id every retrieved post is archived under,
+    # a share is archived under the id of the original post
+    post_urls = {
+        get_post_url(post_id=post_id, origin=extractor.transport.origin): post_id
+        for post_id in post_ids
+    }
+
+    for post_url, post in extractor.get_individual_posts(
+        urls=post_urls, workers=workers
+    ):
+        if post:
+            if archived_ids is not None:
+                archived_ids[post_urls[post_url]] = extractor.get_post_id(post=post)
+
+            yield post
+        else:
+            logger.warning(f"could not retrieve post from {post_url}")
+
+
+def iter_prepared_individual_posts(
+    extractor: PostExtractor,
+    post_ids: list[str],
+    workers: int = 1,
+    parse_workers: int = 1,
+    compact_json: bool = False,
+    parse_pool: ProcessPoolExecutor = None,
+    archived_ids: dict[str, str] = None,
+) -> Iterator[PreparedPost]:
+    post_urls = {
+        get_post_url(post_id=post_id, origin=extractor.transport.origin): post_id
+        for post_id in post_ids
+    }
+
+    for post_url, prepared_post in iter_prepared_posts(
+        extractor=extractor,
+        urls=post_urls,
+        fetch_workers=workers,
+        parse_workers=parse_workers,
+        compact_json=compact_json,
+        parse_pool=parse_pool,
+    ):
+        if prepared_post:
+            if archived_ids is not None:
+                archived_ids[post_urls[post_url]] = prepared_post.post_id
+
+            yield prepared_post
+        else:
+            logger.warning(f"could not retrieve post from {post_url}")
+
+
+def export_post_ids(
+    exporter: ContentExporter,
+    extractor: PostExtractor,
+    post_ids: list[str],
+    workers: int = 1,
+    parse_workers: int = 0,
+    compact_json: bool = False,
+    parse_pool: ProcessPoolExecutor = None,
+) -> dict[str, str]:
+    # returns the archived id of every passed post id that could be retrieved
+    archived_ids: dict[str, str] = dict()
+
+    if parse_workers:
+        exporter.export_prepared_posts(
+            posts=iter_prepared_individual_posts(
+                extractor=extractor,
+                post_ids=post_ids,
+                workers=workers,
+                parse_workers=parse_workers,
+                compact_json=compact_json,
+                parse_pool=parse_pool,
+                archived_ids=archived_ids,
+            )
+        )
+    else:
+        exporter.export_posts(
+            posts=iter_individual_posts(
+                extractor=extractor,
+                post_ids=post_ids,
+                workers=workers,
+                archived_ids=archived_ids,
+            )
+        )
+
+    return archived_ids
+
+
+def get_init_data_cache(output_path: str, ttl: float) -> InitDataCache | None:
+    if not ttl:
+        return None
+
+    return InitDataCache(cache_file=os.path.join(output_path, INIT_DATA_FILE), ttl=ttl)
+
+
+def finish_crawl_state(crawl_state: CrawlState | None) -> None:
+    if not crawl_state:
+        return
+
+    # the state of a crawl that stopped at a failed page is kept for the next run
+    if crawl_state.incomplete():
+        logger.warning(
+            f"Crawl of '{crawl_state.url}' stopped after {crawl_state.pages} pages, the next run continues from there"
+        )
+        return
+
+    if crawl_state.exhausted:
+        logger.warning(
+            f"Giving up the crawl of '{crawl_state.url}' after {crawl_state.failures} failed runs, exported the posts of {crawl_state.pages} pages"
+        )
+
+    crawl_state.clear()
 
 
 def export_posts(
@@ -14,50 +170,389 @@ def export_posts(
     output_path: str,
     archive_file: str,
     post_ids: list[str] = None,
-):
-    extractor = PostExtractor(cookies=cookies)
-
-    exporter = ContentExporter(output_path=output_path, archive_file=archive_file)
-
-    posts: list[dict] = list()
-    if post_ids:
-        logger.info(f"Extracting passed post id's")
-        for post_id in post_ids:
-            post_url = (
-                f"https://www.youtube.com/post/{post_id}"
-                if not post_id.startswith("https://")
-                else post_id
+    post_id_reader: PostIdReader = None,
+    archive_journal: bool = False,
+    full_rescan: bool = False,
+    stop_after_known: int = 10,
+    stream: bool = False,
+    resume_crawl: bool = True,
+    init_data_ttl: float = INIT_DATA_TTL,
+    pool_size: int = 16,
+    max_downloads: int = 8,
+    max_host_downloads: int = 4,
+    post_workers: int = 1,
+    parse_workers: int = 0,
+    transport: Transport = None,
+    max_retries: int = 5,
+    compact_json: bool = False,
+    media_store: bool = False,
+    output_format: str = "directories",
+    response_cache: ResponseCache = None,
+    metrics: Metrics = None,
+) -> int:
+    shared_transport = transport is not None
+    if not shared_transport:
+        transport = Transport(
+            cookies=cookies,
+            pool_maxsize=pool_size,
+            retry_policy=RetryPolicy(max_retries=max_retries),
+            response_cache=response_cache,
+            metrics=metrics,
+        )
+
+    extractor = PostExtractor(
+        transport=transport,
+        init_data_cache=get_init_data_cache(output_path=output_path, ttl=init_data_ttl),
+    )
+
+    try:
+        exporter = ContentExporter(
+            output_path=output_path,
+            archive_file=archive_file,
+            archive_journal=archive_journal,
+            transport=transport,
+            max_downloads=max_downloads,
+            max_host_downloads=max_host_downloads,
+            compact_json=compact_json,
+            media_store=media_store,
+            output_format=output_format,
+        )
+    except ArchiveError:
+        if not shared_transport:
+            transport.close()
+        raise
+
+    # an exception still waits for the running downloads and saves the archive
+    try:
+        known_post_ids = None if full_rescan else exporter.state
+
+        exporter.retry_incomplete_posts()
+
+        # the parse workers are spawned once, not for every chunk of post ids
+        parse_pool = (
+            create_parse_pool(parse_workers=parse_workers)
+            if parse_workers and (post_ids or post_id_reader)
+            else None
+        )
+
+        try:
+            if post_ids:
+                logger.info(f"Exporting passed post id's")
+                export_post_ids(
+                    exporter=exporter,
+                    extractor=extractor,
+                    post_ids=post_ids,
+                    workers=post_workers,
+                    parse_workers=parse_workers,
+                    compact_json=compact_json,
+                    parse_pool=parse_pool,
+                )
+
+            if post_id_reader:
+                logger.info(f"Exporting post id's from '{post_id_reader.posts_file}'")
+
+                # archived posts are skipped before they are requested, the
+                # checkpoint moves on once a chunk is done and keeps the posts
+                # that couldn't be exported for the next run
+                for chunk in post_id_reader.iter_chunks(known_post_ids=exporter.state):
+                    archived_ids = export_post_ids(
+                        exporter=exporter,
+                        extractor=extractor,
+                        post_ids=chunk,
+                        workers=post_workers,
+                        parse_workers=parse_workers,
+                        compact_json=compact_json,
+                        parse_pool=parse_pool,
+                    )
+                    post_id_reader.save_checkpoint(
+                        archived_ids=archived_ids, known_post_ids=exporter.state
+                    )
+
+                post_id_reader.save_checkpoint()
+        finally:
+            if parse_pool is not None:
+                parse_pool.shutdown()
+
+        crawl_state = (
+            CrawlState(output_path=output_path, url=url) if url and resume_crawl else None
+        )
+
+        if stream:
+            if url:
+                logger.info(f"Exporting posts from '{url}'")
+                exporter.export_posts_streaming(
+                    pages=extractor.iter_posts(
+                        url=url,
+                        known_post_ids=known_post_ids,
+                        stop_after_known=stop_after_known,
+                        crawl_state=crawl_state,
+                    ),
+                    crawl_state=crawl_state,
+                )
+
+                finish_crawl_state(crawl_state=crawl_state)
+        elif url:
+            logger.info(f"Extracting posts from '{url}'")
+            extracted_posts = extractor.get_posts(
+                url=url,
+                known_post_ids=known_post_ids,
+                stop_after_known=stop_after_known,
+                crawl_state=crawl_state,
             )
-            post = extractor.get_individual_post(url=post_url)
-            if post:
-                posts.append(post)
+
+            if crawl_state and crawl_state.incomplete():
+                # the older posts the next run finds have to be numbered first
+                logger.info(
+                    f"{len(extracted_posts)} posts retrieved via url, exported once the crawl is complete"
+                )
+            elif extracted_posts:
+                logger.info(f"{len(extracted_posts)} posts retrieved via url")
+                extracted_posts.reverse()
+
+                exporter.export_posts(posts=extracted_posts)
+            elif exporter.exported_posts:
+                logger.info(f"No addtional posts could be retrieved from '{url}'")
             else:
-                logger.warning(f"could not retrieve post from {post_url}")
+                logger.info(f"No posts could be retrieved from '{url}'")
 
-        logger.info(f"{len(posts)} posts retrieved from list")
+            finish_crawl_state(crawl_state=crawl_state)
+    finally:
+        exporter.close()
+        if not shared_transport:
+            log_request_stats(transport=transport)
+            transport.close()
 
-    if url:
-        logger.info(f"Extracting posts from '{url}'")
-        extracted_posts = extractor.get_posts(url=url)
+    return exporter.exported_posts
 
-        if extracted_posts:
-            logger.info(f"{len(extracted_posts)} posts retrieved via url")
-            extracted_posts.reverse()
 
-            posts += extracted_posts
-        elif posts:
-            logger.info(f"No addtional posts could be retrieved from '{url}'")
-        else:
-            logger.info(f"No posts could be retrieved from '{url}'")
+def export_channel(
+    channel: BatchChannel, transport: Transport, **export_options
+) -> ChannelResult:
+    result = ChannelResult(url=channel.url)
+
+    start = time.monotonic()
+    try:
+        if not prepare_output_dir(output_path=channel.output_path):
+            raise RuntimeError(
+                f"Output dir '{channel.output_path}' does not exist & couldn't be created"
+            )
+
+        result.exported_posts = export_posts(
+            url=channel.url,
+            cookies=transport.cookies,
+            output_path=channel.output_path,
+            archive_file=channel.archive_file,
+            transport=transport,
+            **export_options,
+        )
+    except Exception as error:
+        logger.error(f"Exporting '{channel.url}' failed: {error}")
+        result.error = str(error)
+
+    result.duration = time.monotonic() - start
+
+    return result
+
+
+def export_batch(
+    channels: list[BatchChannel],
+    cookies: dict,
+    channel_workers: int = 4,
+    max_requests: int = 16,
+    pool_size: int = 16,
+    max_retries: int = 5,
+    response_cache: ResponseCache = None,
+    metrics: Metrics = None,
+    **export_options,
+) -> list[ChannelResult]:
+    # all channels share one connection pool and one request budget
+    transport = Transport(
+        cookies=cookies,
+        pool_maxsize=pool_size,
+        max_requests=max_requests,
+        retry_policy=RetryPolicy(max_retries=max_retries),
+        response_cache=response_cache,
+        metrics=metrics,
+    )
+
+    with ThreadPoolExecutor(max_workers=channel_workers) as executor:
+        results = list(
+            executor.map(
+                lambda channel: export_channel(
+                    channel=channel, transport=transport, **export_options
+                ),
+                channels,
+            )
+        )
+
+    logger.info(f"Exported {len(channels)} channels:")
+    for result in results:
+        status = f"failed: {result.error}" if result.error else "ok"
+        logger.info(
+            f"{result.url} - {result.exported_posts} new posts - {result.duration:.1f}s - {status}"
+        )
+
+    log_request_stats(transport=transport)
+    transport.close()
 
-    exporter.export_posts(posts=posts)
+    return results
 
 
-def load_posts_file(file: str) -> list[str]:
-    with open(file) as f:
-        content = f.read()
+def watch_channels(
+    channels: list[BatchChannel],
+    cookies: dict,
+    status_file: str = None,
+    interval: float = WATCH_INTERVAL,
+    jitter: float = WATCH_JITTER,
+    max_pages: int = WATCH_PAGES,
+    stop_after_known: int = 10,
+    init_data_ttl: float = INIT_DATA_TTL,
+    channel_workers: int = 4,
+    max_requests: int = 16,
+    pool_size: int = 16,
+    max_retries: int = 5,
+    metrics: Metrics = None,
+    **export_options,
+) -> bool:
+    transport = Transport(
+        cookies=cookies,
+        pool_maxsize=pool_size,
+        max_requests=max_requests,
+        retry_policy=RetryPolicy(max_retries=max_retries),
+        metrics=metrics,
+    )
+
+    daemon = WatchDaemon(
+        channels=channels,
+        transport=transport,
+        status_file=status_file,
+        interval=interval,
+        jitter=jitter,
+        max_pages=max_pages,
+        stop_after_known=stop_after_known,
+        init_data_ttl=init_data_ttl,
+        channel_workers=channel_workers,
+        **export_options,
+    )
+
+    # signal handlers can only be installed from the main thread
+    if threading.current_thread() is threading.main_thread():
+        for signal_number in [signal.SIGINT, signal.SIGTERM]:
+            signal.signal(signal_number, lambda *_: daemon.stop())
+
+    try:
+        daemon.run()
+    finally:
+        log_request_stats(transport=transport)
+        transport.close()
+
+    return not daemon.failed_channels
+
+
+def log_request_stats(transport: Transport):
+    stats = transport.stats.as_dict()
+
+    logger.info(
+        f"{stats['requests']} requests - {stats['retries']} retries - {stats['throttled']} throttled - {stats['errors']} connection errors - {stats['cached']} from cache"
+    )
+
+
+async def export_posts_async(
+    url: str,
+    cookies: dict,
+    output_path: str,
+    archive_file: str,
+    post_ids: list[str] = None,
+    archive_journal: bool = False,
+    full_rescan: bool = False,
+    stop_after_known: int = 10,
+    init_data_ttl: float = INIT_DATA_TTL,
+    max_downloads: int = 8,
+    max_requests: int = 64,
+    max_retries: int = 5,
+    compact_json: bool = False,
+    media_store: bool = False,
+    output_format: str = "directories",
+    response_cache: ResponseCache = None,
+    metrics: Metrics = None,
+):
+    transport = AsyncTransport(
+        cookies=cookies,
+        max_requests=max_requests,
+        retry_policy=RetryPolicy(max_retries=max_retries),
+        response_cache=response_cache,
+        metrics=metrics,
+    )
+
+    extractor = AsyncPostExtractor(
+        transport=transport,
+        init_data_cache=get_init_data_cache(output_path=output_path, ttl=init_data_ttl),
+    )
 
-    return content.splitlines()
+    exporter = AsyncContentExporter(
+        output_path=output_path,
+        archive_file=archive_file,
+        transport=transport,
+        archive_journal=archive_journal,
+        max_downloads=max_downloads,
+        compact_json=compact_json,
+        media_store=media_store,
+        output_format=output_format,
+    )
+
+    try:
+        await exporter.retry_incomplete_posts()
+
+        posts: list[dict] = list()
+        if post_ids:
+            logger.info(f"Extracting passed post id's")
+            post_urls = [
+                get_post_url(post_id=post_id, origin=transport.origin)
+                for post_id in post_ids
+            ]
+
+            for post_url, post in await extractor.get_individual_posts(urls=post_urls):
+                if post:
+                    posts.append(post)
+                else:
+                    logger.warning(f"could not retrieve post from {post_url}")
+
+            logger.info(f"{len(posts)} posts retrieved from list")
+
+        if url:
+            logger.info(f"Extracting posts from '{url}'")
+            extracted_posts = await extractor.get_posts(
+                url=url,
+                known_post_ids=None if full_rescan else exporter.state,
+                stop_after_known=stop_after_known,
+            )
+
+            if extracted_posts:
+                logger.info(f"{len(extracted_posts)} posts retrieved via url")
+                extracted_posts.reverse()
+
+                posts += extracted_posts
+            elif posts:
+                logger.info(f"No addtional posts could be retrieved from '{url}'")
+            else:
+                logger.info(f"No posts could be retrieved from '{url}'")
+
+        await exporter.export_posts(posts=posts)
+    finally:
+        exporter.close()
+        log_request_stats(transport=transport)
+        await transport.aclose()
+
+
+def materialize_pack(
+    output_path: str, target_path: str, post_ids: Iterable[str] = None
+) -> int:
+    pack = PostPack(pack_file=os.path.join(output_path, PACK_FILE))
+
+    try:
+        return pack.materialize(output_path=target_path, post_ids=post_ids)
+    finally:
+        pack.close()
 
 
 def parent_is_writable(path: str) -> bool:
@@ -66,6 +561,16 @@ def parent_is_writable(path: str) -> bool:
     return os.path.isdir(parent) and os.access(parent, os.W_OK)
 
 
+def prepare_output_dir(output_path: str) -> bool:
+    if not os.path.isdir(output_path):
+        if parent_is_writable(output_path):
+            os.mkdir(output_path)
+        else:
+            return False
+
+    return True
+
+
 def main():
     global logger
     logging.basicConfig(level="INFO", format="%(asctime)s %(levelname)s: %(message)s")
@@ -88,7 +593,7 @@ def main():
         "--output-dir",
         metavar="<output_dir>",
         dest="output_path",
-        required=True,
+        required=False,
         help="The directory to write the exported posts to",
     )
     parser.add_argument(
@@ -115,12 +620,427 @@ def main():
         required=False,
         help="A optinal file containing post-id's or URLs to export",
     )
+    parser.add_argument(
+        "--archive-journal",
+        dest="archive_journal",
+        action="store_true",
+        help="Append exported posts to a journal next to the archive file instead of rewriting the archive file after every post",
+    )
+    parser.add_argument(
+        "--stop-after-known",
+        metavar="<count>",
+        dest="stop_after_known",
+        type=int,
+        default=10,
+        help="Stop crawling a channel after this many already archived posts in a row (default: 10)",
+    )
+    parser.add_argument(
+        "--full-rescan",
+        dest="full_rescan",
+        action="store_true",
+        help="Crawl all posts of a channel, even after already archived posts were found",
+    )
+    parser.add_argument(
+        "--stream",
+        dest="stream",
+        action="store_true",
+        help="Export posts while the channel is still being crawled instead of collecting all posts first",
+    )
+    parser.add_argument(
+        "--no-resume",
+        dest="resume_crawl",
+        action="store_false",
+        help="Start the crawl over instead of continuing an interrupted crawl of the channel",
+    )
+    parser.add_argument(
+        "--init-data-ttl",
+        metavar="<seconds>",
+        dest="init_data_ttl",
+        type=float,
+        default=INIT_DATA_TTL,
+        help=f"Reuse the API key and browse request of a channel for this many seconds instead of loading the channel page (default: {INIT_DATA_TTL}, 0 disables)",
+    )
+    parser.add_argument(
+        "--pool-size",
+        metavar="<connections>",
+        dest="pool_size",
+        type=int,
+        default=16,
+        help="Maximum number of pooled keep-alive connections per host (default: 16)",
+    )
+    parser.add_argument(
+        "--max-downloads",
+        metavar="<downloads>",
+        dest="max_downloads",
+        type=int,
+        default=8,
+        help="Maximum number of concurrent media downloads (default: 8)",
+    )
+    parser.add_argument(
+        "--max-host-downloads",
+        metavar="<downloads>",
+        dest="max_host_downloads",
+        type=int,
+        default=4,
+        help="Maximum number of concurrent media downloads per host (default: 4)",
+    )
+    parser.add_argument(
+        "--post-workers",
+        metavar="<workers>",
+        dest="post_workers",
+        type=int,
+        default=1,
+        help="Number of posts from '--post-ids-file' to fetch in parallel (default: 1)",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        metavar="<workers>",
+        dest="parse_workers",
+        type=int,
+        default=0,
+        help="Number of processes parsing and rendering the posts from '--post-ids-file' (default: 0, parse in the fetching threads)",
+    )
+    parser.add_argument(
+        "--backend",
+        dest="backend",
+        choices=["sync", "async"],
+        default="sync",
+        help="Use the threaded (sync) or the asyncio (async, requires aiohttp) network backend (default: sync)",
+    )
+    parser.add_argument(
+        "--max-requests",
+        metavar="<requests>",
+        dest="max_requests",
+        type=int,
+        default=64,
+        help="Maximum number of in-flight requests of the async backend or batch mode (default: 64)",
+    )
+    parser.add_argument(
+        "--max-retries",
+        metavar="<retries>",
+        dest="max_retries",
+        type=int,
+        default=5,
+        help="Maximum number of retries of a throttled or failed request (default: 5)",
+    )
+    parser.add_argument(
+        "--compact-json",
+        dest="compact_json",
+        action="store_true",
+        help="Write post.json files without indentation",
+    )
+    parser.add_argument(
+        "--media-store",
+        dest="media_store",
+        action="store_true",
+        help="Store downloaded media once in '<output-dir>/.media' and link it into the post directories",
+    )
+    parser.add_argument(
+        "--output-format",
+        dest="output_format",
+        choices=OUTPUT_FORMATS,
+        default="directories",
+        help="Write every post into its own directory or all posts of the output dir into one 'posts.sqlite' pack (default: directories)",
+    )
+    parser.add_argument(
+        "--materialize",
+        metavar="<target-dir>",
+        dest="materialize_path",
+        required=False,
+        help="Write the posts packed in '<output-dir>/posts.sqlite' as post directories to this directory and exit",
+    )
+    parser.add_argument(
+        "--rerender",
+        dest="rerender",
+        action="store_true",
+        help="Rewrite the post.txt files of '<output-dir>' from their post.json without requesting anything and exit",
+    )
+    parser.add_argument(
+        "--rerender-workers",
+        metavar="<workers>",
+        dest="rerender_workers",
+        type=int,
+        default=None,
+        help="Number of processes rendering posts with '--rerender' (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="<cache-dir>",
+        dest="cache_dir",
+        required=False,
+        help="Record channel pages, post pages and browse responses in a response cache in this directory",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        metavar="<seconds>",
+        dest="cache_ttl",
+        type=float,
+        default=0,
+        help="Answer requests from '--cache-dir' with responses younger than this many seconds (default: 0, always refetch and record)",
+    )
+    parser.add_argument(
+        "--replay",
+        dest="replay",
+        action="store_true",
+        help="Only use responses from '--cache-dir' instead of requesting them from YouTube",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="<metrics-file>",
+        dest="metrics_file",
+        required=False,
+        help="Write timings and counters of the run as JSON to this file",
+    )
+    parser.add_argument(
+        "--prometheus-file",
+        metavar="<prometheus-file>",
+        dest="prometheus_file",
+        required=False,
+        help="Write timings and counters of the run to this file in the Prometheus text format",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="<profile-file>",
+        dest="profile_file",
+        required=False,
+        help="Run under cProfile and write the stats to this file",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-file",
+        metavar="<batch-file>",
+        dest="batch_file",
+        required=False,
+        help="A file listing one '<youtube-channel-url> <output_dir> [<archive_file>]' per line to export in one run",
+    )
+    parser.add_argument(
+        "--channel-workers",
+        metavar="<workers>",
+        dest="channel_workers",
+        type=int,
+        default=4,
+        help="Number of channels of '--batch-file' or '--watch-file' to export in parallel (default: 4)",
+    )
+    parser.add_argument(
+        "-w",
+        "--watch-file",
+        metavar="<watch-file>",
+        dest="watch_file",
+        required=False,
+        help="Keep running and poll the channels of this file, formatted like '--batch-file', for new posts until stopped",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        metavar="<seconds>",
+        dest="watch_interval",
+        type=float,
+        default=WATCH_INTERVAL,
+        help=f"Seconds between two polls of a channel without an 'interval=<seconds>' in the watch file (default: {WATCH_INTERVAL})",
+    )
+    parser.add_argument(
+        "--watch-jitter",
+        metavar="<fraction>",
+        dest="watch_jitter",
+        type=float,
+        default=WATCH_JITTER,
+        help=f"Randomly shorten or lengthen every interval by up to this fraction (default: {WATCH_JITTER})",
+    )
+    parser.add_argument(
+        "--watch-pages",
+        metavar="<pages>",
+        dest="watch_pages",
+        type=int,
+        default=WATCH_PAGES,
+        help=f"Number of pages checked for new posts per poll, more are loaded while they only hold new posts (default: {WATCH_PAGES})",
+    )
+    parser.add_argument(
+        "--status-file",
+        metavar="<status-file>",
+        dest="status_file",
+        required=False,
+        help="Write the last poll, last new post and lag of every watched channel as JSON to this file",
+    )
     parser.add_argument("--version", action="version", version="%(prog)s 1.0.2")
 
     args = parser.parse_args()
 
+    metrics = Metrics()
+    profiler = cProfile.Profile() if args.profile_file else None
+
+    try:
+        if profiler:
+            profiler.runcall(run, args=args, metrics=metrics)
+        else:
+            run(args=args, metrics=metrics)
+    except ArchiveError as error:
+        logger.error(f"{error}")
+        exit(1)
+    finally:
+        if profiler:
+            write_profile(profiler=profiler, profile_file=args.profile_file)
+
+        metrics.log_summary()
+
+        if args.metrics_file:
+            metrics.write_report(report_file=args.metrics_file)
+
+        if args.prometheus_file:
+            metrics.write_prometheus(prometheus_file=args.prometheus_file)
+
+
+def write_profile(profiler: cProfile.Profile, profile_file: str) -> None:
+    profiler.dump_stats(profile_file)
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(20)
+
+    logger.info(f"Profile written to '{profile_file}':\n{summary.getvalue()}")
+
+
+def run(args: argparse.Namespace, metrics: Metrics) -> None:
+    if args.materialize_path:
+        if not args.output_path or not os.path.isfile(
+            os.path.join(args.output_path, PACK_FILE)
+        ):
+            logger.error(f"'--materialize' requires an '--output-dir' containing a '{PACK_FILE}'")
+            exit(1)
+
+        if not prepare_output_dir(output_path=args.materialize_path):
+            logger.error(
+                f"Target dir '{args.materialize_path}' does not exist & couldn't be created"
+            )
+            exit(1)
+
+        post_ids = None
+        if args.posts_file:
+            post_ids = iter_post_ids(posts_file=args.posts_file)
+
+        materialized = materialize_pack(
+            output_path=args.output_path,
+            target_path=args.materialize_path,
+            post_ids=post_ids,
+        )
+
+        logger.info(f"Materialized {materialized} posts into '{args.materialize_path}'")
+        return
+
+    if args.rerender:
+        if not args.output_path or not os.path.isdir(args.output_path):
+            logger.error("'--rerender' requires an existing '--output-dir'")
+            exit(1)
+
+        rerender_posts(
+            output_path=args.output_path,
+            workers=args.rerender_workers,
+            metrics=metrics,
+        )
+        return
+
+    if args.replay and not args.cache_dir:
+        logger.error(f"'--replay' requires '--cache-dir'")
+        exit(1)
+
+    response_cache = None
+    if args.cache_dir:
+        response_cache = ResponseCache(
+            cache_dir=args.cache_dir, ttl=args.cache_ttl, replay=args.replay
+        )
+
+    if args.watch_file:
+        if not os.path.isfile(args.watch_file):
+            logger.error(f"given watch file '{args.watch_file}' could not be found")
+            exit(1)
+
+        if response_cache:
+            # polls have to see new posts, cached browse responses would hide them
+            logger.warning(f"'--cache-dir' is not used in watch mode")
+            response_cache.close()
+
+        if args.backend == "async":
+            logger.warning(f"'--backend async' is not supported in watch mode")
+
+        channels = load_batch_file(file=args.watch_file)
+
+        for channel in channels:
+            if not prepare_output_dir(output_path=channel.output_path):
+                logger.error(
+                    f"Output dir '{channel.output_path}' does not exist & couldn't be created"
+                )
+                exit(1)
+
+        watched = watch_channels(
+            channels=channels,
+            cookies=initialize_cookies(cookies_file=args.cookie_file),
+            status_file=args.status_file,
+            interval=args.watch_interval,
+            jitter=args.watch_jitter,
+            max_pages=args.watch_pages,
+            stop_after_known=args.stop_after_known,
+            init_data_ttl=args.init_data_ttl,
+            channel_workers=args.channel_workers,
+            max_requests=args.max_requests,
+            pool_size=args.pool_size,
+            max_retries=args.max_retries,
+            archive_journal=args.archive_journal,
+            max_downloads=args.max_downloads,
+            max_host_downloads=args.max_host_downloads,
+            compact_json=args.compact_json,
+            media_store=args.media_store,
+            output_format=args.output_format,
+            metrics=metrics,
+        )
+
+        if not watched:
+            exit(1)
+
+        return
+
+    if args.batch_file:
+        if not os.path.isfile(args.batch_file):
+            logger.error(f"given batch file '{args.batch_file}' could not be found")
+            exit(1)
+
+        if args.backend == "async":
+            logger.warning(f"'--backend async' is not supported in batch mode")
+
+        results = export_batch(
+            channels=load_batch_file(file=args.batch_file),
+            cookies=initialize_cookies(cookies_file=args.cookie_file),
+            channel_workers=args.channel_workers,
+            max_requests=args.max_requests,
+            pool_size=args.pool_size,
+            max_retries=args.max_retries,
+            archive_journal=args.archive_journal,
+            full_rescan=args.full_rescan,
+            stop_after_known=args.stop_after_known,
+            stream=args.stream,
+            resume_crawl=args.resume_crawl,
+            init_data_ttl=args.init_data_ttl,
+            max_downloads=args.max_downloads,
+            max_host_downloads=args.max_host_downloads,
+            compact_json=args.compact_json,
+            media_store=args.media_store,
+            output_format=args.output_format,
+            response_cache=response_cache,
+            metrics=metrics,
+        )
+
+        if response_cache:
+            response_cache.close()
+
+        if any(result.error for result in results):
+            exit(1)
+
+        return
+
     if not args.url and not args.posts_file:
-        logger.error(f"At least one of '--url' or '--post-ids-file' is required")
+        logger.error(
+            f"At least one of '--url', '--post-ids-file', '--batch-file' or '--watch-file' is required"
+        )
+        exit(1)
+
+    if not args.output_path:
+        logger.error(f"'--output-dir' is required")
         exit(1)
 
     url = args.url
@@ -129,14 +1049,11 @@ def main():
     cookies_file = args.cookie_file
     posts_file = args.posts_file
 
-    if not os.path.isdir(output_path):
-        if parent_is_writable(output_path):
-            os.mkdir(output_path)
-        else:
-            logger.error(
-                f"Output dir '{output_path}' does not exist & couldn't be created"
-            )
-            exit(1)
+    if not prepare_output_dir(output_path=output_path):
+        logger.error(
+            f"Output dir '{output_path}' does not exist & couldn't be created"
+        )
+        exit(1)
 
     archive_file_default = os.path.join(output_path, "archive.json")
     if archive_file:
@@ -153,21 +1070,74 @@ def main():
         logger.warning(f"given posts file '{posts_file}' could not be found")
         posts_file = ""
 
-    if posts_file:
-        post_ids = load_posts_file(file=posts_file)
-    else:
-        post_ids = None
-
     cookies = initialize_cookies(cookies_file=cookies_file)
 
+    if args.backend == "async":
+        if args.stream:
+            logger.warning(f"'--stream' is not supported by the async backend")
+
+        asyncio.run(
+            export_posts_async(
+                url=url,
+                cookies=cookies,
+                output_path=output_path,
+                archive_file=archive_file,
+                post_ids=list(iter_post_ids(posts_file=posts_file)) if posts_file else None,
+                archive_journal=args.archive_journal,
+                full_rescan=args.full_rescan,
+                stop_after_known=args.stop_after_known,
+                init_data_ttl=args.init_data_ttl,
+                max_downloads=args.max_downloads,
+                max_requests=args.max_requests,
+                max_retries=args.max_retries,
+                compact_json=args.compact_json,
+                media_store=args.media_store,
+                output_format=args.output_format,
+                response_cache=response_cache,
+                metrics=metrics,
+            )
+        )
+
+        if response_cache:
+            response_cache.close()
+
+        return
+
     export_posts(
         url=url,
         cookies=cookies,
         output_path=output_path,
         archive_file=archive_file,
-        post_ids=post_ids,
+        post_id_reader=(
+            PostIdReader(
+                posts_file=posts_file,
+                checkpoint_file=os.path.join(output_path, POST_IDS_CHECKPOINT_FILE),
+            )
+            if posts_file
+            else None
+        ),
+        archive_journal=args.archive_journal,
+        full_rescan=args.full_rescan,
+        stop_after_known=args.stop_after_known,
+        stream=args.stream,
+        resume_crawl=args.resume_crawl,
+        init_data_ttl=args.init_data_ttl,
+        pool_size=args.pool_size,
+        max_downloads=args.max_downloads,
+        max_host_downloads=args.max_host_downloads,
+        post_workers=args.post_workers,
+        parse_workers=args.parse_workers,
+        max_retries=args.max_retries,
+        compact_json=args.compact_json,
+        media_store=args.media_store,
+        output_format=args.output_format,
+        response_cache=response_cache,
+        metrics=metrics,
     )
 
+    if response_cache:
+        response_cache.close()
+
 
 if __name__ == "__main__":
     main()
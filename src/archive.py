@@ -0,0 +1,162 @@
+import os
+import time
+import logging
+
+from src import codec
+
+logger = logging.getLogger(name=__name__)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class PostArchive:
+    def __init__(self, entries: dict[str, str] = None) -> None:
+        # slot ("0001") -> post_id, as stored in the archive file
+        self.slots: dict[str, str] = dict()
+        # post_id -> slot, used for membership checks
+        self.index: dict[str, str] = dict()
+
+        self.last_index = 0
+
+        for slot, post_id in (entries or dict()).items():
+            self.add(slot=slot, post_id=post_id)
+
+    def __contains__(self, post_id: str) -> bool:
+        return post_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def get_slot(self, post_id: str) -> str | None:
+        return self.index.get(post_id)
+
+    def next_slot(self) -> str:
+        return str(self.last_index + 1).zfill(4)
+
+    def allocate_slot(self) -> str:
+        # reserves the slot for a post that is archived once its media is done
+        self.last_index += 1
+
+        return str(self.last_index).zfill(4)
+
+    def add(self, slot: str, post_id: str) -> None:
+        try:
+            slot_index = int(slot)
+        except ValueError:
+            logger.warning(f"Ignoring invalid archive entry '{slot}': '{post_id}'")
+            return
+
+        self.slots[slot] = post_id
+        self.index.setdefault(post_id, slot)
+
+        if slot_index > self.last_index:
+            self.last_index = slot_index
+
+    def to_dict(self) -> dict[str, str]:
+        return dict(self.slots)
+
+
+def write_snapshot(archive_file: str, archive: PostArchive) -> None:
+    temp_file = f"{archive_file}.tmp"
+
+    with open(temp_file, "wb") as f:
+        f.write(codec.dumps(archive.to_dict()))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temp_file, archive_file)
+
+
+class ArchiveJournal:
+    def __init__(
+        self,
+        journal_file: str,
+        sync_every: int = 50,
+        sync_interval: float = 5.0,
+        compact_every: int = 1000,
+    ) -> None:
+        self.journal_file = journal_file
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compact_every = compact_every
+
+        self.entries = 0
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+        self.handle = None
+
+    def replay(self, archive: PostArchive) -> int:
+        replayed = 0
+
+        if not os.path.isfile(self.journal_file):
+            return replayed
+
+        with open(self.journal_file, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+
+                try:
+                    entry: dict[str, str] = codec.loads(line)
+                except ValueError:
+                    # a crash mid-append can only leave the last line truncated
+                    logger.warning("Ignoring incomplete archive journal entry")
+                    continue
+
+                for slot, post_id in entry.items():
+                    archive.add(slot=slot, post_id=post_id)
+                    replayed += 1
+
+        self.entries = replayed
+
+        return replayed
+
+    def append(self, slot: str, post_id: str) -> bool:
+        if not self.handle:
+            self.handle = open(self.journal_file, "ab")
+
+            # start on a fresh line if a previous run left a truncated entry
+            if self.handle.tell() > 0:
+                with open(self.journal_file, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        self.handle.write(b"\n")
+
+        self.handle.write(codec.dumps({slot: post_id}, pretty=False) + b"\n")
+        self.handle.flush()
+
+        self.entries += 1
+        self.unsynced += 1
+
+        if (
+            self.unsynced >= self.sync_every
+            or time.monotonic() - self.last_sync >= self.sync_interval
+        ):
+            self.sync()
+
+        return self.entries >= self.compact_every
+
+    def sync(self) -> None:
+        if self.handle and self.unsynced:
+            os.fsync(self.handle.fileno())
+
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def reset(self) -> None:
+        self.close()
+
+        if os.path.isfile(self.journal_file):
+            os.remove(self.journal_file)
+
+        self.entries = 0
+
+    def close(self) -> None:
+        if self.handle:
+            self.sync()
+            self.handle.close()
+            self.handle = None
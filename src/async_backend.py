@@ -0,0 +1,614 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import urllib.parse
+from collections.abc import AsyncIterator, Awaitable, Callable, Container
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from src import codec
+from src.transport import Transport, ACCEPT_ENCODING, YOUTUBE_ORIGIN
+from src.response_cache import ResponseCache
+from src.metrics import Metrics, get_request_kind
+from src.ratelimit import (
+    RetryPolicy,
+    AsyncAdaptiveLimiter,
+    RETRY_STATUS_CODES,
+    THROTTLE_STATUS_CODES,
+)
+from src.extractor import PostExtractor, InitData
+from src.init_data_cache import InitDataCache
+from src.content_exporter import ContentExporter, MEDIA_CHUNK_SIZE
+from src.post_records import PostRecord
+
+logger = logging.getLogger(name=__name__)
+
+
+class AsyncTransport(Transport):
+    def __init__(
+        self,
+        cookies: dict = None,
+        max_requests: int = 64,
+        max_host_requests: int = 16,
+        retry_policy: RetryPolicy = None,
+        origin: str = YOUTUBE_ORIGIN,
+        response_cache: ResponseCache = None,
+        metrics: Metrics = None,
+    ) -> None:
+        if aiohttp is None:
+            raise RuntimeError(
+                "the async backend requires aiohttp ('pip install aiohttp')"
+            )
+
+        super().__init__(
+            cookies=cookies,
+            retry_policy=retry_policy,
+            origin=origin,
+            response_cache=response_cache,
+            metrics=metrics,
+        )
+
+        self.max_requests = max_requests
+        self.max_host_requests = max_host_requests
+
+        self.request_limit = asyncio.Semaphore(max_requests)
+        self.async_host_limiters: dict[str, AsyncAdaptiveLimiter] = dict()
+        self.session = None
+
+    def get_async_host_limiter(self, url: str) -> AsyncAdaptiveLimiter:
+        host = urllib.parse.urlparse(url).netloc
+
+        limiter = self.async_host_limiters.get(host)
+
+        if not limiter:
+            limiter = AsyncAdaptiveLimiter(maximum=self.max_host_requests)
+            self.async_host_limiters[host] = limiter
+
+        return limiter
+
+    async def open(self) -> None:
+        if not self.session:
+            self.session = aiohttp.ClientSession(
+                headers={"Accept-Encoding": ACCEPT_ENCODING},
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_requests, limit_per_host=self.max_host_requests
+                ),
+            )
+
+    async def fetch(
+        self,
+        method: str,
+        url: str,
+        api: bool = False,
+        cookies: bool = False,
+        data: str = None,
+        cache: bool = False,
+    ) -> tuple[int, bytes]:
+        if cache and self.response_cache:
+            cached = self.get_cached_response(method=method, url=url, data=data)
+
+            if cached is not None:
+                return cached.status, cached.content
+
+        status, headers, content = await self.fetch_response(
+            method=method, url=url, api=api, cookies=cookies, data=data
+        )
+
+        if cache and self.response_cache and status == 200:
+            self.response_cache.put(
+                method=method,
+                url=url,
+                data=data,
+                status=status,
+                headers=headers,
+                content=content,
+                identity=self.cache_identity,
+            )
+
+        return status, content
+
+    async def fetch_response(
+        self,
+        method: str,
+        url: str,
+        api: bool = False,
+        cookies: bool = False,
+        data: str = None,
+        headers: dict[str, str] = None,
+        sink: Callable[[int, bytes], Awaitable[None]] = None,
+    ) -> tuple[int, dict[str, str], bytes]:
+        # The body of a 200 or 206 response is passed to the sink chunk by
+        # chunk instead of being returned. A response that fails while it is
+        # streamed isn't retried, the sink already holds a part of it.
+        await self.open()
+
+        limiter = self.get_async_host_limiter(url=url)
+        kind = get_request_kind(url=url, origin=self.origin)
+
+        attempt = 0
+        while True:
+            self.count(kind=kind, requests=1)
+
+            request_headers = {
+                **(self.get_api_headers() if api else {}),
+                **(headers if headers else {}),
+            }
+
+            status = None
+            response_headers: dict[str, str] = dict()
+            content = b""
+            size = 0
+            streamed = False
+            error = None
+
+            await limiter.acquire()
+            start = time.perf_counter()
+            try:
+                async with self.request_limit:
+                    async with self.session.request(
+                        method=method,
+                        url=url,
+                        headers=request_headers,
+                        cookies=self.cookies if api or cookies else None,
+                        data=data,
+                        timeout=aiohttp.ClientTimeout(total=self.timeout),
+                    ) as response:
+                        status = response.status
+                        response_headers = response.headers.copy()
+
+                        if sink is not None and status in [200, 206]:
+                            async for chunk in response.content.iter_chunked(
+                                MEDIA_CHUNK_SIZE
+                            ):
+                                streamed = True
+                                size += len(chunk)
+                                await sink(status, chunk)
+                        else:
+                            content = await response.read()
+                            size = len(content)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as request_error:
+                error = request_error
+            finally:
+                await limiter.release(
+                    throttled=error is not None or status in THROTTLE_STATUS_CODES
+                )
+
+            self.trace(
+                method=method,
+                url=url,
+                kind=kind,
+                status=status,
+                size=size,
+                duration=time.perf_counter() - start,
+            )
+
+            retry = (
+                error is not None and not streamed
+            ) or status in RETRY_STATUS_CODES
+
+            if error is not None:
+                self.count(kind=kind, errors=1)
+            elif status in THROTTLE_STATUS_CODES:
+                self.count(kind=kind, throttled=1)
+
+            if not retry or attempt >= self.retry_policy.max_retries:
+                if error is not None:
+                    raise error
+
+                return status, response_headers, content
+
+            delay = self.retry_policy.get_delay(
+                attempt=attempt, retry_after=response_headers.get("Retry-After")
+            )
+
+            logger.debug(
+                f"Retrying {method} {url} in {delay:.1f}s - {error if error else status}"
+            )
+
+            self.count(kind=kind, retries=1)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+
+class AsyncPostExtractor(PostExtractor):
+    def __init__(
+        self, transport: AsyncTransport, init_data_cache: InitDataCache = None
+    ) -> None:
+        super().__init__(transport=transport, init_data_cache=init_data_cache)
+
+    async def _get_posts_init(self, endpoint: str, body: dict) -> list[dict] | None:
+        status, content = await self.transport.fetch(
+            method="POST",
+            url=endpoint,
+            api=True,
+            cache=True,
+            data=codec.dumps(body, pretty=False),
+        )
+
+        if status != 200:
+            logger.warning(f"error loading community tab - response-code: {status}")
+            return None
+
+        with self.metrics.timer("parse:browse"):
+            return self._parse_posts_init(response_content=codec.loads(content))
+
+    async def _get_posts(self, endpoint: str, body: dict) -> list[dict] | None:
+        status, content = await self.transport.fetch(
+            method="POST",
+            url=endpoint,
+            api=True,
+            cache=True,
+            data=codec.dumps(body, pretty=False),
+        )
+
+        if status != 200:
+            logger.warning(f"error loading further posts - response-code: {status}")
+            return None
+
+        with self.metrics.timer("parse:browse"):
+            return self._parse_posts(response_content=codec.loads(content))
+
+    async def extract_init_info(self, url: str) -> InitData:
+        status, content = await self.transport.fetch(
+            method="GET", url=url, cookies=True, cache=True
+        )
+
+        if status == 200:
+            with self.metrics.timer("parse:channel_page"):
+                return self._parse_init_info(html=content.decode("utf-8"))
+
+        return InitData()
+
+    async def _get_first_page(
+        self, url: str, refresh: bool = False
+    ) -> tuple[str, dict, list[dict] | None]:
+        init_data = None if refresh else self.get_cached_init_info(url=url)
+        cached = init_data is not None
+
+        if not cached:
+            init_data = await self.extract_init_info(url=url)
+            self.cache_init_info(url=url, init_data=init_data)
+
+        if not init_data.api_key or not init_data.request_body:
+            return "", dict(), None
+
+        endpoint = self.get_browse_endpoint(init_data=init_data)
+        request_body = dict(init_data.request_body)
+
+        init_posts = await self._get_posts_init(endpoint=endpoint, body=request_body)
+
+        if init_posts is None and cached:
+            self.discard_init_info(url=url)
+            return await self._get_first_page(url=url, refresh=True)
+
+        return endpoint, request_body, init_posts
+
+    async def iter_posts(
+        self,
+        url: str,
+        known_post_ids: Container[str] = None,
+        stop_after_known: int = 0,
+    ) -> AsyncIterator[list[dict]]:
+        early_stop = known_post_ids is not None and stop_after_known > 0
+        known_run = 0
+
+        endpoint, request_body, init_posts = await self._get_first_page(url=url)
+
+        if init_posts:
+            token = self.get_continuation_token(
+                continuation_container=init_posts[-1]
+            )
+
+            # a first page without a continuation holds all posts of the channel
+            if init_posts[-1].get("continuationItemRenderer"):
+                init_posts = init_posts[:-1]
+
+            if early_stop:
+                known_run = self._count_known_run(
+                    posts=init_posts,
+                    known_post_ids=known_post_ids,
+                    known_run=known_run,
+                )
+
+            yield self._filter_new_posts(posts=init_posts)
+
+            while token and not (early_stop and known_run >= stop_after_known):
+                request_body["continuation"] = token
+
+                batch_posts: list[dict] | None = await self._get_posts(
+                    endpoint=endpoint, body=request_body
+                )
+
+                token = ""
+
+                if batch_posts:
+                    if batch_posts[-1].get("continuationItemRenderer"):
+                        token = self.get_continuation_token(
+                            continuation_container=batch_posts[-1]
+                        )
+
+                        batch_posts = batch_posts[:-1]
+
+                    if early_stop:
+                        known_run = self._count_known_run(
+                            posts=batch_posts,
+                            known_post_ids=known_post_ids,
+                            known_run=known_run,
+                        )
+
+                    yield self._filter_new_posts(posts=batch_posts)
+
+            if token:
+                logger.info(
+                    f"Stopped crawling after {known_run} already archived posts in a row"
+                )
+
+    async def get_posts(
+        self,
+        url: str,
+        known_post_ids: Container[str] = None,
+        stop_after_known: int = 0,
+    ) -> list[dict]:
+        posts: list[dict] = list()
+
+        async for page in self.iter_posts(
+            url=url,
+            known_post_ids=known_post_ids,
+            stop_after_known=stop_after_known,
+        ):
+            posts += page
+
+        return posts
+
+    async def get_individual_post(self, url: str) -> dict | None:
+        try:
+            status, content = await self.transport.fetch(
+                method="GET", url=url, api=True, cache=True
+            )
+        except Exception as error:
+            logger.warning(f"error extracting '{url}' - {error}")
+            return None
+
+        if status == 200:
+            with self.metrics.timer("parse:post_page"):
+                post = self._parse_individual_post(html=content.decode("utf-8"))
+
+            if post:
+                post_id = self.get_post_id(post=post)
+
+                if post_id and self._claim_post_id(post_id=post_id):
+                    return post
+        else:
+            logger.warning(f"error extracting '{url}' - response-code: {status}")
+
+    async def get_individual_posts(
+        self, urls: list[str]
+    ) -> list[tuple[str, dict | None]]:
+        posts = await asyncio.gather(
+            *[self.get_individual_post(url=url) for url in urls]
+        )
+
+        return list(zip(urls, posts))
+
+
+class AsyncContentExporter(ContentExporter):
+    def __init__(
+        self,
+        output_path: str,
+        archive_file: str,
+        transport: AsyncTransport,
+        archive_journal: bool = False,
+        max_downloads: int = 8,
+        compact_json: bool = False,
+        media_store: bool = False,
+        output_format: str = "directories",
+    ) -> None:
+        # the download pool of the sync exporter is used for disk writes
+        super().__init__(
+            output_path=output_path,
+            archive_file=archive_file,
+            archive_journal=archive_journal,
+            transport=transport,
+            max_downloads=max_downloads,
+            compact_json=compact_json,
+            media_store=media_store,
+            output_format=output_format,
+        )
+
+    async def _run_in_executor(self, func, **kwargs):
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(
+            self.download_pool, functools.partial(func, **kwargs)
+        )
+
+    def _write_chunk(self, part_file: str, content: bytes, mode: str) -> None:
+        with open(part_file, mode) as f:
+            f.write(content)
+
+    def _finish_part_file(self, part_file: str, file: str) -> None:
+        # an empty body doesn't reach the sink
+        if not os.path.isfile(part_file):
+            open(part_file, "wb").close()
+
+        os.replace(part_file, file)
+
+    async def download_image(self, url: str, file_path: str, filename: str) -> bool:
+        file = os.path.join(file_path, filename)
+        part_file = f"{file}.part"
+
+        if self.media_store and await self._run_in_executor(
+            self._link_stored_media, url=url, file=file
+        ):
+            self.metrics.count("media", result="linked")
+            return True
+
+        headers = await self._run_in_executor(
+            self._get_validation_headers, url=url, file=file
+        )
+
+        # resume an interrupted download
+        resume_from = 0
+        if not headers and os.path.isfile(part_file):
+            resume_from = os.path.getsize(part_file)
+            headers["Range"] = f"bytes={resume_from}-"
+
+            with self.validators_lock:
+                etag = self.media_validators.get(url, {}).get("etag")
+            if etag:
+                headers["If-Range"] = etag
+
+        written = 0
+
+        async def write_chunk(status: int, chunk: bytes) -> None:
+            nonlocal written
+
+            # a 200 replaces the partial file, a 206 continues it
+            mode = "ab" if status == 206 or written else "wb"
+            await self._run_in_executor(
+                self._write_chunk, part_file=part_file, content=chunk, mode=mode
+            )
+            written += len(chunk)
+
+        try:
+            with self.metrics.timer("write_media"):
+                status, response_headers, _ = await self.transport.fetch_response(
+                    method="GET", url=url, headers=headers, sink=write_chunk
+                )
+        except Exception as error:
+            logger.warning(f"Image could not be downloaded from: {url} - {error}")
+            self.metrics.count("media", result="failed")
+            return False
+
+        if status == 304:
+            self.metrics.count("media", result="not_modified")
+            return True
+
+        if status == 416 and resume_from:
+            # the partial file is unusable, start over
+            await self._run_in_executor(os.remove, path=part_file)
+            return await self.download_image(
+                url=url, file_path=file_path, filename=filename
+            )
+
+        if status not in [200, 206]:
+            logger.warning(
+                f"Image could not be downloaded from: {url} - response-code: {status}"
+            )
+            self.metrics.count("media", result="failed")
+            return False
+
+        await self._run_in_executor(
+            self._finish_part_file, part_file=part_file, file=file
+        )
+
+        self._store_validators(url=url, headers=response_headers)
+        await self._run_in_executor(self._store_media, url=url, file=file)
+        self.metrics.count("media", result="downloaded")
+
+        return True
+
+    async def _export_post(
+        self, post: dict, post_content: PostRecord, post_path: str
+    ) -> list[tuple[str, str]]:
+        await self._run_in_executor(
+            self._write_post_files,
+            post=post,
+            post_content=post_content,
+            post_path=post_path,
+        )
+
+        media_files = self.get_media_files(post_content=post_content)
+
+        results = await asyncio.gather(
+            *[
+                self.download_image(url=url, file_path=post_path, filename=filename)
+                for url, filename in media_files
+            ]
+        )
+
+        return [media for media, success in zip(media_files, results) if not success]
+
+    async def retry_incomplete_posts(self) -> None:
+        if self.incomplete_posts:
+            logger.info(f"Retrying the missing media of {len(self.incomplete_posts)} posts")
+
+        for post_id, entry, post_path in self._iter_incomplete_posts():
+            media_files = [(url, filename) for url, filename in entry["media"]]
+
+            results = await asyncio.gather(
+                *[
+                    self.download_image(url=url, file_path=post_path, filename=filename)
+                    for url, filename in media_files
+                ]
+            )
+
+            await self._run_in_executor(
+                self._finish_incomplete_post,
+                post_id=post_id,
+                entry=entry,
+                post_path=post_path,
+                failed_media=[
+                    media for media, success in zip(media_files, results) if not success
+                ],
+            )
+
+    async def export_posts(self, posts: list[dict]):
+        exports: list[tuple[str, str, str, asyncio.Task]] = list()
+
+        for index, post_dict in enumerate(posts, start=1):
+            logger.info(f"Exporting post {index}/{len(posts)}")
+
+            post, post_content = self._get_post_content(post_dict=post_dict)
+
+            if post_content.post_id in self.state:
+                logger.info(
+                    f"Skipping post '{post_content.post_id}' - already exported"
+                )
+                self.metrics.count("posts", result="skipped")
+                continue
+
+            post_num = self.state.allocate_slot()
+            dir_name = self._get_post_dir_name(post_content=post_content)
+
+            post_path = self._get_post_path(dir_name=dir_name)
+
+            exports.append(
+                (
+                    post_content.post_id,
+                    post_num,
+                    dir_name,
+                    asyncio.create_task(
+                        self._export_post(
+                            post=post, post_content=post_content, post_path=post_path
+                        )
+                    ),
+                )
+            )
+
+        # posts are archived in order, once all of their media is downloaded
+        for post_id, post_num, dir_name, export in exports:
+            failed_media = await export
+
+            if failed_media:
+                self.failed_media[post_id] = failed_media
+                logger.error(
+                    f"Post '{post_id}': {len(failed_media)} media file(s) could not be downloaded"
+                )
+
+            await self._run_in_executor(
+                self._publish_post,
+                post_id=post_id,
+                slot=post_num,
+                dir_name=dir_name,
+            )
@@ -0,0 +1,61 @@
+import os
+import shlex
+import logging
+from pydantic import BaseModel
+
+logger = logging.getLogger(name=__name__)
+
+
+class BatchChannel(BaseModel):
+    url: str
+    output_path: str
+    archive_file: str = None
+    # seconds between two polls in watch mode, the default interval if unset
+    interval: float = None
+
+
+class ChannelResult(BaseModel):
+    url: str
+    exported_posts: int = 0
+    duration: float = 0
+    error: str = None
+
+
+def load_batch_file(file: str) -> list[BatchChannel]:
+    channels: list[BatchChannel] = list()
+
+    with open(file) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            parts = shlex.split(line)
+            options = [part for part in parts if part.startswith("interval=")]
+            parts = [part for part in parts if part not in options]
+
+            if len(parts) not in [2, 3]:
+                logger.warning(
+                    f"Ignoring line {line_number} of batch file - expected '<url> <output-dir> [<archive-file>] [interval=<seconds>]'"
+                )
+                continue
+
+            channel = BatchChannel(url=parts[0], output_path=parts[1])
+
+            for option in options:
+                try:
+                    channel.interval = float(option.split("=", 1)[1])
+                except ValueError:
+                    logger.warning(
+                        f"Ignoring '{option}' on line {line_number} of batch file - not a number of seconds"
+                    )
+
+            channel.archive_file = (
+                parts[2]
+                if len(parts) == 3
+                else os.path.join(channel.output_path, "archive.json")
+            )
+
+            channels.append(channel)
+
+    return channels
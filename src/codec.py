@@ -0,0 +1,44 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonCodec:
+    name = "json"
+
+    def loads(self, data: bytes | str):
+        return json.loads(data)
+
+    def dumps(self, obj, pretty: bool = True) -> bytes:
+        # written like orjson does, so files don't depend on the installed codec
+        if pretty:
+            return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode(
+            "utf-8"
+        )
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def loads(self, data: bytes | str):
+        return orjson.loads(data)
+
+    def dumps(self, obj, pretty: bool = True) -> bytes:
+        # orjson only supports an indentation of 2 spaces
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+
+
+codec = OrjsonCodec() if orjson else JsonCodec()
+
+
+def loads(data: bytes | str):
+    return codec.loads(data)
+
+
+def dumps(obj, pretty: bool = True) -> bytes:
+    return codec.dumps(obj, pretty=pretty)
@@ -1,43 +1,37 @@
-import json
 import os
+import time
 import logging
 import urllib.parse
-import requests
+import email.utils
+import shutil
+from collections.abc import Iterable, Sized
 from string import Template
-from pydantic import BaseModel
-from threading import Lock
-
-
-class PollOption(BaseModel):
-    votes: str = "0"
-    percentage: str = "0%"
-
-class PostShare(BaseModel):
-    share_author: str = "N/A"
-    share_text: str = ""
-    share_time: str = ""
-    share_post_id: str = ""
-
-
-class PostContent(BaseModel):
-    video_thumbnail_url: str = None
-    video_url: str = None
-    video_title: str = None
-    video_published_time: str = None
-    video_members_only: bool = False
-    members_only: bool = False
-    author: str = ""
-    post_text: str = ""
-    post_published_time: str = ""
-    post_id: str = ""
-    like_count: str = "0"
-    attached_images: list[str] = list()
-    poll: dict[str, PollOption] = dict()
-    share: PostShare = None
+from threading import Lock, BoundedSemaphore
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from src import codec
+from src.transport import Transport
+from src.media_store import MediaStore, MEDIA_STORE_DIR
+from src.archive import PostArchive, ArchiveJournal, ArchiveError, write_snapshot
+from src.post_pack import PostPack, PACK_FILE
+from src.crawl_state import CrawlState
+from src.post_records import PostRecord, extract_post_record, extract_share_record
 
 
 logger = logging.getLogger(name=__name__)
 
+STAGING_DIR = ".staging"
+OUTPUT_FORMATS = ["directories", "pack"]
+MEDIA_VALIDATORS_FILE = ".media-validators.json"
+INCOMPLETE_POSTS_FILE = ".incomplete-media.json"
+
+# runs that try to download the missing media of a post before giving up on it
+MAX_MEDIA_ATTEMPTS = 5
+
+# large enough for =s0 originals of several MB without excessive write calls
+MEDIA_CHUNK_SIZE = 256 * 1024
+
 post_template = Template(
     """$author - $time$members_only
 
@@ -62,336 +56,858 @@ $originalpost
 )
 
 
+def deduplicate_images(images: list[str]) -> list[str]:
+    # keeps the order of the attachment, so post.txt renders the same every time
+    deduplicated_images: dict[str, None] = dict()
+
+    for image in images:
+        if image:
+            url = f"{image.split('=s')[0]}=s0"
+            deduplicated_images[url] = None
+
+    return list(deduplicated_images)
+
+
+def get_post_content(post_dict: dict) -> tuple[dict, PostRecord]:
+    # returns the dict saved as post.json and the extracted post
+    post_common_root = post_dict.get("backstagePostThreadRenderer", {}).get("post", {})
+
+    if "sharedPostRenderer" in post_common_root.keys():
+        shared_post = post_common_root.get("sharedPostRenderer", {})
+
+        post_content = extract_post_record(
+            post=shared_post.get("originalPost", {}).get("backstagePostRenderer", {})
+        )
+        post_content.share = extract_share_record(shared_post=shared_post)
+
+        # the share itself is kept as well, so post.txt can be rendered from post.json
+        return post_common_root, post_content
+
+    post = post_common_root.get("backstagePostRenderer", {})
+
+    return post, extract_post_record(post=post)
+
+
+def get_post_dir_name(post_content: PostRecord) -> str:
+    members_only_tag = "(Members only) " if post_content.members_only else ""
+
+    post_path_id = post_content.post_id
+    if post_content.share and post_content.share.share_post_id:
+        post_path_id = post_content.share.share_post_id
+
+    return f"{members_only_tag}{post_path_id}"
+
+
+def get_media_files(post_content: PostRecord) -> list[tuple[str, str]]:
+    media_files: list[tuple[str, str]] = list()
+
+    for url in deduplicate_images(images=post_content.attached_images):
+        parsed_url = urllib.parse.urlparse(url)
+
+        media_files.append((url, f"{parsed_url.path.strip('/')}.png"))
+
+    if post_content.video_thumbnail_url:
+        media_files.append((post_content.video_thumbnail_url, "video_thumbnail.jpg"))
+
+    return media_files
+
+
+def render_post_text(post_content: PostRecord, images: list[str]) -> str:
+    members_only_tag_post = " - Members only" if post_content.members_only else ""
+
+    linked_video = ""
+    if post_content.video_url:
+        member_only_video = (
+            " (Members only)" if post_content.video_members_only else ""
+        )
+
+        linked_video = f"Linked Video:\n{post_content.video_title}{member_only_video}\n{post_content.video_published_time}\n{post_content.video_url}"
+
+    image_links = ""
+    if images:
+        links = "\n".join(images)
+        image_links = f"Images:\n{links}"
+
+    poll = ""
+    if post_content.poll:
+        option_lines = list()
+        for option, results in post_content.poll.items():
+            votes = f" - {results.votes}" if results.votes else ""
+            percentage = f" - {results.percentage}" if results.percentage else ""
+
+            option_lines.append(f"[{option}]{votes}{percentage}")
+
+        options = "\n".join(option_lines)
+        poll = f"Poll:\n{options}"
+
+    attached_content = "\n\n".join(
+        [item for item in [linked_video, image_links, poll] if item]
+    )
+
+    post_output = post_template.substitute(
+        author=post_content.author,
+        time=post_content.post_published_time,
+        members_only=members_only_tag_post,
+        content=post_content.post_text,
+        attached_content=attached_content,
+        likes=post_content.like_count,
+    )
+
+    if post_content.share:
+        post_output = share_post_template.substitute(
+            author=post_content.share.share_author,
+            time=post_content.share.share_time,
+            content=post_content.share.share_text,
+            originalpost=post_output
+        )
+
+    return post_output
+
+
+class PreparedPost:
+    __slots__ = ("post_id", "dir_name", "post_text", "post_json", "media_files", "timings")
+
+    def __init__(
+        self,
+        post_id: str,
+        dir_name: str,
+        post_text: bytes,
+        post_json: bytes,
+        media_files: list[tuple[str, str]],
+        timings: dict[str, float],
+    ) -> None:
+        self.post_id = post_id
+        self.dir_name = dir_name
+        self.post_text = post_text
+        self.post_json = post_json
+        self.media_files = media_files
+        self.timings = timings
+
+
+def prepare_post(post_dict: dict, compact_json: bool = False) -> PreparedPost:
+    # everything of an export that needs no I/O, so it can run in a worker process
+    start = time.perf_counter()
+    post, post_content = get_post_content(post_dict=post_dict)
+    extracted = time.perf_counter()
+
+    post_text = render_post_text(
+        post_content=post_content,
+        images=deduplicate_images(images=post_content.attached_images),
+    ).encode("utf-8")
+    rendered = time.perf_counter()
+
+    post_json = codec.dumps(post, pretty=not compact_json)
+
+    return PreparedPost(
+        post_id=post_content.post_id,
+        dir_name=get_post_dir_name(post_content=post_content),
+        post_text=post_text,
+        post_json=post_json,
+        media_files=get_media_files(post_content=post_content),
+        timings={
+            "extract_post": extracted - start,
+            "render": rendered - extracted,
+            "encode_json": time.perf_counter() - rendered,
+        },
+    )
+
+
 class ContentExporter:
-    def __init__(self, output_path: str, archive_file: str) -> None:
+    def __init__(
+        self,
+        output_path: str,
+        archive_file: str,
+        archive_journal: bool = False,
+        transport: Transport = None,
+        max_downloads: int = 8,
+        max_host_downloads: int = 4,
+        compact_json: bool = False,
+        media_store: bool = False,
+        output_format: str = "directories",
+    ) -> None:
         self.output_path = output_path
+        self.compact_json = compact_json
+
+        self.transport = transport if transport else Transport()
+        self.metrics = self.transport.metrics
+
+        # loaded first, a broken archive fails before anything is opened
         self.archive_file = archive_file
+        self.archive_journal = archive_journal
         self.file_lock = Lock()
 
-        self.state: dict[str, str] = self.load_archive_file()
+        self.journal = ArchiveJournal(journal_file=f"{archive_file}.journal")
+
+        self.state: PostArchive = self.load_archive_file()
+
+        # posts of a pack are written to staging directories and packed once
+        # their media is downloaded
+        self.pack = (
+            PostPack(pack_file=os.path.join(output_path, PACK_FILE))
+            if output_format == "pack"
+            else None
+        )
 
-    def load_archive_file(self) -> dict[str, str]:
+        self.media_store = (
+            MediaStore(store_path=os.path.join(output_path, MEDIA_STORE_DIR))
+            if media_store
+            else None
+        )
+
+        self.max_host_downloads = max_host_downloads
+        self.host_limits: dict[str, BoundedSemaphore] = dict()
+        self.host_limits_lock = Lock()
+
+        self.download_pool = ThreadPoolExecutor(max_workers=max_downloads)
+        self.max_pending_posts = max_downloads
+        self.pending_posts: deque[
+            tuple[str, str | None, str, list[tuple[str, str, Future]]]
+        ] = deque()
+        self.failed_media: dict[str, list[tuple[str, str]]] = dict()
+        self.exported_posts = 0
+
+        # archived posts with media that failed to download, retried by
+        # retry_incomplete_posts() in later runs
+        self.incomplete_file = os.path.join(output_path, INCOMPLETE_POSTS_FILE)
+        self.incomplete_lock = Lock()
+        self.incomplete_posts: dict[str, dict] = self.load_incomplete_posts()
+
+        self.validators_file = os.path.join(output_path, MEDIA_VALIDATORS_FILE)
+        self.validators_lock = Lock()
+        self.media_validators: dict[str, dict[str, str]] = self.load_media_validators()
+
+    def load_archive_file(self) -> PostArchive:
         self.file_lock.acquire()
         try:
             if os.path.isfile(self.archive_file):
-                with open(self.archive_file) as f:
-                    state = json.load(f)
+                with open(self.archive_file, "rb") as f:
+                    state = PostArchive(entries=codec.loads(f.read()))
             else:
-                state = dict()
+                state = PostArchive()
+
+            replayed = self.journal.replay(archive=state)
+            if replayed:
+                logger.info(f"Replayed {replayed} entries from archive journal")
         except Exception as error:
-            logger.error(f"Archive file could not be loaded: '{error}'")
-            exit(1)
+            raise ArchiveError(
+                f"Archive file '{self.archive_file}' could not be loaded: '{error}'"
+            ) from error
         finally:
             self.file_lock.release()
 
+        if replayed and not self.archive_journal:
+            self.compact_archive_file(state=state)
+
         return state
 
-    def write_archive_file(self) -> None:
+    def write_archive_file(self, state: PostArchive = None) -> None:
         self.file_lock.acquire()
         try:
-            with open(self.archive_file, "w") as f:
-                json.dump(self.state, f, indent=4)
+            with self.metrics.timer("write_archive"):
+                write_snapshot(
+                    archive_file=self.archive_file,
+                    archive=state if state else self.state,
+                )
         except Exception as error:
             logger.error(f"{error}")
         finally:
             self.file_lock.release()
 
-    def download_image(self, url: str, file_path: str, filename: str):
-        if url:
-            response = requests.get(url, stream=True)
+    def compact_archive_file(self, state: PostArchive = None) -> None:
+        self.write_archive_file(state=state)
 
-            if response.status_code == 200:
-                file = os.path.join(file_path, filename)
+        self.file_lock.acquire()
+        try:
+            self.journal.reset()
+        finally:
+            self.file_lock.release()
 
-                with open(file, "wb") as f:
-                    for chunk in response:
-                        f.write(chunk)
-            else:
-                logger.warning(f"Image could not be downloaded from: {url}")
-
-    def download_images(self, urls: set[str], file_path: str):
-        for url in urls:
-            if url:
-                parsed_url = urllib.parse.urlparse(url)
-
-                filename = f"{parsed_url.path.strip('/')}.png"
-
-                self.download_image(url=url, file_path=file_path, filename=filename)
-
-    def _get_image_urls(self, container: dict) -> list[str]:
-        urls = [
-            image.get("url", "")
-            for image in container.get("backstageImageRenderer", {})
-            .get("image", {})
-            .get("thumbnails", [dict()])
-        ]
-
-        return urls
-    
-    def _get_post_text(self, text_runs: list[dict]) -> str:
-        post_text_parts: list[str] = list()
-
-        for text_run in text_runs:
-            text = text_run.get("text", "")
-            navigation_link = (
-                text_run.get("navigationEndpoint", {})
-                .get("commandMetadata", {})
-                .get("webCommandMetadata", {})
-                .get("url", "")
-            )
+    def archive_post(self, slot: str, post_id: str) -> None:
+        self.state.add(slot=slot, post_id=post_id)
+        self.exported_posts += 1
+        self.metrics.count("posts", result="exported")
 
-            if navigation_link.startswith("/"):
-                navigation_link = f"https://youtube.com{navigation_link}"
+        if not self.archive_journal:
+            self.write_archive_file()
+            return
 
-            if navigation_link and not text == navigation_link:
-                text = f"{text} ({navigation_link})"
+        self.file_lock.acquire()
+        try:
+            with self.metrics.timer("write_journal"):
+                compact = self.journal.append(slot=slot, post_id=post_id)
+        except Exception as error:
+            logger.error(f"{error}")
+            compact = False
+        finally:
+            self.file_lock.release()
 
-            post_text_parts.append(text)
+        if compact:
+            self.compact_archive_file()
 
-        return "".join(post_text_parts)
-    
-    def _extract_post_share_detais(self, post: dict) -> PostShare:
-        post_share = PostShare()
+    def load_media_validators(self) -> dict[str, dict[str, str]]:
+        if not os.path.isfile(self.validators_file):
+            return dict()
 
-        post_share.share_post_id = post.get("postId", "id_not_found")
-        post_share.share_author = post.get("displayName", {}).get("runs", [dict()])[0].get("text", "N/A")
-        post_share.share_text = self._get_post_text(text_runs=post.get("content", {}).get("runs", []))
-        post_share.share_time = post.get("publishedTimeText", {}).get("runs", [dict()])[0].get("text", "")
+        try:
+            with open(self.validators_file, "rb") as f:
+                return codec.loads(f.read())
+        except Exception as error:
+            logger.warning(f"Media validators could not be loaded: '{error}'")
+            return dict()
 
-        return post_share
+    def write_media_validators(self) -> None:
+        with self.validators_lock:
+            temp_file = f"{self.validators_file}.tmp"
 
+            with open(temp_file, "wb") as f:
+                f.write(codec.dumps(self.media_validators, pretty=False))
 
-    def _extract_post_details(self, post: dict) -> PostContent:
-        post_content = PostContent()
+            os.replace(temp_file, self.validators_file)
 
-        # General Post content
-        post_content.post_id = post.get("postId", "no_id_found")
-        post_content.author = (
-            post.get("authorText", {}).get("runs", [dict()])[0].get("text", "")
-        )
-        post_content.post_published_time = (
-            post.get("publishedTimeText", {}).get("runs", [dict()])[0].get("text", "")
-        )
-        post_content.members_only = "sponsorsOnlyBadge" in post.keys()
-        post_content.like_count = post.get("voteCount", {}).get("simpleText")
+    def load_incomplete_posts(self) -> dict[str, dict]:
+        if not os.path.isfile(self.incomplete_file):
+            return dict()
 
-        # Post Text
-        text_runs: list[dict] = post.get("contentText", {}).get("runs", [])
+        try:
+            with open(self.incomplete_file, "rb") as f:
+                return codec.loads(f.read())
+        except Exception as error:
+            logger.warning(f"Incomplete posts could not be loaded: '{error}'")
+            return dict()
 
-        post_content.post_text = self._get_post_text(text_runs=text_runs)
+    def write_incomplete_posts(self) -> None:
+        with self.incomplete_lock:
+            if not self.incomplete_posts:
+                if os.path.isfile(self.incomplete_file):
+                    os.remove(self.incomplete_file)
+                return
 
-        # Post Images
-        image_urls = []
+            temp_file = f"{self.incomplete_file}.tmp"
 
-        image_urls += self._get_image_urls(
-            container=post.get("backstageAttachment", {})
-        )
+            with open(temp_file, "wb") as f:
+                f.write(codec.dumps(self.incomplete_posts, pretty=False))
 
-        multi_images: list[dict] = (
-            post.get("backstageAttachment", {})
-            .get("postMultiImageRenderer", {})
-            .get("images", [])
-        )
+            os.replace(temp_file, self.incomplete_file)
+
+    def _track_incomplete_post(self, post_id: str, slot: str, dir_name: str) -> None:
+        failed_media = self.failed_media.get(post_id)
+
+        if failed_media:
+            entry = self.incomplete_posts.get(post_id, {"attempts": 0})
+            entry.update(
+                slot=slot,
+                dir_name=dir_name,
+                media=[list(media) for media in failed_media],
+                attempts=entry["attempts"] + 1,
+            )
+            self.incomplete_posts[post_id] = entry
+        elif self.incomplete_posts.pop(post_id, None) is None:
+            return
+
+        self.write_incomplete_posts()
+
+    def _get_incomplete_post_path(self, post_id: str, entry: dict) -> str | None:
+        if self.pack is not None:
+            # the post is unpacked, completed and packed again
+            staging_path = os.path.join(self.output_path, STAGING_DIR)
+
+            if not self.pack.materialize(output_path=staging_path, post_ids=[post_id]):
+                return None
+
+            return os.path.join(staging_path, f"[{entry['slot']}] {entry['dir_name']}")
+
+        post_path = os.path.join(self.output_path, f"[{entry['slot']}] {entry['dir_name']}")
+
+        return post_path if os.path.isdir(post_path) else None
+
+    def _finish_incomplete_post(
+        self, post_id: str, entry: dict, post_path: str, failed_media: list[tuple[str, str]]
+    ) -> None:
+        if self.pack is not None:
+            with self.metrics.timer("write_pack"):
+                self.pack.add_post(
+                    post_id=post_id,
+                    slot=entry["slot"],
+                    dir_name=entry["dir_name"],
+                    post_path=post_path,
+                )
 
-        for image in multi_images:
-            image_urls += self._get_image_urls(container=image)
+            shutil.rmtree(post_path)
 
-        post_content.attached_images = image_urls
+        if not failed_media:
+            logger.info(f"Post '{post_id}': missing media downloaded")
+            self.failed_media.pop(post_id, None)
+        elif entry["attempts"] + 1 >= MAX_MEDIA_ATTEMPTS:
+            logger.error(
+                f"Post '{post_id}': giving up on {len(failed_media)} media file(s) after {MAX_MEDIA_ATTEMPTS} attempts"
+            )
+            self.failed_media.pop(post_id, None)
+        else:
+            self.failed_media[post_id] = failed_media
 
-        # Polls
-        poll_choices: list[dict] = (
-            post.get("backstageAttachment", {})
-            .get("pollRenderer", {})
-            .get("choices", [])
+        self._track_incomplete_post(
+            post_id=post_id, slot=entry["slot"], dir_name=entry["dir_name"]
         )
 
-        for choice in poll_choices:
-            choice_text = (
-                choice.get("text", {}).get("runs", [dict()])[0].get("text", "Null")
+    def _iter_incomplete_posts(self) -> Iterable[tuple[str, dict, str]]:
+        for post_id, entry in list(self.incomplete_posts.items()):
+            post_path = self._get_incomplete_post_path(post_id=post_id, entry=entry)
+
+            if post_path is None:
+                logger.warning(f"Post '{post_id}' with missing media no longer exists")
+                self.incomplete_posts.pop(post_id)
+                self.write_incomplete_posts()
+                continue
+
+            yield post_id, entry, post_path
+
+    def retry_incomplete_posts(self) -> None:
+        # Posts keep their number when media fails, the missing files are
+        # downloaded into the archived post by a later run.
+        if self.incomplete_posts:
+            logger.info(f"Retrying the missing media of {len(self.incomplete_posts)} posts")
+
+        for post_id, entry, post_path in self._iter_incomplete_posts():
+            downloads = self.download_media(
+                media_files=[(url, filename) for url, filename in entry["media"]],
+                file_path=post_path,
             )
 
-            percentage_voted = choice.get("votePercentage", {}).get("simpleText")
-            percentage_not_voted = choice.get("votePercentageIfSelected", {}).get(
-                "simpleText"
+            self._finish_incomplete_post(
+                post_id=post_id,
+                entry=entry,
+                post_path=post_path,
+                failed_media=[
+                    (url, filename)
+                    for url, filename, download in downloads
+                    if not download.result()
+                ],
             )
 
-            percentage = percentage_voted if percentage_voted else percentage_not_voted
+    def flush(self) -> None:
+        # persists everything close() would, the exporter stays usable
+        self._finish_pending_posts()
+
+        if self.media_validators:
+            self.write_media_validators()
+
+        if self.archive_journal and self.journal.entries:
+            self.compact_archive_file()
+
+    def close(self) -> None:
+        self.flush()
+        self.download_pool.shutdown()
+
+        if self.media_store:
+            self.media_store.close()
+
+        if self.pack is not None:
+            self.pack.close()
 
-            post_content.poll[choice_text] = PollOption(
-                votes=choice.get("numVotes", ""),
-                percentage=percentage if percentage else "",
+        staging_path = os.path.join(self.output_path, STAGING_DIR)
+        if os.path.isdir(staging_path) and not os.listdir(staging_path):
+            os.rmdir(staging_path)
+
+        for post_id, media in self.failed_media.items():
+            logger.error(
+                f"Post '{post_id}' is missing media, retried by the next run: {', '.join(url for url, _ in media)}"
             )
 
-        # Video data
-        video_dict = post.get("backstageAttachment", {}).get("videoRenderer", {})
+    def _get_host_limit(self, url: str) -> BoundedSemaphore:
+        host = urllib.parse.urlparse(url).netloc
 
-        post_content.video_title = (
-            video_dict.get("title", {}).get("runs", [dict()])[0].get("text", "")
-        )
-        post_content.video_thumbnail_url = (
-            video_dict.get("thumbnail", {})
-            .get("thumbnails", [dict()])[-1]
-            .get("url", "")
-            .split("?")[0]
+        with self.host_limits_lock:
+            host_limit = self.host_limits.get(host)
+
+            if not host_limit:
+                host_limit = BoundedSemaphore(self.max_host_downloads)
+                self.host_limits[host] = host_limit
+
+        return host_limit
+
+    def _link_stored_media(self, url: str, file: str) -> bool:
+        if not self.media_store:
+            return False
+
+        blob_path = self.media_store.lookup(image_id=url)
+
+        if not blob_path:
+            return False
+
+        self.media_store.link(blob_path=blob_path, file=file)
+
+        return True
+
+    def _store_media(self, url: str, file: str) -> None:
+        if self.media_store:
+            self.media_store.add(image_id=url, file=file)
+
+    def _get_validation_headers(self, url: str, file: str) -> dict[str, str]:
+        # revalidate media that was already downloaded instead of fetching it again
+        if not os.path.isfile(file):
+            return dict()
+
+        with self.validators_lock:
+            validators = self.media_validators.get(url, {})
+
+        headers: dict[str, str] = dict()
+
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+
+        headers["If-Modified-Since"] = validators.get(
+            "last_modified", email.utils.formatdate(os.path.getmtime(file), usegmt=True)
         )
-        post_content.video_published_time = video_dict.get("publishedTimeText", {}).get(
-            "simpleText", ""
+
+        return headers
+
+    def _store_validators(self, url: str, headers) -> None:
+        validators = {
+            key: headers.get(header)
+            for key, header in [("etag", "ETag"), ("last_modified", "Last-Modified")]
+            if headers.get(header)
+        }
+
+        if validators:
+            with self.validators_lock:
+                self.media_validators[url] = validators
+
+    def download_image(self, url: str, file_path: str, filename: str) -> bool:
+        if url:
+            file = os.path.join(file_path, filename)
+            part_file = f"{file}.part"
+
+            try:
+                if self._link_stored_media(url=url, file=file):
+                    self.metrics.count("media", result="linked")
+                    return True
+
+                headers = self._get_validation_headers(url=url, file=file)
+
+                # resume an interrupted download
+                resume_from = 0
+                if not headers and os.path.isfile(part_file):
+                    resume_from = os.path.getsize(part_file)
+                    headers["Range"] = f"bytes={resume_from}-"
+
+                    with self.validators_lock:
+                        etag = self.media_validators.get(url, {}).get("etag")
+                    if etag:
+                        headers["If-Range"] = etag
+
+                with self._get_host_limit(url=url):
+                    response = self.transport.get(url=url, headers=headers, stream=True)
+
+                    if response.status_code == 304:
+                        self.metrics.count("media", result="not_modified")
+                        return True
+
+                    if response.status_code == 416 and resume_from:
+                        # the partial file is unusable, start over
+                        os.remove(part_file)
+                    elif response.status_code in [200, 206]:
+                        mode = "ab" if response.status_code == 206 else "wb"
+
+                        with self.metrics.timer("write_media"):
+                            with open(part_file, mode) as f:
+                                for chunk in response.iter_content(
+                                    chunk_size=MEDIA_CHUNK_SIZE
+                                ):
+                                    f.write(chunk)
+
+                            os.replace(part_file, file)
+
+                        self._store_validators(url=url, headers=response.headers)
+                        self._store_media(url=url, file=file)
+                        self.metrics.count("media", result="downloaded")
+                    else:
+                        logger.warning(
+                            f"Image could not be downloaded from: {url} - response-code: {response.status_code}"
+                        )
+                        self.metrics.count("media", result="failed")
+                        return False
+            except Exception as error:
+                logger.warning(f"Image could not be downloaded from: {url} - {error}")
+                self.metrics.count("media", result="failed")
+                return False
+
+            if response.status_code == 416:
+                return self.download_image(
+                    url=url, file_path=file_path, filename=filename
+                )
+
+        return True
+
+    def get_media_files(self, post_content: PostRecord) -> list[tuple[str, str]]:
+        return get_media_files(post_content=post_content)
+
+    def download_media(
+        self, media_files: list[tuple[str, str]], file_path: str
+    ) -> list[tuple[str, str, Future]]:
+        downloads: list[tuple[str, str, Future]] = list()
+
+        for url, filename in media_files:
+            downloads.append(
+                (
+                    url,
+                    filename,
+                    self.download_pool.submit(
+                        self.download_image,
+                        url=url,
+                        file_path=file_path,
+                        filename=filename,
+                    ),
+                )
+            )
+
+        return downloads
+
+    def deduplicate_images(self, images: list[str]) -> list[str]:
+        return deduplicate_images(images=images)
+
+    def _get_post_content(self, post_dict: dict) -> tuple[dict, PostRecord]:
+        with self.metrics.timer("extract_post"):
+            return get_post_content(post_dict=post_dict)
+
+    def _get_post_dir_name(self, post_content: PostRecord) -> str:
+        return get_post_dir_name(post_content=post_content)
+
+    def _render_post_text(self, post_content: PostRecord, images: list[str]) -> str:
+        return render_post_text(post_content=post_content, images=images)
+
+    def _write_post_files(
+        self, post: dict, post_content: PostRecord, post_path: str
+    ) -> None:
+        with self.metrics.timer("render"):
+            images = self.deduplicate_images(images=post_content.attached_images)
+
+            post_output = self._render_post_text(post_content=post_content, images=images)
+
+        with self.metrics.timer("encode_json"):
+            post_json = codec.dumps(post, pretty=not self.compact_json)
+
+        self._write_rendered_files(
+            post_path=post_path, post_text=post_output.encode("utf-8"), post_json=post_json
         )
 
-        video_link = (
-            video_dict.get("navigationEndpoint", {})
-            .get("commandMetadata", {})
-            .get("webCommandMetadata", {})
-            .get("url", "")
+    def _write_rendered_files(
+        self, post_path: str, post_text: bytes, post_json: bytes
+    ) -> None:
+        os.makedirs(post_path, exist_ok=True)
+
+        with self.metrics.timer("write_post_files"):
+            with open(os.path.join(post_path, "post.txt"), "wb") as f:
+                f.write(post_text)
+
+            with open(os.path.join(post_path, "post.json"), "wb") as f:
+                f.write(post_json)
+
+    def _write_post(
+        self, post: dict, post_content: PostRecord, post_path: str
+    ) -> list[tuple[str, str, Future]]:
+        self._write_post_files(post=post, post_content=post_content, post_path=post_path)
+
+        return self.download_media(
+            media_files=self.get_media_files(post_content=post_content),
+            file_path=post_path,
         )
 
-        if video_link.startswith("/"):
-            video_link = f"https://www.youtube.com{video_link}"
+    def _get_post_path(self, dir_name: str) -> str:
+        # posts are written into staging and only get their numbered directory
+        # once they are archived, an interrupted run leaves no unarchived slots
+        return os.path.join(self.output_path, STAGING_DIR, dir_name)
 
-        post_content.video_url = video_link
+    def _publish_post(self, post_id: str, slot: str, dir_name: str) -> None:
+        staged_path = self._get_post_path(dir_name=dir_name)
 
-        video_badges: list[dict] = video_dict.get("badges", [])
+        if self.pack is not None:
+            with self.metrics.timer("write_pack"):
+                self.pack.add_post(
+                    post_id=post_id, slot=slot, dir_name=dir_name, post_path=staged_path
+                )
 
-        for badge in video_badges:
-            badge_label = badge.get("metadataBadgeRenderer", {}).get("label", "")
-            if badge_label == "Members only":
-                post_content.video_members_only = True
-                break
+            shutil.rmtree(staged_path)
+        else:
+            post_path = os.path.join(self.output_path, f"[{slot}] {dir_name}")
+
+            if os.path.isdir(post_path):
+                shutil.rmtree(post_path)
+
+            os.replace(staged_path, post_path)
+
+        self.archive_post(slot=slot, post_id=post_id)
+        self._track_incomplete_post(post_id=post_id, slot=slot, dir_name=dir_name)
+
+    def _finish_post(
+        self,
+        post_id: str,
+        slot: str | None,
+        dir_name: str,
+        downloads: list[tuple[str, str, Future]],
+    ) -> None:
+        with self.metrics.timer("wait_media"):
+            failed_media = [
+                (url, filename)
+                for url, filename, download in downloads
+                if not download.result()
+            ]
+
+        if failed_media:
+            self.failed_media[post_id] = failed_media
+            logger.error(
+                f"Post '{post_id}': {len(failed_media)} media file(s) could not be downloaded"
+            )
 
-        return post_content
+        if slot:
+            self._publish_post(post_id=post_id, slot=slot, dir_name=dir_name)
 
-    def deduplicate_images(self, images: list[str]) -> set[str]:
-        deduplicated_images: set[str] = set()
+    def _track_post(
+        self,
+        post_id: str,
+        slot: str | None,
+        dir_name: str,
+        downloads: list[tuple[str, str, Future]],
+    ) -> None:
+        # posts are only archived once all of their media has been downloaded
+        self.pending_posts.append((post_id, slot, dir_name, downloads))
 
-        for image in images:
-            if image:
-                url = f"{image.split('=s')[0]}=s0"
-                deduplicated_images.add(url)
+        while len(self.pending_posts) > self.max_pending_posts:
+            self._finish_post(*self.pending_posts.popleft())
 
-        return deduplicated_images
+    def _finish_pending_posts(self) -> None:
+        while self.pending_posts:
+            self._finish_post(*self.pending_posts.popleft())
 
-    def export_posts(self, posts: list[dict]):
-        previous_index_offset = (
-            max([int(key) for key in self.state.keys()]) if self.state else 0
-        )
+    def export_posts(self, posts: Iterable[dict]):
+        total = f"/{len(posts)}" if isinstance(posts, Sized) else ""
 
         index = 0
 
         for post_dict in posts:
             index += 1
-            logger.info(f"Exporting post {index}/{len(posts)}")
+            logger.info(f"Exporting post {index}{total}")
 
-            post_common_root = post_dict.get("backstagePostThreadRenderer", {}).get("post", {})
+            post, post_content = self._get_post_content(post_dict=post_dict)
 
-            share = None
+            if post_content.post_id not in self.state:
+                post_num = self.state.allocate_slot()
+                dir_name = self._get_post_dir_name(post_content=post_content)
 
-            if "sharedPostRenderer" in post_common_root.keys():
-                post = post_common_root.get("sharedPostRenderer", {}).get("originalPost", {}).get("backstagePostRenderer", {})
+                downloads = self._write_post(
+                    post=post,
+                    post_content=post_content,
+                    post_path=self._get_post_path(dir_name=dir_name),
+                )
+
+                self._track_post(
+                    post_id=post_content.post_id,
+                    slot=post_num,
+                    dir_name=dir_name,
+                    downloads=downloads,
+                )
 
-                share = self._extract_post_share_detais(post=post_common_root.get("sharedPostRenderer", {}))
             else:
-                post = (
-                    post_dict.get("backstagePostThreadRenderer", {})
-                    .get("post", {})
-                    .get("backstagePostRenderer", {})
+                logger.info(
+                    f"Skipping post '{post_content.post_id}' - already exported"
                 )
+                self.metrics.count("posts", result="skipped")
 
-            post_content = self._extract_post_details(post=post)
-            
-            if share:
-                post_content.share = share
+        self._finish_pending_posts()
 
-            if post_content.post_id not in self.state.values():
-                post_num = str(index + previous_index_offset).zfill(4)
+    def export_prepared_posts(self, posts: Iterable[PreparedPost]):
+        # posts that were already extracted, rendered and encoded elsewhere
+        index = 0
 
-                members_only_tag = (
-                    " (Members only)" if post_content.members_only else ""
-                )
-                members_only_tag_post = (
-                    " - Members only" if post_content.members_only else ""
-                )
+        for prepared_post in posts:
+            index += 1
+            logger.info(f"Exporting post {index}")
 
-                post_path_id = post_content.post_id
-                if post_content.share and post_content.share.share_post_id:
-                    post_path_id = post_content.share.share_post_id
+            if prepared_post.post_id in self.state:
+                logger.info(f"Skipping post '{prepared_post.post_id}' - already exported")
+                self.metrics.count("posts", result="skipped")
+                continue
 
-                post_path = os.path.join(
-                    self.output_path,
-                    f"[{post_num}]{members_only_tag} {post_path_id}",
-                )
+            post_num = self.state.allocate_slot()
+            post_path = self._get_post_path(dir_name=prepared_post.dir_name)
 
-                if not os.path.isdir(post_path):
-                    os.mkdir(post_path)
+            self._write_rendered_files(
+                post_path=post_path,
+                post_text=prepared_post.post_text,
+                post_json=prepared_post.post_json,
+            )
 
-                images = self.deduplicate_images(images=post_content.attached_images)
+            self._track_post(
+                post_id=prepared_post.post_id,
+                slot=post_num,
+                dir_name=prepared_post.dir_name,
+                downloads=self.download_media(
+                    media_files=prepared_post.media_files, file_path=post_path
+                ),
+            )
 
-                self.download_images(urls=images, file_path=post_path)
-                self.download_image(
-                    url=post_content.video_thumbnail_url,
-                    file_path=post_path,
-                    filename="video_thumbnail.jpg",
-                )
+        self._finish_pending_posts()
 
-                linked_video = ""
-                if post_content.video_url:
-                    member_only_video = (
-                        " (Members only)" if post_content.video_members_only else ""
-                    )
+    def export_posts_streaming(
+        self, pages: Iterable[list[dict]], crawl_state: CrawlState = None
+    ):
+        # Pages arrive newest first. Posts are written into staging directories
+        # as they arrive and only numbered once the crawl is complete, so the
+        # directory prefixes stay in chronological order.
+        staging_path = os.path.join(self.output_path, STAGING_DIR)
 
-                    linked_video = f"Linked Video:\n{post_content.video_title}{member_only_video}\n{post_content.video_published_time}\n{post_content.video_url}"
+        # a resumed crawl replays its pages into the staged posts of the
+        # interrupted run, their media is only revalidated
+        if os.path.isdir(staging_path) and not (crawl_state and crawl_state.resumable):
+            shutil.rmtree(staging_path)
 
-                image_links = ""
-                if images:
-                    links = "\n".join(images)
-                    image_links = f"Images:\n{links}"
+        os.makedirs(staging_path, exist_ok=True)
 
-                poll = ""
-                if post_content.poll:
-                    option_lines = list()
-                    for option, results in post_content.poll.items():
-                        votes = f" - {results.votes}" if results.votes else ""
-                        percentage = (
-                            f" - {results.percentage}" if results.percentage else ""
-                        )
+        staged_posts: list[tuple[str, str]] = list()
+        staged_ids: set[str] = set()
 
-                        option_lines.append(f"[{option}]{votes}{percentage}")
+        for page in pages:
+            for post_dict in page:
+                post, post_content = self._get_post_content(post_dict=post_dict)
 
-                    options = "\n".join(option_lines)
-                    poll = f"Poll:\n{options}"
+                if post_content.post_id in self.state or post_content.post_id in staged_ids:
+                    logger.info(
+                        f"Skipping post '{post_content.post_id}' - already exported"
+                    )
+                    self.metrics.count("posts", result="skipped")
+                    continue
+
+                logger.info(f"Exporting post {len(staged_posts) + 1}")
+
+                dir_name = self._get_post_dir_name(post_content=post_content)
 
-                attached_content = "\n\n".join(
-                    [item for item in [linked_video, image_links, poll] if item]
+                downloads = self._write_post(
+                    post=post,
+                    post_content=post_content,
+                    post_path=self._get_post_path(dir_name=dir_name),
                 )
 
-                post_output = post_template.substitute(
-                    author=post_content.author,
-                    time=post_content.post_published_time,
-                    members_only=members_only_tag_post,
-                    content=post_content.post_text,
-                    attached_content=attached_content,
-                    likes=post_content.like_count,
+                self._track_post(
+                    post_id=post_content.post_id,
+                    slot=None,
+                    dir_name=dir_name,
+                    downloads=downloads,
                 )
 
-                if post_content.share:
-                    post_output = share_post_template.substitute(
-                        author=post_content.share.share_author,
-                        time=post_content.share.share_time,
-                        content=post_content.share.share_text,
-                        originalpost=post_output
-                    )
-                
-                post_output = post_output.encode("utf-8")
+                staged_posts.append((post_content.post_id, dir_name))
+                staged_ids.add(post_content.post_id)
 
-                with open(os.path.join(post_path, "post.txt"), "wb") as f:
-                    f.write(post_output)
+        self._finish_pending_posts()
 
-                with open(os.path.join(post_path, "post.json"), "w") as f:
-                    json.dump(post, f, indent=4)
+        if crawl_state and crawl_state.incomplete():
+            # numbering the posts now would put the older posts of the next
+            # run after them, they stay staged until the crawl is complete
+            return
 
-                self.state[post_num] = post_content.post_id
-                self.write_archive_file()
+        for post_id, dir_name in reversed(staged_posts):
+            self._publish_post(
+                post_id=post_id,
+                slot=self.state.allocate_slot(),
+                dir_name=dir_name,
+            )
 
-            else:
-                logger.info(
-                    f"Skipping post '{post_content.post_id}' - already exported"
-                )
+        shutil.rmtree(staging_path)
@@ -0,0 +1,187 @@
+import os
+import time
+import logging
+from collections.abc import Iterator
+
+from src import codec
+
+logger = logging.getLogger(name=__name__)
+
+CRAWL_STATE_FILE = ".crawl-state.json"
+CRAWL_PAGES_FILE = ".crawl-pages.jsonl"
+
+# continuation tokens don't live forever, crawls started earlier are started over
+CRAWL_STATE_MAX_AGE = 24 * 60 * 60
+
+# runs a crawl that stopped at a failed page is resumed in before its posts
+# are exported without the missing pages
+MAX_FAILED_RESUMES = 3
+
+
+class CrawlState:
+    def __init__(
+        self,
+        output_path: str,
+        url: str,
+        max_age: float = CRAWL_STATE_MAX_AGE,
+        max_failed_resumes: int = MAX_FAILED_RESUMES,
+    ) -> None:
+        self.state_file = os.path.join(output_path, CRAWL_STATE_FILE)
+        self.pages_file = os.path.join(output_path, CRAWL_PAGES_FILE)
+        self.url = url
+        self.max_age = max_age
+        self.max_failed_resumes = max_failed_resumes
+
+        self.endpoint = ""
+        self.request_body: dict = dict()
+        self.token = ""
+        self.pages = 0
+        self.posts = 0
+        self.known_run = 0
+        # size of the page log at the last saved state, a page appended after
+        # it was interrupted before the state was saved
+        self.pages_size = 0
+        self.started_at = 0.0
+
+        # Runs that stopped at a failed page and the page count they stopped
+        # at. They are kept when the crawl is started over, so a fresh crawl
+        # failing at the same point is noticed. An exhausted crawl is given
+        # up and its posts are exported as they are.
+        self.failures = 0
+        self.failed_at = 0
+        self.fresh = False
+        self.exhausted = False
+
+        self.resumable = self.load()
+
+    def load(self) -> bool:
+        if not os.path.isfile(self.state_file):
+            return False
+
+        try:
+            with open(self.state_file, "rb") as f:
+                state = codec.loads(f.read())
+        except Exception as error:
+            logger.warning(f"Crawl state could not be loaded: '{error}'")
+            self.clear()
+            return False
+
+        if state.get("url") != self.url:
+            self.clear()
+            return False
+
+        self.failures = state.get("failures", 0)
+        self.failed_at = state.get("failed_at", 0)
+
+        # every saved page refreshes saved_at, the age counts from the start
+        started_at = state.get("started_at", state.get("saved_at", 0))
+        if time.time() - started_at > self.max_age:
+            logger.info(f"Crawl state of '{self.url}' is too old, starting over")
+            self.clear()
+            return False
+
+        self.endpoint = state.get("endpoint", "")
+        self.request_body = state.get("request_body", {})
+        self.token = state.get("token", "")
+        self.pages = state.get("pages", 0)
+        self.posts = state.get("posts", 0)
+        self.known_run = state.get("known_run", 0)
+        self.pages_size = state.get("pages_size", 0)
+        self.started_at = started_at
+
+        if not os.path.isfile(self.pages_file) or os.path.getsize(self.pages_file) < self.pages_size:
+            logger.warning(f"Crawl page log of '{self.url}' is incomplete, starting over")
+            self.clear()
+            return False
+
+        with open(self.pages_file, "r+b") as f:
+            f.truncate(self.pages_size)
+
+        return bool(self.endpoint)
+
+    def save(self) -> None:
+        state = {
+            "url": self.url,
+            "endpoint": self.endpoint,
+            "request_body": self.request_body,
+            "token": self.token,
+            "pages": self.pages,
+            "posts": self.posts,
+            "known_run": self.known_run,
+            "pages_size": self.pages_size,
+            "started_at": self.started_at,
+            "failures": self.failures,
+            "failed_at": self.failed_at,
+            "saved_at": time.time(),
+        }
+
+        temp_file = f"{self.state_file}.tmp"
+
+        with open(temp_file, "wb") as f:
+            f.write(codec.dumps(state, pretty=False))
+
+        os.replace(temp_file, self.state_file)
+
+    def start(self, endpoint: str, request_body: dict) -> None:
+        self.clear()
+
+        self.endpoint = endpoint
+        self.request_body = request_body
+        self.started_at = time.time()
+        self.fresh = True
+
+    def add_page(self, posts: list[dict], token: str, known_run: int) -> None:
+        with open(self.pages_file, "ab") as f:
+            f.write(codec.dumps(posts, pretty=False) + b"\n")
+            self.pages_size = f.tell()
+
+        self.token = token
+        self.pages += 1
+        self.posts += len(posts)
+        self.known_run = known_run
+
+        self.save()
+
+    def fail(self) -> None:
+        # the crawl stopped at a failed page, the next run resumes it
+        if self.fresh and self.failures and self.pages == self.failed_at:
+            logger.warning(
+                f"The crawl of '{self.url}' failed after {self.pages} pages again"
+            )
+            self.exhausted = True
+
+        self.failures += 1
+        self.failed_at = self.pages
+
+        if self.failures > self.max_failed_resumes:
+            self.exhausted = True
+
+        self.save()
+
+    def incomplete(self) -> bool:
+        # the posts of an incomplete crawl wait for the run that completes it
+        return bool(self.token) and not self.exhausted
+
+    def finish(self) -> None:
+        # all pages were loaded, only the page log is left to replay
+        self.token = ""
+        self.save()
+
+    def iter_pages(self) -> Iterator[list[dict]]:
+        with open(self.pages_file, "rb") as f:
+            for line in f:
+                yield codec.loads(line)
+
+    def clear(self) -> None:
+        for file in [self.state_file, self.pages_file]:
+            if os.path.isfile(file):
+                os.remove(file)
+
+        self.endpoint = ""
+        self.request_body = dict()
+        self.token = ""
+        self.pages = 0
+        self.posts = 0
+        self.known_run = 0
+        self.pages_size = 0
+        self.resumable = False
@@ -1,33 +1,109 @@
-import requests
-import json
-import re
-import time
-import hashlib
 import logging
+import requests
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Container, Generator, Iterable, Iterator
 from pydantic import BaseModel
 
+from src import codec
+from src.transport import Transport
+from src.crawl_state import CrawlState
+from src.init_data_cache import InitDataCache
+from src.page_data import PageDataError, extract_initial_data, extract_ytcfg
+
 logger = logging.getLogger(name=__name__)
 
+# responses to a continuation token the api doesn't accept (anymore)
+REJECTED_TOKEN_STATUS_CODES = [400, 403]
+
+
+class TokenRejectedError(Exception):
+    def __init__(self, message: str, status_code: int = 200):
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class InitData(BaseModel):
     api_key: str = None
     request_body: dict = dict()
 
 
-class PostExtractor:
-    def __init__(self, cookies: dict) -> None:
-        self.cookies = cookies
+def get_post_id(post: dict) -> str:
+    post_root: dict = post.get("backstagePostThreadRenderer", {}).get("post", {})
+
+    # shared posts are archived under the id of the original post
+    if "sharedPostRenderer" in post_root.keys():
+        post_root = post_root.get("sharedPostRenderer", {}).get("originalPost", {})
 
-        cookie_header = "; ".join([f"{k}={v}" for k, v in self.cookies.items()])
+    return post_root.get("backstagePostRenderer", {}).get("postId", "")
 
-        self.headers = {
-            "Cookie": cookie_header,
-            "X-Goog-AuthUser": "0",
-            "X-Origin": "https://www.youtube.com",
-            "X-Youtube-Bootstrap-Logged-In": "true",
-        }
+
+def is_community_tab(tab: dict) -> bool:
+    web_endpoint_url = (
+        tab.get("tabRenderer", {})
+        .get("endpoint", {})
+        .get("commandMetadata", {})
+        .get("webCommandMetadata", {})
+        .get("url", "")
+    )
+
+    return web_endpoint_url.endswith("/community")
+
+
+def parse_individual_post(html: str) -> dict | None:
+    try:
+        init_data = extract_initial_data(html=html)
+    except PageDataError as error:
+        logger.warning(f"post page could not be parsed - {error}")
+        init_data = None
+
+    if init_data:
+        tabs: list[dict] = (
+            init_data.get("contents", {})
+            .get("twoColumnBrowseResultsRenderer", {})
+            .get("tabs", [])
+        )
+
+        for tab in tabs:
+            if is_community_tab(tab=tab):
+                return (
+                    tab.get("tabRenderer", {})
+                    .get("content", {})
+                    .get("sectionListRenderer", {})
+                    .get("contents", [dict()])[0]
+                    .get("itemSectionRenderer", {})
+                    .get("contents", [dict()])[0]
+                )
+
+
+class PostExtractor:
+    def __init__(
+        self,
+        cookies: dict = None,
+        transport: Transport = None,
+        init_data_cache: InitDataCache = None,
+    ) -> None:
+        self.transport = transport if transport else Transport(cookies=cookies)
+        self.metrics = self.transport.metrics
+        self.init_data_cache = init_data_cache
 
         self.extracted_posts: set[str] = set()
+        self.extracted_posts_lock = Lock()
+
+        self.init_data: dict[str, InitData] = dict()
+        self.init_data_lock = Lock()
+
+    def _claim_post_id(self, post_id: str) -> bool:
+        with self.extracted_posts_lock:
+            if post_id in self.extracted_posts:
+                return False
+
+            self.extracted_posts.add(post_id)
+
+        return True
+
+    def get_post_id(self, post: dict) -> str:
+        return get_post_id(post=post)
 
     def get_continuation_token(self, continuation_container: dict) -> str | None:
         return (
@@ -38,20 +114,25 @@ class PostExtractor:
         )
 
     def _get_posts_init(self, endpoint: str, body: dict) -> list[dict] | None:
-        if self.cookies.get("SAPISID"):
-            self.headers[
-                "Authorization"
-            ] = f"SAPISIDHASH {self.calculate_sapisidhash()}"
-
-        response = requests.post(
+        response = self.transport.post(
             url=endpoint,
-            headers=self.headers,
-            data=json.dumps(body),
-            cookies=self.cookies,
+            api=True,
+            cache=True,
+            data=codec.dumps(body, pretty=False),
         )
 
-        response_content: dict = response.json()
+        if response.status_code != 200:
+            logger.warning(
+                f"error loading community tab - response-code: {response.status_code}"
+            )
+            return None
+
+        with self.metrics.timer("parse:browse"):
+            return self._parse_posts_init(
+                response_content=codec.loads(response.content)
+            )
 
+    def _parse_posts_init(self, response_content: dict) -> list[dict] | None:
         tabs: list[dict] = (
             response_content.get("contents", {})
             .get("twoColumnBrowseResultsRenderer", {})
@@ -71,21 +152,41 @@ class PostExtractor:
 
                 return post_list
 
-    def _get_posts(self, endpoint: str, body: dict) -> list[dict]:
-        if self.cookies.get("SAPISID"):
-            self.headers[
-                "Authorization"
-            ] = f"SAPISIDHASH {self.calculate_sapisidhash()}"
+    def _get_posts(self, endpoint: str, body: dict) -> list[dict] | None:
+        # None if the page couldn't be loaded, an empty page ends the crawl. A
+        # rejected token raises TokenRejectedError.
+        try:
+            response = self.transport.post(
+                url=endpoint,
+                api=True,
+                cache=True,
+                data=codec.dumps(body, pretty=False),
+            )
+        except requests.RequestException as error:
+            logger.warning(f"error loading further posts - {error}")
+            return None
+
+        if response.status_code in REJECTED_TOKEN_STATUS_CODES:
+            raise TokenRejectedError(
+                f"continuation token rejected - response-code: {response.status_code}",
+                status_code=response.status_code,
+            )
 
-        response = requests.post(
-            url=endpoint,
-            headers=self.headers,
-            data=json.dumps(body),
-            cookies=self.cookies,
-        )
+        if response.status_code != 200:
+            logger.warning(
+                f"error loading further posts - response-code: {response.status_code}"
+            )
+            return None
+
+        with self.metrics.timer("parse:browse"):
+            response_content = codec.loads(response.content)
 
-        response_content: dict = response.json()
+            if "onResponseReceivedEndpoints" not in response_content:
+                raise TokenRejectedError("continuation token rejected - no continuation in the response")
 
+            return self._parse_posts(response_content=response_content)
+
+    def _parse_posts(self, response_content: dict) -> list[dict]:
         posts = (
             response_content.get("onResponseReceivedEndpoints", [dict()])[0]
             .get("appendContinuationItemsAction", {})
@@ -94,179 +195,386 @@ class PostExtractor:
 
         return posts
 
-    def get_posts(self, url: str) -> list[dict]:
-        posts: list[dict] = list()
+    def _count_known_run(
+        self, posts: list[dict], known_post_ids: Container[str], known_run: int
+    ) -> int:
+        for post in posts:
+            if self.get_post_id(post=post) in known_post_ids:
+                known_run += 1
+            else:
+                known_run = 0
+
+        return known_run
+
+    def _filter_new_posts(self, posts: list[dict]) -> list[dict]:
+        new_posts: list[dict] = list()
+        for post in posts:
+            post_id = self.get_post_id(post=post)
+
+            if self._claim_post_id(post_id=post_id):
+                new_posts.append(post)
+
+        return new_posts
+
+    def _iter_continuations(
+        self,
+        endpoint: str,
+        request_body: dict,
+        token: str,
+        known_post_ids: Container[str] = None,
+        stop_after_known: int = 0,
+        known_run: int = 0,
+        crawl_state: CrawlState = None,
+        resumed: bool = False,
+    ) -> Generator[list[dict], None, bool]:
+        # returns False if the api rejected a resumed token before any page
+        # could be loaded with it
+        early_stop = known_post_ids is not None and stop_after_known > 0
+        loaded = False
+        failed = False
+
+        while token and not (early_stop and known_run >= stop_after_known):
+            request_body["continuation"] = token
+
+            try:
+                batch_posts: list[dict] | None = self._get_posts(
+                    endpoint=endpoint, body=request_body
+                )
+            except TokenRejectedError as error:
+                logger.warning(error)
 
-        init_data = self.extract_init_info(url=url)
+                if resumed and not loaded:
+                    return False
 
-        if init_data.api_key and init_data.request_body:
-            endpoint = f"https://www.youtube.com/youtubei/v1/browse?key={init_data.api_key}&prettyPrint=false"
+                # a token from this crawl only gets rejected at the end of the
+                # feed or if the api fails
+                batch_posts = None if error.status_code != 200 else []
 
-            init_posts = self._get_posts_init(
-                endpoint=endpoint, body=init_data.request_body
-            )
+            if batch_posts is None:
+                failed = True
+                break
 
-            if init_posts:
-                posts += init_posts[:-1]
+            # a page without a continuation, even an empty one, is the last page
+            token = ""
 
+            if batch_posts and batch_posts[-1].get("continuationItemRenderer"):
                 token = self.get_continuation_token(
-                    continuation_container=init_posts[-1]
+                    continuation_container=batch_posts[-1]
                 )
 
-                while token:
-                    init_data.request_body["continuation"] = token
+                batch_posts = batch_posts[:-1]
 
-                    batch_posts: list[dict] = self._get_posts(
-                        endpoint=endpoint, body=init_data.request_body
-                    )
-
-                    token = ""
-
-                    if batch_posts:
-                        if batch_posts[-1].get("continuationItemRenderer"):
-                            posts += batch_posts[:-1]
-
-                            token = self.get_continuation_token(
-                                continuation_container=batch_posts[-1]
-                            )
-                        else:
-                            posts += batch_posts
-
-            new_posts: list[dict] = list()
-            for post in posts:
-                post_id = (
-                    post.get("backstagePostThreadRenderer", {})
-                    .get("post", {})
-                    .get("backstagePostRenderer", {})
-                    .get("postId", "")
+            if early_stop:
+                known_run = self._count_known_run(
+                    posts=batch_posts,
+                    known_post_ids=known_post_ids,
+                    known_run=known_run,
                 )
 
-                if post_id not in self.extracted_posts:
-                    self.extracted_posts.add(post_id)
-                    new_posts.append(post)
+            if crawl_state:
+                crawl_state.add_page(posts=batch_posts, token=token, known_run=known_run)
 
-            return new_posts
+            loaded = True
 
-    def extract_init_info(self, url: str) -> InitData:
-        return_data = InitData()
+            yield self._filter_new_posts(posts=batch_posts)
 
-        response = requests.get(url, cookies=self.cookies)
+        # a failed page keeps the last good token, the next run continues there
+        if crawl_state and failed:
+            crawl_state.fail()
+        elif crawl_state:
+            crawl_state.finish()
 
-        if response.status_code == 200:
-            html = response.text
+        if token and not failed:
+            logger.info(
+                f"Stopped crawling after {known_run} already archived posts in a row"
+            )
+
+        return True
+
+    def _resume_posts(
+        self,
+        crawl_state: CrawlState,
+        known_post_ids: Container[str] = None,
+        stop_after_known: int = 0,
+    ) -> Generator[list[dict], None, bool]:
+        logger.info(
+            f"Resuming the crawl of '{crawl_state.url}' after {crawl_state.pages} pages"
+        )
+
+        # the pages of the interrupted run are replayed from the page log, the
+        # crawl then continues with the saved continuation token
+        for page in crawl_state.iter_pages():
+            yield self._filter_new_posts(posts=page)
+
+        if not crawl_state.token:
+            return True
 
-            init_data_match = re.search(
-                "(?<=var ytInitialData = ){.*?}(?=;<\/script>)", html
+        return (
+            yield from self._iter_continuations(
+                endpoint=crawl_state.endpoint,
+                request_body=crawl_state.request_body,
+                token=crawl_state.token,
+                known_post_ids=known_post_ids,
+                stop_after_known=stop_after_known,
+                known_run=crawl_state.known_run,
+                crawl_state=crawl_state,
+                resumed=True,
+            )
+        )
+
+    def iter_posts(
+        self,
+        url: str,
+        known_post_ids: Container[str] = None,
+        stop_after_known: int = 0,
+        crawl_state: CrawlState = None,
+    ) -> Iterator[list[dict]]:
+        early_stop = known_post_ids is not None and stop_after_known > 0
+        known_run = 0
+
+        if crawl_state and crawl_state.resumable:
+            resumed = yield from self._resume_posts(
+                crawl_state=crawl_state,
+                known_post_ids=known_post_ids,
+                stop_after_known=stop_after_known,
+            )
+
+            if resumed:
+                return
+
+            logger.warning(
+                f"The saved continuation token of '{url}' was rejected, crawling from the start"
             )
 
-            if init_data_match:
-                init_data: dict = json.loads(init_data_match.group())
+        endpoint, request_body, init_posts = self._get_first_page(url=url)
 
-                tabs: list[dict] = (
-                    init_data.get("contents", {})
-                    .get("twoColumnBrowseResultsRenderer", {})
-                    .get("tabs", [])
+        if init_posts:
+            token = self.get_continuation_token(
+                continuation_container=init_posts[-1]
+            )
+
+            # a first page without a continuation holds all posts of the channel
+            if init_posts[-1].get("continuationItemRenderer"):
+                init_posts = init_posts[:-1]
+
+            if early_stop:
+                known_run = self._count_known_run(
+                    posts=init_posts,
+                    known_post_ids=known_post_ids,
+                    known_run=known_run,
                 )
 
-                for tab in tabs:
-                    if self.is_community_tab(tab=tab):
-                        endpoint = (
-                            tab.get("tabRenderer", {})
-                            .get("endpoint", {})
-                            .get("browseEndpoint", {})
-                        )
+            if crawl_state:
+                crawl_state.start(endpoint=endpoint, request_body=request_body)
+                crawl_state.add_page(posts=init_posts, token=token, known_run=known_run)
 
-                        return_data.request_body["browseId"] = endpoint.get(
-                            "browseId", ""
-                        )
-                        return_data.request_body["params"] = endpoint.get("params", "")
+            yield self._filter_new_posts(posts=init_posts)
 
-            context_match = re.search("(?<=ytcfg\.set\()\{.*?\}(?=\);)", html)
+            yield from self._iter_continuations(
+                endpoint=endpoint,
+                request_body=request_body,
+                token=token,
+                known_post_ids=known_post_ids,
+                stop_after_known=stop_after_known,
+                known_run=known_run,
+                crawl_state=crawl_state,
+            )
 
-            if context_match:
-                context_dict: dict = json.loads(context_match.group())
+    def get_cached_init_info(self, url: str) -> InitData | None:
+        # the api key and browse request of a channel are reused across crawls
+        with self.init_data_lock:
+            init_data = self.init_data.get(url)
 
-                return_data.api_key = context_dict.get("INNERTUBE_API_KEY", "")
+        if init_data is None and self.init_data_cache:
+            cached = self.init_data_cache.get(url=url)
 
-                return_data.request_body["context"] = context_dict.get(
-                    "INNERTUBE_CONTEXT", {}
-                )
-                return_data.request_body["context"]["client"]["hl"] = "en"
-                return_data.request_body["context"]["client"]["gl"] = "US"
+            if cached:
+                init_data = InitData(**cached)
 
-        return return_data
+                with self.init_data_lock:
+                    self.init_data[url] = init_data
 
-    def get_individual_post(self, url: str) -> dict | None:
-        if self.cookies.get("SAPISID"):
-            self.headers[
-                "Authorization"
-            ] = f"SAPISIDHASH {self.calculate_sapisidhash()}"
+        return init_data
+
+    def cache_init_info(self, url: str, init_data: InitData) -> None:
+        if not init_data.api_key or not init_data.request_body:
+            return
+
+        with self.init_data_lock:
+            self.init_data[url] = init_data
+
+        if self.init_data_cache:
+            self.init_data_cache.put(url=url, init_data=init_data.dict())
+
+    def discard_init_info(self, url: str) -> None:
+        logger.info(f"Init data of '{url}' was rejected, loading the channel page again")
+
+        with self.init_data_lock:
+            self.init_data.pop(url, None)
+
+        if self.init_data_cache:
+            self.init_data_cache.discard(url=url)
+
+    def get_browse_endpoint(self, init_data: InitData) -> str:
+        return f"{self.transport.origin}/youtubei/v1/browse?key={init_data.api_key}&prettyPrint=false"
+
+    def _get_first_page(
+        self, url: str, refresh: bool = False
+    ) -> tuple[str, dict, list[dict] | None]:
+        init_data = None if refresh else self.get_cached_init_info(url=url)
+        cached = init_data is not None
+
+        if not cached:
+            init_data = self.extract_init_info(url=url)
+            self.cache_init_info(url=url, init_data=init_data)
+
+        if not init_data.api_key or not init_data.request_body:
+            return "", dict(), None
+
+        endpoint = self.get_browse_endpoint(init_data=init_data)
+
+        # copied, the continuation token is added to the body while crawling
+        request_body = dict(init_data.request_body)
+
+        init_posts = self._get_posts_init(endpoint=endpoint, body=request_body)
+
+        if init_posts is None and cached:
+            self.discard_init_info(url=url)
+            return self._get_first_page(url=url, refresh=True)
+
+        return endpoint, request_body, init_posts
 
-        response = requests.get(url=url, headers=self.headers, cookies=self.cookies)
+    def get_posts(
+        self,
+        url: str,
+        known_post_ids: Container[str] = None,
+        stop_after_known: int = 0,
+        crawl_state: CrawlState = None,
+    ) -> list[dict]:
+        posts: list[dict] = list()
+
+        for page in self.iter_posts(
+            url=url,
+            known_post_ids=known_post_ids,
+            stop_after_known=stop_after_known,
+            crawl_state=crawl_state,
+        ):
+            posts += page
+
+        return posts
+
+    def extract_init_info(self, url: str) -> InitData:
+        response = self.transport.get(url=url, cookies=True, cache=True)
 
         if response.status_code == 200:
-            html = response.text
+            with self.metrics.timer("parse:channel_page"):
+                return self._parse_init_info(html=response.text)
 
-            init_data_match = re.search(
-                "(?<=var ytInitialData = ){.*?}(?=;<\/script>)", html
+        return InitData()
+
+    def _parse_init_info(self, html: str) -> InitData:
+        return_data = InitData()
+
+        try:
+            init_data = extract_initial_data(html=html)
+        except PageDataError as error:
+            logger.warning(f"channel page could not be parsed - {error}")
+            init_data = None
+
+        if init_data:
+            tabs: list[dict] = (
+                init_data.get("contents", {})
+                .get("twoColumnBrowseResultsRenderer", {})
+                .get("tabs", [])
             )
 
-            if init_data_match:
-                init_data: dict = json.loads(init_data_match.group())
+            for tab in tabs:
+                if self.is_community_tab(tab=tab):
+                    endpoint = (
+                        tab.get("tabRenderer", {})
+                        .get("endpoint", {})
+                        .get("browseEndpoint", {})
+                    )
 
-                tabs: list[dict] = (
-                    init_data.get("contents", {})
-                    .get("twoColumnBrowseResultsRenderer", {})
-                    .get("tabs", [])
-                )
+                    return_data.request_body["browseId"] = endpoint.get(
+                        "browseId", ""
+                    )
+                    return_data.request_body["params"] = endpoint.get("params", "")
+
+        try:
+            context_dict = extract_ytcfg(html=html)
+        except PageDataError as error:
+            logger.warning(f"channel page could not be parsed - {error}")
+            context_dict = None
+
+        if context_dict:
+            return_data.api_key = context_dict.get("INNERTUBE_API_KEY", "")
+
+            return_data.request_body["context"] = context_dict.get(
+                "INNERTUBE_CONTEXT", {}
+            )
+            client = return_data.request_body["context"].setdefault("client", {})
+            client["hl"] = "en"
+            client["gl"] = "US"
+
+        return return_data
+
+    def get_individual_post(self, url: str) -> dict | None:
+        response = self.transport.get(url=url, api=True, cache=True)
+
+        if response.status_code == 200:
+            with self.metrics.timer("parse:post_page"):
+                post = self._parse_individual_post(html=response.text)
+
+            if post:
+                post_id = self.get_post_id(post=post)
 
-                for tab in tabs:
-                    if self.is_community_tab(tab=tab):
-                        post = (
-                            tab.get("tabRenderer", {})
-                            .get("content", {})
-                            .get("sectionListRenderer", {})
-                            .get("contents", [dict()])[0]
-                            .get("itemSectionRenderer", {})
-                            .get("contents", [dict()])[0]
-                        )
-
-                        post_id = (
-                            post.get("backstagePostThreadRenderer", {})
-                            .get("post", {})
-                            .get("backstagePostRenderer", {})
-                            .get("postId", "")
-                        )
-
-                        if post_id and post_id not in self.extracted_posts:
-                            self.extracted_posts.add(post_id)
-                            return post
+                if post_id and self._claim_post_id(post_id=post_id):
+                    return post
         else:
             logger.warning(
                 f"error extracting '{url}' - response-code: {response.status_code}"
             )
 
-    def calculate_sapisidhash(self):
-        origin = "https://www.youtube.com"
-        timestamp = int(time.time())
+    def _parse_individual_post(self, html: str) -> dict | None:
+        return parse_individual_post(html=html)
 
-        hashinput = f"{timestamp} {self.cookies.get('SAPISID','')} {origin}"
+    def fetch_post_page(self, url: str) -> tuple[bytes, str] | None:
+        # only moves the bytes of the page, parsing is left to the caller
+        try:
+            response = self.transport.get(url=url, api=True, cache=True)
+        except Exception as error:
+            logger.warning(f"error extracting '{url}' - {error}")
+            return None
 
-        sha1 = hashlib.sha1()
+        if response.status_code != 200:
+            logger.warning(
+                f"error extracting '{url}' - response-code: {response.status_code}"
+            )
+            return None
 
-        sha1.update(hashinput.encode())
+        return response.content, response.encoding or "utf-8"
 
-        SAPISIDHASH = f"{timestamp}_{sha1.hexdigest()}"
+    def get_individual_posts(
+        self, urls: Iterable[str], workers: int = 1
+    ) -> Iterator[tuple[str, dict | None]]:
+        if workers <= 1:
+            for url in urls:
+                yield url, self._fetch_individual_post(url=url)
+            return
 
-        return SAPISIDHASH
+        # map() keeps the input order, which is used for directory numbering
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            urls = list(urls)
 
-    def is_community_tab(self, tab: dict) -> bool:
-        web_endpoint_url = (
-            tab.get("tabRenderer", {})
-            .get("endpoint", {})
-            .get("commandMetadata", {})
-            .get("webCommandMetadata", {})
-            .get("url", "")
-        )
+            for url, post in zip(urls, executor.map(self._fetch_individual_post, urls)):
+                yield url, post
+
+    def _fetch_individual_post(self, url: str) -> dict | None:
+        try:
+            return self.get_individual_post(url=url)
+        except Exception as error:
+            logger.warning(f"error extracting '{url}' - {error}")
 
-        return web_endpoint_url.endswith("/community")
+    def is_community_tab(self, tab: dict) -> bool:
+        return is_community_tab(tab=tab)
@@ -0,0 +1,66 @@
+import os
+import time
+import logging
+from threading import Lock
+
+from src import codec
+
+logger = logging.getLogger(name=__name__)
+
+INIT_DATA_FILE = ".init-data.json"
+
+# the api key and client version of a channel page change rarely, values the
+# api rejects are refreshed before they expire
+INIT_DATA_TTL = 24 * 60 * 60
+
+
+class InitDataCache:
+    # Keeps the api key and browse request of channels between runs, so a
+    # crawl can start at the browse endpoint instead of the channel page.
+    def __init__(self, cache_file: str, ttl: float = INIT_DATA_TTL) -> None:
+        self.cache_file = cache_file
+        self.ttl = ttl
+
+        self.lock = Lock()
+        self.entries: dict[str, dict] = self.load()
+
+    def load(self) -> dict[str, dict]:
+        if not os.path.isfile(self.cache_file):
+            return dict()
+
+        try:
+            with open(self.cache_file, "rb") as f:
+                return codec.loads(f.read())
+        except Exception as error:
+            logger.warning(f"Init data cache could not be loaded: '{error}'")
+            return dict()
+
+    def save(self) -> None:
+        temp_file = f"{self.cache_file}.tmp"
+
+        try:
+            with open(temp_file, "wb") as f:
+                f.write(codec.dumps(self.entries, pretty=False))
+
+            os.replace(temp_file, self.cache_file)
+        except Exception as error:
+            logger.warning(f"Init data cache could not be written: '{error}'")
+
+    def get(self, url: str) -> dict | None:
+        with self.lock:
+            entry = self.entries.get(url)
+
+        if not entry or time.time() - entry.get("saved_at", 0) > self.ttl:
+            return None
+
+        return entry.get("init_data")
+
+    def put(self, url: str, init_data: dict) -> None:
+        with self.lock:
+            self.entries[url] = {"init_data": init_data, "saved_at": time.time()}
+            self.save()
+
+    def discard(self, url: str) -> None:
+        with self.lock:
+            if self.entries.pop(url, None) is not None:
+                self.save()
@@ -0,0 +1,107 @@
+import os
+import shutil
+import hashlib
+import logging
+from threading import Lock
+
+from src import codec
+
+logger = logging.getLogger(name=__name__)
+
+MEDIA_STORE_DIR = ".media"
+
+
+class MediaStore:
+    def __init__(self, store_path: str, save_every: int = 100) -> None:
+        self.store_path = store_path
+        self.index_file = os.path.join(store_path, "index.json")
+        self.save_every = save_every
+
+        self.lock = Lock()
+        self.unsaved = 0
+
+        if not os.path.isdir(self.store_path):
+            os.makedirs(self.store_path)
+
+        # normalized image url -> sha256 of the content
+        self.index: dict[str, str] = self.load_index()
+
+    def load_index(self) -> dict[str, str]:
+        if not os.path.isfile(self.index_file):
+            return dict()
+
+        try:
+            with open(self.index_file, "rb") as f:
+                return codec.loads(f.read())
+        except Exception as error:
+            logger.warning(f"Media store index could not be loaded: '{error}'")
+            return dict()
+
+    def save_index(self) -> None:
+        with self.lock:
+            temp_file = f"{self.index_file}.tmp"
+
+            with open(temp_file, "wb") as f:
+                f.write(codec.dumps(self.index, pretty=False))
+
+            os.replace(temp_file, self.index_file)
+
+            self.unsaved = 0
+
+    def get_blob_path(self, digest: str) -> str:
+        return os.path.join(self.store_path, digest[:2], digest)
+
+    def lookup(self, image_id: str) -> str | None:
+        with self.lock:
+            digest = self.index.get(image_id)
+
+        if digest:
+            blob_path = self.get_blob_path(digest=digest)
+
+            if os.path.isfile(blob_path):
+                return blob_path
+
+        return None
+
+    def link(self, blob_path: str, file: str) -> None:
+        if os.path.exists(file):
+            os.remove(file)
+
+        try:
+            os.link(blob_path, file)
+        except OSError:
+            shutil.copyfile(blob_path, file)
+
+    def add(self, image_id: str, file: str) -> None:
+        sha256 = hashlib.sha256()
+
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+
+        digest = sha256.hexdigest()
+        blob_path = self.get_blob_path(digest=digest)
+
+        with self.lock:
+            if os.path.isfile(blob_path):
+                # identical content is already stored, e.g. a reposted image
+                self.link(blob_path=blob_path, file=file)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+                try:
+                    os.link(file, blob_path)
+                except OSError:
+                    shutil.copyfile(file, blob_path)
+
+            self.index[image_id] = digest
+            self.unsaved += 1
+
+            save = self.unsaved >= self.save_every
+
+        if save:
+            self.save_index()
+
+    def close(self) -> None:
+        if self.unsaved:
+            self.save_index()
@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import urllib.parse
+from threading import Lock
+from contextlib import contextmanager
+
+from src import codec
+
+logger = logging.getLogger(name=__name__)
+
+PROMETHEUS_PREFIX = "yt_community_posts"
+
+
+def get_request_kind(url: str, origin: str) -> str:
+    if not url.startswith(origin):
+        return "media"
+
+    path = urllib.parse.urlparse(url).path
+
+    if path.startswith("/youtubei/"):
+        return "browse"
+
+    if path.startswith("/post/"):
+        return "post_page"
+
+    return "channel_page"
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.started = time.time()
+        self.start = time.perf_counter()
+
+        # phase -> [seconds, calls], phases running on several threads add up
+        self.phases: dict[str, list] = dict()
+        # (name, sorted label items) -> value
+        self.counters: dict[tuple[str, tuple], float] = dict()
+
+    @contextmanager
+    def timer(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase=phase, seconds=time.perf_counter() - start)
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        with self.lock:
+            timing = self.phases.setdefault(phase, [0.0, 0])
+            timing[0] += seconds
+            timing[1] += 1
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def get_count(self, name: str, **labels: str) -> float:
+        # sums up every counter of the name matching the given labels
+        with self.lock:
+            return sum(
+                value
+                for (counter, counter_labels), value in self.counters.items()
+                if counter == name and set(labels.items()) <= set(counter_labels)
+            )
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            counters: dict[str, list[dict]] = dict()
+
+            for (name, labels), value in sorted(self.counters.items()):
+                counters.setdefault(name, []).append(
+                    {"labels": dict(labels), "value": value}
+                )
+
+            return {
+                "started": self.started,
+                "duration": round(time.perf_counter() - self.start, 4),
+                "phases": {
+                    phase: {"seconds": round(seconds, 4), "calls": calls}
+                    for phase, (seconds, calls) in sorted(self.phases.items())
+                },
+                "counters": counters,
+            }
+
+    def to_prometheus(self) -> str:
+        report = self.to_dict()
+
+        lines = [
+            f"# TYPE {PROMETHEUS_PREFIX}_run_duration_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_run_duration_seconds {report['duration']}",
+            f"# TYPE {PROMETHEUS_PREFIX}_last_run_timestamp_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_last_run_timestamp_seconds {report['started']:.0f}",
+            f"# TYPE {PROMETHEUS_PREFIX}_phase_seconds gauge",
+        ]
+
+        for phase, timing in report["phases"].items():
+            lines.append(f'{PROMETHEUS_PREFIX}_phase_seconds{{phase="{phase}"}} {timing["seconds"]}')
+
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_phase_calls gauge")
+
+        for phase, timing in report["phases"].items():
+            lines.append(f'{PROMETHEUS_PREFIX}_phase_calls{{phase="{phase}"}} {timing["calls"]}')
+
+        for name, values in report["counters"].items():
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} gauge")
+
+            for entry in values:
+                labels = ",".join(
+                    f'{label}="{value}"' for label, value in entry["labels"].items()
+                )
+                labels = f"{{{labels}}}" if labels else ""
+
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{labels} {entry['value']}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, report_file: str) -> None:
+        write_atomic(file=report_file, content=codec.dumps(self.to_dict()))
+
+    def write_prometheus(self, prometheus_file: str) -> None:
+        # the textfile collector may read the file at any time, so it is
+        # replaced in one step
+        write_atomic(file=prometheus_file, content=self.to_prometheus().encode("utf-8"))
+
+    def log_summary(self) -> None:
+        for phase, timing in self.to_dict()["phases"].items():
+            logger.info(f"{phase}: {timing['seconds']:.2f}s in {timing['calls']} calls")
+
+
+def write_atomic(file: str, content: bytes) -> None:
+    temp_file = f"{file}.tmp"
+
+    with open(temp_file, "wb") as f:
+        f.write(content)
+
+    os.replace(temp_file, file)
@@ -0,0 +1,69 @@
+import json
+
+INITIAL_DATA_MARKERS = [
+    "var ytInitialData = ",
+    'window["ytInitialData"] = ',
+]
+YTCFG_MARKER = "ytcfg.set("
+
+decoder = json.JSONDecoder()
+
+
+class PageDataError(Exception):
+    pass
+
+
+def _decode_at(html: str, index: int) -> tuple[dict, int]:
+    # raw_decode stops at the end of the JSON value, so every marker is only
+    # decoded once instead of being matched against the rest of the page
+    while index < len(html) and html[index].isspace():
+        index += 1
+
+    return decoder.raw_decode(html, index)
+
+
+def extract_initial_data(html: str) -> dict:
+    for marker in INITIAL_DATA_MARKERS:
+        index = html.find(marker)
+
+        if index == -1:
+            continue
+
+        try:
+            initial_data, _ = _decode_at(html=html, index=index + len(marker))
+        except json.JSONDecodeError as error:
+            raise PageDataError(f"ytInitialData could not be decoded: {error}")
+
+        if not isinstance(initial_data, dict):
+            raise PageDataError(f"ytInitialData is not a JSON object")
+
+        return initial_data
+
+    raise PageDataError(f"ytInitialData not found in page")
+
+
+def extract_ytcfg(html: str) -> dict:
+    # pages call ytcfg.set() several times, all object blocks are merged
+    ytcfg: dict = dict()
+    found = False
+
+    index = html.find(YTCFG_MARKER)
+
+    while index != -1:
+        start = index + len(YTCFG_MARKER)
+        next_index = start
+
+        if html.startswith("{", start):
+            try:
+                block, next_index = _decode_at(html=html, index=start)
+                ytcfg.update(block)
+                found = True
+            except json.JSONDecodeError:
+                pass
+
+        index = html.find(YTCFG_MARKER, next_index)
+
+    if not found:
+        raise PageDataError(f"no ytcfg.set({{...}}) block found in page")
+
+    return ytcfg
@@ -0,0 +1,131 @@
+import time
+import logging
+import multiprocessing
+from collections import deque
+from contextlib import nullcontext
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from src.extractor import PostExtractor, get_post_id, parse_individual_post
+from src.content_exporter import PreparedPost, prepare_post
+
+logger = logging.getLogger(name=__name__)
+
+# pages / posts per worker that may wait between two stages
+STAGE_BUFFER = 2
+
+
+def init_worker(level: int) -> None:
+    # spawned workers don't inherit the logging setup of the main process
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s: %(message)s")
+
+
+def create_parse_pool(parse_workers: int) -> ProcessPoolExecutor:
+    # spawned instead of forked, the network threads may hold locks
+    return ProcessPoolExecutor(
+        max_workers=parse_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(logging.getLogger().level,),
+    )
+
+
+def prepare_post_page(
+    content: bytes, encoding: str, compact_json: bool
+) -> PreparedPost | None:
+    start = time.perf_counter()
+    post = parse_individual_post(html=content.decode(encoding, errors="replace"))
+    parse_time = time.perf_counter() - start
+
+    if not post or not get_post_id(post=post):
+        return None
+
+    prepared_post = prepare_post(post_dict=post, compact_json=compact_json)
+    prepared_post.timings["parse:post_page"] = parse_time
+
+    return prepared_post
+
+
+def iter_prepared_posts(
+    extractor: PostExtractor,
+    urls: Iterable[str],
+    fetch_workers: int,
+    parse_workers: int,
+    compact_json: bool = False,
+    parse_pool: ProcessPoolExecutor = None,
+) -> Iterator[tuple[str, PreparedPost | None]]:
+    # Network threads only fetch the post pages, a pool of processes parses,
+    # renders and encodes them. Both stages hold a bounded number of pages,
+    # so neither the fetched pages nor the prepared posts pile up when the
+    # consumer falls behind. Posts are yielded in the order of the urls.
+    # Spawning the parse workers is expensive, callers that iterate several
+    # times pass in a pool of parse_workers processes that they shut down.
+    fetch_workers = max(fetch_workers, 1)
+    max_fetches = fetch_workers * STAGE_BUFFER
+    max_parses = parse_workers * STAGE_BUFFER
+
+    fetches: deque[tuple[str, Future]] = deque()
+    parses: deque[tuple[str, Future | None]] = deque()
+    urls = iter(urls)
+
+    owned_pool = None
+    if parse_pool is None:
+        parse_pool = owned_pool = create_parse_pool(parse_workers=parse_workers)
+
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetch_pool, (
+        owned_pool if owned_pool is not None else nullcontext()
+    ):
+
+        def fill_fetches() -> None:
+            while len(fetches) < max_fetches:
+                url = next(urls, None)
+
+                if url is None:
+                    return
+
+                fetches.append((url, fetch_pool.submit(extractor.fetch_post_page, url)))
+
+        fill_fetches()
+
+        while fetches or parses:
+            if fetches and len(parses) < max_parses:
+                url, fetch = fetches.popleft()
+                page = fetch.result()
+                fill_fetches()
+
+                parse = None
+                if page:
+                    content, encoding = page
+                    parse = parse_pool.submit(prepare_post_page, content, encoding, compact_json)
+
+                parses.append((url, parse))
+                continue
+
+            url, parse = parses.popleft()
+
+            yield url, get_prepared_post(extractor=extractor, url=url, parse=parse)
+
+
+def get_prepared_post(
+    extractor: PostExtractor, url: str, parse: Future | None
+) -> PreparedPost | None:
+    if parse is None:
+        return None
+
+    try:
+        prepared_post = parse.result()
+    except Exception as error:
+        logger.warning(f"error extracting '{url}' - {error}")
+        return None
+
+    if not prepared_post:
+        return None
+
+    for phase, seconds in prepared_post.timings.items():
+        extractor.metrics.add_time(phase=phase, seconds=seconds)
+
+    # posts are claimed like in get_individual_post, so duplicates are dropped
+    if not extractor._claim_post_id(post_id=prepared_post.post_id):
+        return None
+
+    return prepared_post
@@ -0,0 +1,242 @@
+import os
+import re
+import logging
+import urllib.parse
+from collections import OrderedDict
+from collections.abc import Container, Iterator
+
+from src import codec
+
+logger = logging.getLogger(name=__name__)
+
+POST_IDS_CHECKPOINT_FILE = ".post-ids-checkpoint.json"
+
+POST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# number of recently read ids duplicates are detected against, ids that were
+# already exported are detected through the archive
+DEDUPE_WINDOW = 100_000
+CHUNK_SIZE = 1000
+
+# runs a post id that could not be exported is retried in
+MAX_POST_ATTEMPTS = 5
+
+
+def normalize_post_id(line: str) -> str | None:
+    # accepts bare ids, /post/<id> urls and ?lb=<id> community tab links
+    value = line.strip().lstrip("\ufeff")
+
+    if not value or value.startswith("#"):
+        return None
+
+    if "/" in value or "?" in value:
+        parsed_url = urllib.parse.urlparse(value if "://" in value else f"https://{value}")
+        lb = urllib.parse.parse_qs(parsed_url.query).get("lb")
+
+        value = lb[0] if lb else parsed_url.path.rstrip("/").split("/")[-1]
+
+    if not POST_ID_PATTERN.match(value):
+        logger.warning(f"'{line.strip()}' is not a post id or post url")
+        return None
+
+    return value
+
+
+class PostIdReader:
+    def __init__(
+        self,
+        posts_file: str,
+        checkpoint_file: str = None,
+        chunk_size: int = CHUNK_SIZE,
+        dedupe_window: int = DEDUPE_WINDOW,
+    ) -> None:
+        self.posts_file = posts_file
+        self.checkpoint_file = checkpoint_file
+        self.chunk_size = chunk_size
+        self.dedupe_window = dedupe_window
+
+        self.recent_ids: OrderedDict[str, None] = OrderedDict()
+
+        # the file the checkpoint belongs to, a rewritten or appended file is
+        # read from the start again
+        stat = os.stat(self.posts_file)
+        self.file_key = {
+            "posts_file": os.path.abspath(self.posts_file),
+            "inode": stat.st_ino,
+            "mtime": stat.st_mtime_ns,
+        }
+
+        # ids of the last yielded chunk and ids that failed in earlier chunks
+        # or runs, with the number of attempts
+        self.chunk: list[str] = list()
+        self.failed_post_ids: dict[str, int] = dict()
+        self.complete = False
+
+        # ids that are archived under another id, a share is archived under
+        # the id of the original post
+        self.archived_ids: dict[str, str] = dict()
+
+        self.offset = self.load_checkpoint()
+
+    def load_checkpoint(self) -> int:
+        if not self.checkpoint_file or not os.path.isfile(self.checkpoint_file):
+            return 0
+
+        try:
+            with open(self.checkpoint_file, "rb") as f:
+                checkpoint = codec.loads(f.read())
+        except Exception as error:
+            logger.warning(f"Post id checkpoint could not be loaded: '{error}'")
+            return 0
+
+        # these hold for any file, unlike the offset
+        self.archived_ids = checkpoint.get("archived_ids", {})
+
+        if any(checkpoint.get(key) != value for key, value in self.file_key.items()):
+            logger.info(
+                f"'{self.posts_file}' changed since the last run, reading it from the start"
+            )
+            return 0
+
+        offset = checkpoint.get("offset", 0)
+        self.failed_post_ids = checkpoint.get("failed", {})
+
+        if offset:
+            logger.info(f"Resuming '{self.posts_file}' at byte {offset}")
+
+        return offset
+
+    def is_exported(self, post_id: str, known_post_ids: Container[str]) -> bool:
+        return self.archived_ids.get(post_id, post_id) in known_post_ids
+
+    def save_checkpoint(
+        self, archived_ids: dict[str, str] = None, known_post_ids: Container[str] = ()
+    ) -> None:
+        # Takes the archived id of every id of the last chunk that could be
+        # retrieved. Ids whose post isn't archived are retried by the next
+        # run. The checkpoint is removed once the whole file is read and
+        # nothing is left to retry or to remember.
+        archived_ids = archived_ids if archived_ids else dict()
+
+        for post_id in self.chunk:
+            archived_id = archived_ids.get(post_id)
+
+            if archived_id and archived_id in known_post_ids:
+                if archived_id != post_id:
+                    self.archived_ids[post_id] = archived_id
+
+                self.failed_post_ids.pop(post_id, None)
+                continue
+
+            attempts = self.failed_post_ids.get(post_id, 0) + 1
+
+            if attempts >= MAX_POST_ATTEMPTS:
+                logger.error(f"Post '{post_id}': giving up after {attempts} attempts")
+                self.failed_post_ids.pop(post_id, None)
+            else:
+                self.failed_post_ids[post_id] = attempts
+
+        self.chunk = list()
+
+        if not self.checkpoint_file:
+            return
+
+        if self.complete and not self.failed_post_ids and not self.archived_ids:
+            if os.path.isfile(self.checkpoint_file):
+                os.remove(self.checkpoint_file)
+            return
+
+        temp_file = f"{self.checkpoint_file}.tmp"
+
+        with open(temp_file, "wb") as f:
+            f.write(
+                codec.dumps(
+                    {
+                        **self.file_key,
+                        "offset": self.offset,
+                        "failed": self.failed_post_ids,
+                        "archived_ids": self.archived_ids,
+                    },
+                    pretty=False,
+                )
+            )
+
+        os.replace(temp_file, self.checkpoint_file)
+
+    def is_duplicate(self, post_id: str) -> bool:
+        if post_id in self.recent_ids:
+            self.recent_ids.move_to_end(post_id)
+            return True
+
+        self.recent_ids[post_id] = None
+
+        if len(self.recent_ids) > self.dedupe_window:
+            self.recent_ids.popitem(last=False)
+
+        return False
+
+    def iter_chunks(self, known_post_ids: Container[str] = ()) -> Iterator[list[str]]:
+        # Yields the new post ids in chunks, the ids that failed before first,
+        # then the file from the checkpoint on. The offset is past the yielded
+        # chunk, call save_checkpoint() once the chunk has been exported.
+        retry_ids = list()
+
+        for post_id in list(self.failed_post_ids):
+            self.is_duplicate(post_id=post_id)
+
+            if self.is_exported(post_id=post_id, known_post_ids=known_post_ids):
+                self.failed_post_ids.pop(post_id)
+            else:
+                retry_ids.append(post_id)
+
+        if retry_ids:
+            logger.info(f"Retrying {len(retry_ids)} post id's that failed before")
+
+        for start in range(0, len(retry_ids), self.chunk_size):
+            self.chunk = retry_ids[start : start + self.chunk_size]
+            yield self.chunk
+
+        chunk: list[str] = list()
+        skipped = 0
+
+        with open(self.posts_file, "rb") as f:
+            f.seek(self.offset)
+            offset = self.offset
+
+            for line in f:
+                offset += len(line)
+                post_id = normalize_post_id(line=line.decode("utf-8", errors="replace"))
+
+                if not post_id or self.is_duplicate(post_id=post_id):
+                    continue
+
+                if self.is_exported(post_id=post_id, known_post_ids=known_post_ids):
+                    skipped += 1
+                    continue
+
+                chunk.append(post_id)
+
+                if len(chunk) >= self.chunk_size:
+                    self.offset = offset
+                    self.chunk = chunk
+                    yield chunk
+
+                    chunk = list()
+
+            self.offset = offset
+
+            if chunk:
+                self.chunk = chunk
+                yield chunk
+
+        self.complete = True
+
+        if skipped:
+            logger.info(f"Skipped {skipped} already exported post id's from '{self.posts_file}'")
+
+
+def iter_post_ids(posts_file: str) -> Iterator[str]:
+    reader = PostIdReader(posts_file=posts_file)
+
+    for chunk in reader.iter_chunks():
+        yield from chunk
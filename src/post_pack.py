@@ -0,0 +1,218 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+from threading import Lock
+from collections.abc import Iterable, Iterator
+
+logger = logging.getLogger(name=__name__)
+
+PACK_FILE = "posts.sqlite"
+
+POST_TEXT_FILE = "post.txt"
+POST_JSON_FILE = "post.json"
+
+
+class PackedPost:
+    __slots__ = ("post_id", "slot", "dir_name", "post_json", "post_text", "media")
+
+    def __init__(
+        self,
+        post_id: str,
+        slot: str,
+        dir_name: str,
+        post_json: bytes,
+        post_text: bytes,
+        media: list[str],
+    ) -> None:
+        self.post_id = post_id
+        self.slot = slot
+        self.dir_name = dir_name
+        self.post_json = post_json
+        self.post_text = post_text
+        self.media = media
+
+
+class PostPack:
+    def __init__(self, pack_file: str, compression_level: int = 6) -> None:
+        self.pack_file = pack_file
+        self.compression_level = compression_level
+
+        # one connection shared by all threads, every access holds the lock
+        self.lock = Lock()
+        self.connection = sqlite3.connect(pack_file, check_same_thread=False)
+
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS posts (
+                    post_id TEXT PRIMARY KEY,
+                    slot TEXT NOT NULL,
+                    dir_name TEXT NOT NULL,
+                    post_json BLOB NOT NULL,
+                    post_text BLOB NOT NULL,
+                    exported_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS media (
+                    post_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    PRIMARY KEY (post_id, filename)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS blobs (
+                    digest TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    data BLOB NOT NULL
+                ) WITHOUT ROWID;
+                """
+            )
+            self.connection.commit()
+
+    def __contains__(self, post_id: str) -> bool:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM posts WHERE post_id = ?", (post_id,)
+            ).fetchone()
+
+        return row is not None
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def add_post(self, post_id: str, slot: str, dir_name: str, post_path: str) -> None:
+        # packs a post directory as written by the exporter, the files are
+        # restored byte for byte by materialize()
+        with open(os.path.join(post_path, POST_JSON_FILE), "rb") as f:
+            post_json = zlib.compress(f.read(), self.compression_level)
+
+        with open(os.path.join(post_path, POST_TEXT_FILE), "rb") as f:
+            post_text = zlib.compress(f.read(), self.compression_level)
+
+        media: list[tuple[str, str, bytes]] = list()
+
+        for filename in sorted(os.listdir(post_path)):
+            if filename in [POST_JSON_FILE, POST_TEXT_FILE] or filename.endswith(".part"):
+                continue
+
+            with open(os.path.join(post_path, filename), "rb") as f:
+                data = f.read()
+
+            media.append((filename, hashlib.sha256(data).hexdigest(), data))
+
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM media WHERE post_id = ?", (post_id,))
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?, ?, ?)",
+                    (post_id, slot, dir_name, post_json, post_text, time.time()),
+                )
+
+                for filename, digest, data in media:
+                    # images are already compressed, identical ones are stored once
+                    self.connection.execute(
+                        "INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)",
+                        (digest, len(data), data),
+                    )
+                    self.connection.execute(
+                        "INSERT INTO media VALUES (?, ?, ?)", (post_id, filename, digest)
+                    )
+
+    def set_post_text(self, post_id: str, post_text: bytes) -> None:
+        post_text = zlib.compress(post_text, self.compression_level)
+
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE posts SET post_text = ? WHERE post_id = ?", (post_text, post_id)
+                )
+
+    def get_post(self, post_id: str) -> PackedPost | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT slot, dir_name, post_json, post_text FROM posts WHERE post_id = ?",
+                (post_id,),
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            media = [
+                filename
+                for (filename,) in self.connection.execute(
+                    "SELECT filename FROM media WHERE post_id = ? ORDER BY filename",
+                    (post_id,),
+                )
+            ]
+
+        slot, dir_name, post_json, post_text = row
+
+        return PackedPost(
+            post_id=post_id,
+            slot=slot,
+            dir_name=dir_name,
+            post_json=zlib.decompress(post_json),
+            post_text=zlib.decompress(post_text),
+            media=media,
+        )
+
+    def get_media(self, post_id: str, filename: str) -> bytes | None:
+        with self.lock:
+            row = self.connection.execute(
+                """
+                SELECT blobs.data FROM media JOIN blobs ON media.digest = blobs.digest
+                WHERE media.post_id = ? AND media.filename = ?
+                """,
+                (post_id, filename),
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def iter_post_ids(self) -> Iterator[str]:
+        with self.lock:
+            post_ids = [
+                post_id
+                for (post_id,) in self.connection.execute(
+                    "SELECT post_id FROM posts ORDER BY CAST(slot AS INTEGER)"
+                )
+            ]
+
+        yield from post_ids
+
+    def materialize(self, output_path: str, post_ids: Iterable[str] = None) -> int:
+        # writes the classic '[NNNN] <post_id>' directory layout
+        count = 0
+
+        for post_id in post_ids if post_ids is not None else self.iter_post_ids():
+            packed_post = self.get_post(post_id=post_id)
+
+            if not packed_post:
+                logger.warning(f"Post '{post_id}' is not in the pack")
+                continue
+
+            post_path = os.path.join(
+                output_path, f"[{packed_post.slot}] {packed_post.dir_name}"
+            )
+            os.makedirs(post_path, exist_ok=True)
+
+            with open(os.path.join(post_path, POST_TEXT_FILE), "wb") as f:
+                f.write(packed_post.post_text)
+
+            with open(os.path.join(post_path, POST_JSON_FILE), "wb") as f:
+                f.write(packed_post.post_json)
+
+            for filename in packed_post.media:
+                with open(os.path.join(post_path, filename), "wb") as f:
+                    f.write(self.get_media(post_id=post_id, filename=filename))
+
+            count += 1
+
+        return count
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
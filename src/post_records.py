@@ -0,0 +1,218 @@
+from collections.abc import Callable
+
+# Renderer paths are declared once as dotted strings and compiled into plain
+# subscript chains, so a lookup is a single try block instead of a chain of
+# .get({}) calls that allocates an empty dict or list on every miss.
+LOOKUP_ERRORS = (KeyError, IndexError, TypeError)
+
+
+def compile_path(path: str, default=None) -> Callable[[dict], object]:
+    subscripts: list[str] = list()
+
+    for key in path.split("."):
+        if key.lstrip("-").isdigit():
+            subscripts.append(f"[{int(key)}]")
+        else:
+            subscripts.append(f"[{key!r}]")
+
+    source = (
+        "def accessor(obj):\n"
+        "    try:\n"
+        f"        return obj{''.join(subscripts)}\n"
+        "    except LOOKUP_ERRORS:\n"
+        "        return default\n"
+    )
+
+    namespace = {"LOOKUP_ERRORS": LOOKUP_ERRORS, "default": default}
+    exec(compile(source, f"<path {path}>", "exec"), namespace)
+
+    return namespace["accessor"]
+
+
+# backstagePostRenderer
+POST_ID = compile_path("postId", "no_id_found")
+POST_AUTHOR = compile_path("authorText.runs.0.text", "")
+POST_PUBLISHED_TIME = compile_path("publishedTimeText.runs.0.text", "")
+POST_LIKE_COUNT = compile_path("voteCount.simpleText")
+POST_TEXT_RUNS = compile_path("contentText.runs", ())
+POST_IMAGE_THUMBNAILS = compile_path("backstageAttachment.backstageImageRenderer.image.thumbnails", ())
+POST_MULTI_IMAGES = compile_path("backstageAttachment.postMultiImageRenderer.images", ())
+POST_POLL_CHOICES = compile_path("backstageAttachment.pollRenderer.choices", ())
+POST_VIDEO = compile_path("backstageAttachment.videoRenderer")
+
+# postMultiImageRenderer.images[]
+IMAGE_THUMBNAILS = compile_path("backstageImageRenderer.image.thumbnails", ())
+
+# text runs and thumbnails
+RUN_TEXT = compile_path("text", "")
+RUN_URL = compile_path("navigationEndpoint.commandMetadata.webCommandMetadata.url", "")
+THUMBNAIL_URL = compile_path("url", "")
+
+# pollRenderer.choices[]
+CHOICE_TEXT = compile_path("text.runs.0.text", "Null")
+CHOICE_VOTES = compile_path("numVotes", "")
+CHOICE_PERCENTAGE_VOTED = compile_path("votePercentage.simpleText")
+CHOICE_PERCENTAGE_NOT_VOTED = compile_path("votePercentageIfSelected.simpleText")
+
+# videoRenderer
+VIDEO_TITLE = compile_path("title.runs.0.text", "")
+VIDEO_THUMBNAIL_URL = compile_path("thumbnail.thumbnails.-1.url", "")
+VIDEO_PUBLISHED_TIME = compile_path("publishedTimeText.simpleText", "")
+VIDEO_URL = compile_path("navigationEndpoint.commandMetadata.webCommandMetadata.url", "")
+VIDEO_BADGES = compile_path("badges", ())
+BADGE_LABEL = compile_path("metadataBadgeRenderer.label", "")
+
+# sharedPostRenderer
+SHARE_POST_ID = compile_path("postId", "id_not_found")
+SHARE_AUTHOR = compile_path("displayName.runs.0.text", "N/A")
+SHARE_TEXT_RUNS = compile_path("content.runs", ())
+SHARE_TIME = compile_path("publishedTimeText.runs.0.text", "")
+
+
+class PollOptionRecord:
+    __slots__ = ("votes", "percentage")
+
+    def __init__(self, votes: str = "0", percentage: str = "0%") -> None:
+        self.votes = votes
+        self.percentage = percentage
+
+
+class PostShareRecord:
+    __slots__ = ("share_author", "share_text", "share_time", "share_post_id")
+
+    def __init__(
+        self,
+        share_author: str = "N/A",
+        share_text: str = "",
+        share_time: str = "",
+        share_post_id: str = "",
+    ) -> None:
+        self.share_author = share_author
+        self.share_text = share_text
+        self.share_time = share_time
+        self.share_post_id = share_post_id
+
+
+class PostRecord:
+    __slots__ = (
+        "video_thumbnail_url",
+        "video_url",
+        "video_title",
+        "video_published_time",
+        "video_members_only",
+        "members_only",
+        "author",
+        "post_text",
+        "post_published_time",
+        "post_id",
+        "like_count",
+        "attached_images",
+        "poll",
+        "share",
+    )
+
+    def __init__(self) -> None:
+        self.video_thumbnail_url: str | None = None
+        self.video_url: str | None = None
+        self.video_title: str | None = None
+        self.video_published_time: str | None = None
+        self.video_members_only = False
+        self.members_only = False
+        self.author = ""
+        self.post_text = ""
+        self.post_published_time = ""
+        self.post_id = ""
+        self.like_count: str | None = "0"
+        self.attached_images: list[str] = list()
+        self.poll: dict[str, PollOptionRecord] = dict()
+        self.share: PostShareRecord | None = None
+
+
+def get_post_text(text_runs: list[dict]) -> str:
+    post_text_parts: list[str] = list()
+
+    for text_run in text_runs:
+        text = RUN_TEXT(text_run)
+        navigation_link = RUN_URL(text_run)
+
+        if navigation_link.startswith("/"):
+            navigation_link = f"https://youtube.com{navigation_link}"
+
+        if navigation_link and not text == navigation_link:
+            text = f"{text} ({navigation_link})"
+
+        post_text_parts.append(text)
+
+    return "".join(post_text_parts)
+
+
+def extract_share_record(shared_post: dict) -> PostShareRecord:
+    return PostShareRecord(
+        share_author=SHARE_AUTHOR(shared_post),
+        share_text=get_post_text(text_runs=SHARE_TEXT_RUNS(shared_post)),
+        share_time=SHARE_TIME(shared_post),
+        share_post_id=SHARE_POST_ID(shared_post),
+    )
+
+
+def extract_post_record(post: dict) -> PostRecord:
+    record = PostRecord()
+
+    # General Post content
+    record.post_id = POST_ID(post)
+    record.author = POST_AUTHOR(post)
+    record.post_published_time = POST_PUBLISHED_TIME(post)
+    record.members_only = "sponsorsOnlyBadge" in post
+    record.like_count = POST_LIKE_COUNT(post)
+
+    # Post Text
+    record.post_text = get_post_text(text_runs=POST_TEXT_RUNS(post))
+
+    # Post Images
+    image_urls = record.attached_images
+
+    for thumbnail in POST_IMAGE_THUMBNAILS(post):
+        image_urls.append(THUMBNAIL_URL(thumbnail))
+
+    for image in POST_MULTI_IMAGES(post):
+        for thumbnail in IMAGE_THUMBNAILS(image):
+            image_urls.append(THUMBNAIL_URL(thumbnail))
+
+    # Polls
+    for choice in POST_POLL_CHOICES(post):
+        percentage = CHOICE_PERCENTAGE_VOTED(choice) or CHOICE_PERCENTAGE_NOT_VOTED(choice)
+        votes = CHOICE_VOTES(choice)
+
+        record.poll[CHOICE_TEXT(choice)] = PollOptionRecord(
+            votes=votes if isinstance(votes, str) else str(votes),
+            percentage=percentage if percentage else "",
+        )
+
+    # Video data
+    video = POST_VIDEO(post)
+
+    if video is None:
+        record.video_title = ""
+        record.video_thumbnail_url = ""
+        record.video_published_time = ""
+        record.video_url = ""
+
+        return record
+
+    record.video_title = VIDEO_TITLE(video)
+    record.video_thumbnail_url = VIDEO_THUMBNAIL_URL(video).split("?")[0]
+    record.video_published_time = VIDEO_PUBLISHED_TIME(video)
+
+    video_link = VIDEO_URL(video)
+
+    if video_link.startswith("/"):
+        video_link = f"https://www.youtube.com{video_link}"
+
+    record.video_url = video_link
+
+    for badge in VIDEO_BADGES(video):
+        if BADGE_LABEL(badge) == "Members only":
+            record.video_members_only = True
+            break
+
+    return record
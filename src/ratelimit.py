@@ -0,0 +1,161 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+import email.utils
+
+logger = logging.getLogger(name=__name__)
+
+# responses that signal the server wants us to slow down
+THROTTLE_STATUS_CODES = [429, 503]
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 60,
+    ) -> None:
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def get_delay(self, attempt: int, retry_after: str = None) -> float:
+        # exponential backoff with full jitter, but never shorter than Retry-After
+        delay = random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2**attempt)
+        )
+
+        retry_after_delay = parse_retry_after(retry_after=retry_after)
+        if retry_after_delay is not None:
+            delay = max(delay, min(retry_after_delay, self.backoff_max))
+
+        return delay
+
+
+def parse_retry_after(retry_after: str) -> float | None:
+    if not retry_after:
+        return None
+
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        retry_date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, retry_date.timestamp() - time.time())
+
+
+class AimdLimit:
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 64,
+        decrease_factor: float = 0.5,
+    ) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+
+    def _increase(self) -> None:
+        # additive increase of roughly one slot per window of successful requests
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def _decrease(self) -> None:
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+
+class AdaptiveLimiter(AimdLimit):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+
+        self.condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self.condition:
+            self.condition.wait_for(self._has_capacity)
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False) -> None:
+        with self.condition:
+            self.in_flight -= 1
+
+            if throttled:
+                self._decrease()
+            else:
+                self._increase()
+
+            self.condition.notify_all()
+
+
+class AsyncAdaptiveLimiter(AimdLimit):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+
+        self.condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self.condition:
+            await self.condition.wait_for(self._has_capacity)
+            self.in_flight += 1
+
+    async def release(self, throttled: bool = False) -> None:
+        async with self.condition:
+            self.in_flight -= 1
+
+            if throttled:
+                self._decrease()
+            else:
+                self._increase()
+
+            self.condition.notify_all()
+
+
+class RequestStats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.errors = 0
+        self.cached = 0
+
+    def count(
+        self,
+        requests: int = 0,
+        retries: int = 0,
+        throttled: int = 0,
+        errors: int = 0,
+        cached: int = 0,
+    ) -> None:
+        with self.lock:
+            self.requests += requests
+            self.retries += retries
+            self.throttled += throttled
+            self.errors += errors
+            self.cached += cached
+
+    def as_dict(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "errors": self.errors,
+                "cached": self.cached,
+            }
@@ -0,0 +1,157 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from src import codec
+from src.metrics import Metrics
+from src.post_pack import PostPack, PACK_FILE, POST_JSON_FILE, POST_TEXT_FILE
+from src.content_exporter import (
+    get_post_content,
+    deduplicate_images,
+    render_post_text,
+)
+
+logger = logging.getLogger(name=__name__)
+
+MEMBERS_ONLY_TAG = "(Members only) "
+
+# posts of a pack that are read and sent to the workers at once
+PACK_BATCH_SIZE = 256
+DIRECTORY_CHUNK_SIZE = 32
+
+
+def render_post_json(post_json: bytes, dir_name: str) -> bytes | None:
+    # renders post.txt from a saved post.json, None if that isn't possible
+    try:
+        post = codec.loads(post_json)
+
+        if "sharedPostRenderer" in post:
+            post_root = post
+        elif post.get("postId") == dir_name.removeprefix(MEMBERS_ONLY_TAG):
+            post_root = {"backstagePostRenderer": post}
+        else:
+            # shares exported before post.json included the share only hold
+            # the original post, rendering them would drop the share
+            logger.warning(f"'{dir_name}' is a share without the share in post.json, re-export it instead")
+            return None
+
+        _, post_content = get_post_content(
+            post_dict={"backstagePostThreadRenderer": {"post": post_root}}
+        )
+
+        return render_post_text(
+            post_content=post_content,
+            images=deduplicate_images(images=post_content.attached_images),
+        ).encode("utf-8")
+    except Exception as error:
+        logger.warning(f"'{dir_name}' could not be rendered: {error}")
+        return None
+
+
+def rerender_post_dir(post_path: str) -> str:
+    try:
+        with open(os.path.join(post_path, POST_JSON_FILE), "rb") as f:
+            post_json = f.read()
+    except OSError as error:
+        logger.warning(f"'{post_path}' could not be read: {error}")
+        return "skipped"
+
+    post_text = render_post_json(
+        post_json=post_json, dir_name=os.path.basename(post_path).split("] ", 1)[-1]
+    )
+
+    if post_text is None:
+        return "skipped"
+
+    text_file = os.path.join(post_path, POST_TEXT_FILE)
+
+    if os.path.isfile(text_file):
+        with open(text_file, "rb") as f:
+            if f.read() == post_text:
+                return "unchanged"
+
+    temp_file = f"{text_file}.tmp"
+
+    with open(temp_file, "wb") as f:
+        f.write(post_text)
+
+    os.replace(temp_file, text_file)
+
+    return "rewritten"
+
+
+def rerender_directories(
+    output_path: str, pool: ProcessPoolExecutor, results: dict[str, int]
+) -> None:
+    post_paths = sorted(
+        entry.path
+        for entry in os.scandir(output_path)
+        if entry.is_dir()
+        and entry.name.startswith("[")
+        and os.path.isfile(os.path.join(entry.path, POST_JSON_FILE))
+    )
+
+    for result in pool.map(rerender_post_dir, post_paths, chunksize=DIRECTORY_CHUNK_SIZE):
+        results[result] = results.get(result, 0) + 1
+
+
+def rerender_pack(
+    pack: PostPack, pool: ProcessPoolExecutor, results: dict[str, int]
+) -> None:
+    post_ids = list(pack.iter_post_ids())
+
+    # the pack is read in batches, so only a batch of posts is held in memory
+    for start in range(0, len(post_ids), PACK_BATCH_SIZE):
+        packed_posts = [
+            pack.get_post(post_id=post_id)
+            for post_id in post_ids[start : start + PACK_BATCH_SIZE]
+        ]
+
+        post_texts = pool.map(
+            render_post_json,
+            [packed_post.post_json for packed_post in packed_posts],
+            [packed_post.dir_name for packed_post in packed_posts],
+        )
+
+        for packed_post, post_text in zip(packed_posts, post_texts):
+            if post_text is None:
+                result = "skipped"
+            elif post_text == packed_post.post_text:
+                result = "unchanged"
+            else:
+                pack.set_post_text(post_id=packed_post.post_id, post_text=post_text)
+                result = "rewritten"
+
+            results[result] = results.get(result, 0) + 1
+
+
+def rerender_posts(
+    output_path: str, workers: int = None, metrics: Metrics = None
+) -> dict[str, int]:
+    # rewrites every post.txt of the output dir from its post.json, without
+    # requesting anything from YouTube
+    metrics = metrics if metrics else Metrics()
+    results: dict[str, int] = dict()
+
+    pack_file = os.path.join(output_path, PACK_FILE)
+
+    with metrics.timer("rerender"):
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rerender_directories(output_path=output_path, pool=pool, results=results)
+
+            if os.path.isfile(pack_file):
+                pack = PostPack(pack_file=pack_file)
+                try:
+                    rerender_pack(pack=pack, pool=pool, results=results)
+                finally:
+                    pack.close()
+
+    for result, count in results.items():
+        metrics.count("rerender", value=count, result=result)
+
+    logger.info(
+        f"Re-rendered posts: {results.get('rewritten', 0)} rewritten - "
+        f"{results.get('unchanged', 0)} unchanged - {results.get('skipped', 0)} skipped"
+    )
+
+    return results
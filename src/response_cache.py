@@ -0,0 +1,200 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+from threading import Lock
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from src import codec
+
+logger = logging.getLogger(name=__name__)
+
+RESPONSE_CACHE_FILE = "responses.sqlite"
+
+# stored bodies are already decoded, these headers no longer describe them
+SKIPPED_HEADERS = [
+    "content-encoding",
+    "content-length",
+    "transfer-encoding",
+    "connection",
+    "set-cookie",
+]
+
+
+def get_identity(cookies: dict) -> str:
+    # responses depend on who is logged in, e.g. members-only posts, so they
+    # are only shared between requests with the same cookies
+    if not cookies:
+        return ""
+
+    identity = hashlib.sha256()
+    for name, value in sorted(cookies.items()):
+        identity.update(f"{name}={value}\0".encode("utf-8"))
+
+    return identity.hexdigest()
+
+
+class CachedResponse:
+    __slots__ = ("status", "headers", "content")
+
+    def __init__(self, status: int, headers: dict[str, str], content: bytes) -> None:
+        self.status = status
+        self.headers = headers
+        self.content = content
+
+    def to_response(self, url: str) -> requests.Response:
+        response = requests.Response()
+        response.status_code = self.status
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = url
+        response._content = self.content
+
+        return response
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        cache_dir: str,
+        ttl: float = 0,
+        replay: bool = False,
+        compression_level: int = 6,
+    ) -> None:
+        self.cache_file = os.path.join(cache_dir, RESPONSE_CACHE_FILE)
+        self.ttl = ttl
+        self.replay = replay
+        self.compression_level = compression_level
+
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        # one connection shared by all threads, every access holds the lock
+        self.connection = sqlite3.connect(self.cache_file, check_same_thread=False)
+
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key BLOB PRIMARY KEY,
+                    method TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    headers BLOB NOT NULL,
+                    body BLOB NOT NULL,
+                    stored_at REAL NOT NULL
+                ) WITHOUT ROWID
+                """
+            )
+            self.connection.commit()
+
+    def get_key(
+        self, method: str, url: str, data: bytes | str | None, identity: str = ""
+    ) -> bytes:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        key = hashlib.sha256()
+
+        # anonymous requests keep the keys of caches recorded without identity
+        if identity:
+            key.update(identity.encode("utf-8"))
+            key.update(b"\0")
+
+        key.update(method.upper().encode("utf-8"))
+        key.update(b"\0")
+        key.update(url.encode("utf-8"))
+        key.update(b"\0")
+        key.update(data if data else b"")
+
+        return key.digest()
+
+    def get(
+        self, method: str, url: str, data: bytes | str = None, identity: str = ""
+    ) -> CachedResponse | None:
+        # Recording always goes to the network and overwrites the entry, only
+        # a replay or a positive ttl answers requests from the cache. Expired
+        # responses are still good enough for a replay.
+        if not self.replay and self.ttl <= 0:
+            with self.lock:
+                self.misses += 1
+
+            return None
+
+        key = self.get_key(method=method, url=url, data=data, identity=identity)
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT status, headers, body, stored_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+            fresh = row is not None and (
+                self.replay or time.time() - row[3] <= self.ttl
+            )
+
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if not fresh:
+            return None
+
+        status, headers, body, _ = row
+
+        return CachedResponse(
+            status=status, headers=codec.loads(headers), content=zlib.decompress(body)
+        )
+
+    def put(
+        self,
+        method: str,
+        url: str,
+        data: bytes | str | None,
+        status: int,
+        headers,
+        content: bytes,
+        identity: str = "",
+    ) -> None:
+        key = self.get_key(method=method, url=url, data=data, identity=identity)
+
+        stored_headers = {
+            name: value
+            for name, value in headers.items()
+            if name.lower() not in SKIPPED_HEADERS
+        }
+
+        body = zlib.compress(content, self.compression_level)
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    method.upper(),
+                    url,
+                    status,
+                    codec.dumps(stored_headers, pretty=False),
+                    body,
+                    time.time(),
+                ),
+            )
+            self.connection.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+        logger.info(f"Response cache: {self.hits} hits - {self.misses} misses")
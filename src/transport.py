@@ -0,0 +1,309 @@
+import time
+import hashlib
+import logging
+import urllib.parse
+from threading import Lock, BoundedSemaphore
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.response_cache import ResponseCache, CachedResponse, get_identity
+from src.metrics import Metrics, get_request_kind
+from src.ratelimit import (
+    RetryPolicy,
+    RequestStats,
+    AdaptiveLimiter,
+    RETRY_STATUS_CODES,
+    THROTTLE_STATUS_CODES,
+)
+
+try:
+    import brotli  # noqa: F401 - enables br decoding in urllib3
+
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+logger = logging.getLogger(name=__name__)
+
+YOUTUBE_ORIGIN = "https://www.youtube.com"
+
+
+class Transport:
+    def __init__(
+        self,
+        cookies: dict = None,
+        pool_connections: int = 4,
+        pool_maxsize: int = 16,
+        max_requests: int = 0,
+        timeout: float = 30,
+        retry_policy: RetryPolicy = None,
+        origin: str = YOUTUBE_ORIGIN,
+        response_cache: ResponseCache = None,
+        metrics: Metrics = None,
+    ) -> None:
+        self.cookies = cookies if cookies else dict()
+        self.origin = origin
+        self.response_cache = response_cache
+        self.cache_identity = get_identity(cookies=self.cookies)
+        self.metrics = metrics if metrics else Metrics()
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+
+        # global budget of concurrent requests, shared by everything using this transport
+        self.request_limit = BoundedSemaphore(max_requests) if max_requests else None
+
+        cookie_header = "; ".join([f"{k}={v}" for k, v in self.cookies.items()])
+
+        self.api_headers = {
+            "Cookie": cookie_header,
+            "X-Goog-AuthUser": "0",
+            "X-Origin": self.origin,
+            "X-Youtube-Bootstrap-Logged-In": "true",
+        }
+
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self.stats = RequestStats()
+
+        self.sessions: dict[str, requests.Session] = dict()
+        self.host_limiters: dict[str, AdaptiveLimiter] = dict()
+        self.sessions_lock = Lock()
+
+        self.sapisidhash: tuple[int, str] = (0, "")
+
+    def get_host_limiter(self, url: str) -> AdaptiveLimiter:
+        host = urllib.parse.urlparse(url).netloc
+
+        with self.sessions_lock:
+            limiter = self.host_limiters.get(host)
+
+            if not limiter:
+                limiter = AdaptiveLimiter(maximum=self.pool_maxsize)
+                self.host_limiters[host] = limiter
+
+        return limiter
+
+    def get_session(self, url: str) -> requests.Session:
+        host = urllib.parse.urlparse(url).netloc
+
+        with self.sessions_lock:
+            session = self.sessions.get(host)
+
+            if not session:
+                session = requests.Session()
+                session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+
+                self.sessions[host] = session
+
+        return session
+
+    def calculate_sapisidhash(self) -> str:
+        timestamp = int(time.time())
+
+        cached_timestamp, cached_hash = self.sapisidhash
+        if cached_timestamp == timestamp:
+            return cached_hash
+
+        hashinput = f"{timestamp} {self.cookies.get('SAPISID','')} {self.origin}"
+
+        sha1 = hashlib.sha1()
+
+        sha1.update(hashinput.encode())
+
+        SAPISIDHASH = f"{timestamp}_{sha1.hexdigest()}"
+
+        self.sapisidhash = (timestamp, SAPISIDHASH)
+
+        return SAPISIDHASH
+
+    def get_api_headers(self) -> dict[str, str]:
+        headers = dict(self.api_headers)
+
+        if self.cookies.get("SAPISID"):
+            headers["Authorization"] = f"SAPISIDHASH {self.calculate_sapisidhash()}"
+
+        return headers
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        api: bool = False,
+        cookies: bool = False,
+        cache: bool = False,
+        **kwargs,
+    ) -> requests.Response:
+        if cache and self.response_cache:
+            return self.cached_request(
+                method=method, url=url, api=api, cookies=cookies, **kwargs
+            )
+
+        if api:
+            kwargs["headers"] = {**self.get_api_headers(), **kwargs.get("headers", {})}
+
+        if api or cookies:
+            kwargs["cookies"] = self.cookies
+
+        kwargs.setdefault("timeout", self.timeout)
+
+        session = self.get_session(url=url)
+        limiter = self.get_host_limiter(url=url)
+        kind = get_request_kind(url=url, origin=self.origin)
+
+        attempt = 0
+        while True:
+            self.count(kind=kind, requests=1)
+
+            response = None
+            error = None
+
+            limiter.acquire()
+            start = time.perf_counter()
+            try:
+                if self.request_limit:
+                    with self.request_limit:
+                        response = session.request(method=method, url=url, **kwargs)
+                else:
+                    response = session.request(method=method, url=url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as request_error:
+                error = request_error
+            finally:
+                limiter.release(
+                    throttled=response is None
+                    or response.status_code in THROTTLE_STATUS_CODES
+                )
+
+            self.trace(
+                method=method,
+                url=url,
+                kind=kind,
+                status=response.status_code if response is not None else None,
+                size=(
+                    self.get_response_size(
+                        response=response, streamed=kwargs.get("stream", False)
+                    )
+                    if response is not None
+                    else 0
+                ),
+                duration=time.perf_counter() - start,
+            )
+
+            retry = error is not None or response.status_code in RETRY_STATUS_CODES
+
+            if error is not None:
+                self.count(kind=kind, errors=1)
+            elif response.status_code in THROTTLE_STATUS_CODES:
+                self.count(kind=kind, throttled=1)
+
+            if not retry or attempt >= self.retry_policy.max_retries:
+                if error is not None:
+                    raise error
+
+                return response
+
+            retry_after = None
+            if response is not None:
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+
+            delay = self.retry_policy.get_delay(
+                attempt=attempt, retry_after=retry_after
+            )
+
+            logger.debug(
+                f"Retrying {method} {url} in {delay:.1f}s - {error if error else response.status_code}"
+            )
+
+            self.count(kind=kind, retries=1)
+            attempt += 1
+            time.sleep(delay)
+
+    def count(self, kind: str, **counters: int) -> None:
+        self.stats.count(**counters)
+
+        for name, value in counters.items():
+            self.metrics.count(name, value, kind=kind)
+
+    def trace(
+        self,
+        method: str,
+        url: str,
+        kind: str,
+        status: int | None,
+        size: int,
+        duration: float,
+    ) -> None:
+        self.metrics.add_time(phase=f"request:{kind}", seconds=duration)
+        self.metrics.count("responses", kind=kind, status=str(status) if status else "error")
+        self.metrics.count("response_bytes", size, kind=kind)
+
+        logger.debug(f"{method} {url} - {status} - {size} bytes - {duration * 1000:.0f}ms")
+
+    def get_response_size(self, response: requests.Response, streamed: bool) -> int:
+        # streamed bodies are only read by the caller, their size is known
+        # from the headers
+        if streamed:
+            return int(response.headers.get("Content-Length", 0))
+
+        return len(response.content)
+
+    def get_cached_response(
+        self, method: str, url: str, data: bytes | str = None
+    ) -> CachedResponse | None:
+        cached = self.response_cache.get(
+            method=method, url=url, data=data, identity=self.cache_identity
+        )
+
+        if cached is not None:
+            self.count(kind=get_request_kind(url=url, origin=self.origin), cached=1)
+        elif self.response_cache.replay:
+            # replays never go to the network, a missing response looks like
+            # an unreachable server to the caller
+            logger.warning(f"{method} {url} is not in the response cache")
+            cached = CachedResponse(status=504, headers={}, content=b"")
+
+        return cached
+
+    def cached_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        data = kwargs.get("data")
+
+        cached = self.get_cached_response(method=method, url=url, data=data)
+
+        if cached is not None:
+            return cached.to_response(url=url)
+
+        response = self.request(method=method, url=url, **kwargs)
+
+        if response.status_code == 200:
+            self.response_cache.put(
+                method=method,
+                url=url,
+                data=data,
+                status=response.status_code,
+                headers=response.headers,
+                content=response.content,
+                identity=self.cache_identity,
+            )
+
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request(method="GET", url=url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request(method="POST", url=url, **kwargs)
+
+    def close(self) -> None:
+        with self.sessions_lock:
+            for session in self.sessions.values():
+                session.close()
+
+            self.sessions.clear()
@@ -0,0 +1,336 @@
+import os
+import time
+import random
+import logging
+from threading import Event, Lock
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel
+
+from src import codec
+from src.batch import BatchChannel
+from src.extractor import PostExtractor
+from src.init_data_cache import InitDataCache, INIT_DATA_FILE, INIT_DATA_TTL
+from src.content_exporter import ContentExporter
+from src.transport import Transport
+from src.metrics import write_atomic
+
+logger = logging.getLogger(name=__name__)
+
+WATCH_INTERVAL = 15 * 60
+WATCH_JITTER = 0.1
+WATCH_PAGES = 2
+
+
+class ChannelStatus(BaseModel):
+    url: str
+    output_path: str
+    interval: float
+    last_poll: float = None
+    last_success: float = None
+    last_new_post: float = None
+    newest_post_id: str = None
+    exported_posts: int = 0
+    polls: int = 0
+    errors: int = 0
+    last_error: str = None
+    # seconds since the channel was last polled successfully
+    lag: float = None
+    next_poll: float = None
+
+
+class ChannelWatcher:
+    # The extractor and exporter of a channel stay open between polls, so the
+    # init data of the channel, the archive and the media validators are only
+    # loaded once.
+    def __init__(
+        self,
+        channel: BatchChannel,
+        transport: Transport,
+        interval: float,
+        init_data_ttl: float = INIT_DATA_TTL,
+        **exporter_options,
+    ) -> None:
+        self.channel = channel
+        self.interval = channel.interval if channel.interval else interval
+
+        self.extractor = PostExtractor(
+            transport=transport,
+            init_data_cache=(
+                InitDataCache(
+                    cache_file=os.path.join(channel.output_path, INIT_DATA_FILE),
+                    ttl=init_data_ttl,
+                )
+                if init_data_ttl
+                else None
+            ),
+        )
+        self.exporter = ContentExporter(
+            output_path=channel.output_path,
+            archive_file=channel.archive_file,
+            transport=transport,
+            **exporter_options,
+        )
+
+        self.status = ChannelStatus(
+            url=channel.url, output_path=channel.output_path, interval=self.interval
+        )
+
+        # monotonic time of the next poll
+        self.next_poll = 0.0
+        self.running = False
+
+    def get_new_posts(self, max_pages: int, stop_after_known: int) -> list[dict]:
+        # Only the first pages of an archived channel are checked, the crawl
+        # goes on while a page holds nothing but new posts. The first poll of
+        # an empty archive crawls the whole channel.
+        known_post_ids = self.exporter.state
+        backfill = len(known_post_ids) == 0
+
+        # post ids are claimed per crawl, the archive tells which ones are new
+        with self.extractor.extracted_posts_lock:
+            self.extractor.extracted_posts.clear()
+
+        posts: list[dict] = list()
+        pages = self.extractor.iter_posts(
+            url=self.channel.url,
+            known_post_ids=known_post_ids,
+            stop_after_known=stop_after_known,
+        )
+
+        try:
+            for page_number, page in enumerate(pages, start=1):
+                posts += page
+
+                if backfill or page_number < max_pages:
+                    continue
+
+                if any(
+                    self.extractor.get_post_id(post=post) in known_post_ids
+                    for post in page
+                ):
+                    break
+        finally:
+            pages.close()
+
+        return [
+            post
+            for post in posts
+            if self.extractor.get_post_id(post=post) not in known_post_ids
+        ]
+
+    def poll(self, max_pages: int, stop_after_known: int) -> int:
+        self.exporter.retry_incomplete_posts()
+
+        posts = self.get_new_posts(max_pages=max_pages, stop_after_known=stop_after_known)
+
+        if not posts:
+            return 0
+
+        # pages are newest first, posts are numbered oldest first
+        posts.reverse()
+
+        exported_posts = self.exporter.exported_posts
+        self.exporter.export_posts(posts=posts)
+        self.exporter.flush()
+
+        self.status.newest_post_id = self.extractor.get_post_id(post=posts[-1])
+
+        return self.exporter.exported_posts - exported_posts
+
+    def close(self) -> None:
+        self.exporter.close()
+
+
+class WatchDaemon:
+    def __init__(
+        self,
+        channels: list[BatchChannel],
+        transport: Transport,
+        status_file: str = None,
+        interval: float = WATCH_INTERVAL,
+        jitter: float = WATCH_JITTER,
+        max_pages: int = WATCH_PAGES,
+        stop_after_known: int = 10,
+        init_data_ttl: float = INIT_DATA_TTL,
+        channel_workers: int = 4,
+        **exporter_options,
+    ) -> None:
+        self.status_file = status_file
+        self.jitter = jitter
+        self.max_pages = max(max_pages, 1)
+        self.stop_after_known = stop_after_known
+        self.channel_workers = channel_workers
+
+        # all channels share the session, its connections stay warm between polls
+        self.transport = transport
+        self.metrics = transport.metrics
+
+        self.watchers: list[ChannelWatcher] = list()
+        # channels that could not be opened, e.g. because of a broken archive,
+        # are reported in the status file while the others are watched
+        self.failed_channels: list[ChannelStatus] = list()
+
+        for channel in channels:
+            try:
+                self.watchers.append(
+                    ChannelWatcher(
+                        channel=channel,
+                        transport=self.transport,
+                        interval=interval,
+                        init_data_ttl=init_data_ttl,
+                        **exporter_options,
+                    )
+                )
+            except Exception as error:
+                logger.error(f"Watching '{channel.url}' failed: {error}")
+                self.failed_channels.append(
+                    ChannelStatus(
+                        url=channel.url,
+                        output_path=channel.output_path,
+                        interval=channel.interval if channel.interval else interval,
+                        errors=1,
+                        last_error=str(error),
+                    )
+                )
+
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.stopping = Event()
+
+    def get_delay(self, interval: float) -> float:
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def stop(self) -> None:
+        # polls in progress are finished, no new ones are started
+        if not self.stopping.is_set():
+            logger.info("Stopping after the running polls")
+
+        self.stopping.set()
+        self.wakeup.set()
+
+    def poll_channel(self, watcher: ChannelWatcher) -> None:
+        status = watcher.status
+        status.last_poll = time.time()
+
+        try:
+            with self.metrics.timer("watch_poll"):
+                new_posts = watcher.poll(
+                    max_pages=self.max_pages, stop_after_known=self.stop_after_known
+                )
+        except Exception as error:
+            logger.error(f"Polling '{watcher.channel.url}' failed: {error}")
+            self.metrics.count("watch_polls", result="failed")
+
+            with self.lock:
+                status.errors += 1
+                status.last_error = str(error)
+        else:
+            self.metrics.count("watch_polls", result="ok")
+
+            if new_posts:
+                logger.info(f"{new_posts} new posts from '{watcher.channel.url}'")
+
+            with self.lock:
+                status.last_success = status.last_poll
+                status.exported_posts += new_posts
+
+                if new_posts:
+                    status.last_new_post = status.last_poll
+        finally:
+            with self.lock:
+                status.polls += 1
+                watcher.next_poll = time.monotonic() + self.get_delay(
+                    interval=watcher.interval
+                )
+                watcher.running = False
+
+            self.write_status()
+            self.wakeup.set()
+
+    def write_status(self) -> None:
+        if not self.status_file:
+            return
+
+        now = time.time()
+        monotonic_now = time.monotonic()
+
+        with self.lock:
+            channels = list()
+
+            for watcher in self.watchers:
+                status = watcher.status
+
+                status.lag = now - status.last_success if status.last_success else None
+                status.next_poll = (
+                    now + max(watcher.next_poll - monotonic_now, 0)
+                    if not self.stopping.is_set()
+                    else None
+                )
+
+                channels.append(status.dict())
+
+            channels += [status.dict() for status in self.failed_channels]
+
+            try:
+                write_atomic(
+                    file=self.status_file,
+                    content=codec.dumps(
+                        {"updated": now, "stopping": self.stopping.is_set(), "channels": channels},
+                        pretty=True,
+                    ),
+                )
+            except Exception as error:
+                logger.error(f"Status file could not be written: '{error}'")
+
+    def run(self) -> None:
+        if not self.watchers:
+            logger.error("None of the channels could be watched")
+            self.close()
+            return
+
+        logger.info(f"Watching {len(self.watchers)} channels")
+
+        # the first polls are spread over a fraction of the interval, so the
+        # channels don't stay in lockstep
+        start = time.monotonic()
+        for watcher in self.watchers:
+            watcher.next_poll = start + random.uniform(0, self.jitter * watcher.interval)
+
+        with ThreadPoolExecutor(max_workers=self.channel_workers) as executor:
+            while not self.stopping.is_set():
+                self.wakeup.clear()
+                now = time.monotonic()
+
+                with self.lock:
+                    due = [
+                        watcher
+                        for watcher in self.watchers
+                        if not watcher.running and watcher.next_poll <= now
+                    ]
+
+                    for watcher in due:
+                        watcher.running = True
+
+                for watcher in due:
+                    executor.submit(self.poll_channel, watcher)
+
+                with self.lock:
+                    next_poll = min(
+                        (w.next_poll for w in self.watchers if not w.running),
+                        default=None,
+                    )
+
+                self.wakeup.wait(
+                    timeout=max(next_poll - now, 0) if next_poll is not None else None
+                )
+
+        self.close()
+
+    def close(self) -> None:
+        for watcher in self.watchers:
+            try:
+                watcher.close()
+            except Exception as error:
+                logger.error(f"Closing '{watcher.channel.url}' failed: {error}")
+
+        self.write_status()